@@ -7,6 +7,8 @@ __license__ = 'MIT - see LICENSE.md'
 # Also, a thankyou to Akash Bora for producing the excellent CTkToolTip and CTkMessagebox widgets.
 
 import argparse
+import json
+import sys
 from view.control_panel import ControlPanel
 from argparse import HelpFormatter
 from operator import attrgetter
@@ -14,6 +16,7 @@ import os
 import re
 from view.ctk_theme_preview import PreviewPanel
 from model.ctk_theme_builder import log_call
+import model.ctk_theme_builder as mod
 
 # import lib.CTkMessagebox.ctkmessagebox
 
@@ -48,6 +51,18 @@ def run_preview_panel(appearance_mode, theme_file):
     preview_panel = PreviewPanel(appearance_mode=appearance_mode, theme_file=theme_file)
 
 
+def run_standby_preview():
+    """Function to run a standby preview panel. By the time we get here, our imports are complete, so we wait for
+    the Control Panel to write an activation message (a JSON line, with the theme file and appearance mode) to our
+    standard input, and then launch the preview panel. If standard input is closed (the Control Panel has exited, or
+    no longer needs us), we simply exit."""
+    activation = sys.stdin.readline()
+    if not activation:
+        exit(0)
+    activation_json = json.loads(activation)
+    run_preview_panel(appearance_mode=activation_json['appearance_mode'], theme_file=activation_json['theme_file'])
+
+
 class SortingHelpFormatter(HelpFormatter):
     def add_arguments(self, actions):
         actions = sorted(actions, key=attrgetter('option_strings'))
@@ -67,13 +82,27 @@ if __name__ == "__main__":
                     help="Set the CustomTkinter theme. Used for colour preview only.",
                     dest='theme_file', default=None)
 
+    ap.add_argument("-s", '--standby', required=False, action="store_true",
+                    help="Start a standby preview panel, which waits to be activated by the Control Panel. "
+                         "For internal use only.",
+                    dest='standby', default=False)
+
+    ap.add_argument("-r", '--record-commands', required=False, action="store",
+                    help="Record the commands sent to the preview panel, to the specified file, for later replay "
+                         "via ctk_theme_builder_replay.",
+                    dest='record_file', default=None)
+
     args_list = vars(ap.parse_args())
     appearance_mode = args_list["appearance_mode"]
     theme_file = args_list["theme_file"]
 
     # If theme is set, we assume we are running in "preview" mode.
-    if theme_file is not None:
+    if args_list["standby"]:
+        run_standby_preview()
+    elif theme_file is not None:
         running_preview = True
         run_preview_panel(appearance_mode=appearance_mode, theme_file=theme_file)
     else:
+        if args_list["record_file"] is not None:
+            mod.start_command_recording(record_file=args_list["record_file"])
         controller = ControlPanel()
@@ -4,21 +4,28 @@ __version__ = "3.1.0"
 __license__ = 'MIT - see LICENSE.md'
 
 import copy
+import contextlib
 import time
 from pathlib import Path
 import json
 import customtkinter as ctk
-import sqlite3
 import os
 from datetime import datetime
 from dataclasses import dataclass
 from typing import Union
+import asyncio
 import socket
+import struct
+import threading
+import tempfile
 import re
 import model.preferences as pref
 import utils.loggerutl as log
 import functools
+import itertools
+import collections
 import platform
+import atexit
 
 application_title = 'CTk Theme Builder'
 # Constants
@@ -42,7 +49,6 @@ DB_FILE_PATH = APP_DATA_DIR / 'ctk_theme_builder.db'
 APP_IMAGES = ASSETS_DIR / 'images'
 QA_STOP_FILE = ETC_DIR / 'qa_application.stop'
 QA_STARTED_FILE = ETC_DIR / 'qa_application.started'
-LISTENER_FILE = ETC_DIR / 'listener.started'
 PALETTES_DIR = ASSETS_DIR / 'palettes'
 PROG_NAME = 'CTk Theme Builder'
 
@@ -52,8 +58,30 @@ log.log_debug(log_text=f'APP_HOME={APP_HOME}',
 SERVER = '127.0.0.1'
 HEADER_SIZE = 64
 ENCODING_FORMAT = 'utf-8'
+# Message framing. The legacy format is a 64 byte, space padded, ASCII length header, followed by the JSON payload,
+# with all parameters quoted as strings. The compact format has a 7 byte binary prefix (magic, format version and
+# a network order, unsigned 32 bit payload length), followed by compact JSON, with parameters serialised as their
+# native types. Receivers accept either, telling them apart by the magic bytes, which can never begin a legacy header.
+LEGACY_WIRE_FORMAT = 'legacy'
+COMPACT_WIRE_FORMAT = 'compact'
+WIRE_FORMAT_MAGIC = b'TB'
+WIRE_FORMAT_VERSION = 1
+WIRE_PREFIX = struct.Struct('!2sBI')
 DISCONNECT_MESSAGE = "!DISCONNECT"
 DISCONNECT_JSON = '{"command_type": "program", "command": "' + DISCONNECT_MESSAGE + '", "parameters": [""]}'
+BATCH_COMMAND_TYPE = 'batch'
+# Sent by the preview panel as the first frame on each accepted connection, so that the control panel knows the
+# listener is up and serving, rather than guessing via a semaphore file and fixed sleeps.
+READY_MESSAGE = "!READY"
+READY_JSON = '{"command_type": "program", "command": "' + READY_MESSAGE + '", "parameters": [""]}'
+# Commands carrying a request_id are acknowledged by the preview panel, once applied, with an ACK message. Its
+# parameters are the request id, the time taken to apply the command (milliseconds) and a status; one of the
+# ACK_STATUS_... values.
+ACK_MESSAGE = "!ACK"
+ACK_STATUS_APPLIED = 'applied'
+ACK_STATUS_COALESCED = 'coalesced'
+# The command raised an exception, when applied; the preview panel logs it, and carries on.
+ACK_STATUS_FAILED = 'failed'
 
 # These aren't true sizes as per WEB design
 HEADING1 = ('Roboto', 26)
@@ -401,27 +429,94 @@ def keys_exist(element, *keys):
     return True
 
 
+class PaletteCache:
+    """The PaletteCache class holds the theme palette slots (colour_palette_entries), and the widget properties each
+    cascades to (colour_cascade_properties), in memory. Both are loaded by a single query, on first use. These tables
+    are maintained only by the setup program (theme_builder_setup.py), via repo_updates.json, so once loaded, we never
+    need to revisit the database; should they be modified by other means, call invalidate_palette_cache."""
+
+    def __init__(self, db_file_path: Path):
+        self.db_file_path = Path(db_file_path)
+        self._palette_entries = None
+        self._cascade_properties = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not db_file_exists(db_file_path=self.db_file_path):
+            print(f'Unable to locate database file located at {self.db_file_path}')
+            raise FileNotFoundError
+
+        palette_entries = {}
+        cascade_properties = {}
+        with pref.db_cursor(db_file_path=self.db_file_path) as cur:
+            cur.execute("select cpe.entry_id, cpe.row, cpe.col, cpe.label, "
+                        "       ccp.widget_type, ccp.widget_property "
+                        "from colour_palette_entries cpe "
+                        "left outer join colour_cascade_properties ccp "
+                        "on ccp.entry_id = cpe.entry_id "
+                        "order by cpe.entry_id, ccp.widget_type, ccp.widget_property;")
+            for entry_id, row, col, label, widget_type, widget_property in cur.fetchall():
+                if entry_id not in palette_entries:
+                    palette_entries[entry_id] = {"entry_id": entry_id, "row": row, "col": col, "label": label}
+                    cascade_properties[entry_id] = []
+                if widget_type is not None:
+                    cascade_properties[entry_id].append((widget_type, widget_property))
+        self._palette_entries = list(palette_entries.values())
+        self._cascade_properties = cascade_properties
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._palette_entries is None:
+                self._load()
+
+    def invalidate(self):
+        """Discard the cached palette; it is reloaded on next use."""
+        with self._lock:
+            self._palette_entries = None
+            self._cascade_properties = None
+
+    def palette_entries(self) -> list:
+        """Return the palette slots, as a list of dictionaries, ordered by entry_id."""
+        self._ensure_loaded()
+        return [dict(palette_entry) for palette_entry in self._palette_entries]
+
+    def cascade_properties(self, palette_id: int) -> list:
+        """Return the (widget_type, widget_property) tuples, which the palette slot cascades to."""
+        self._ensure_loaded()
+        return list(self._cascade_properties.get(palette_id, []))
+
+
+_palette_caches = {}
+_palette_caches_lock = threading.Lock()
+
+
+def palette_cache(db_file_path: Path = DB_FILE_PATH) -> PaletteCache:
+    """Return the process wide palette cache for the database."""
+    cache_key = os.path.realpath(db_file_path)
+    with _palette_caches_lock:
+        cache = _palette_caches.get(cache_key)
+        if cache is None:
+            cache = _palette_caches[cache_key] = PaletteCache(db_file_path=db_file_path)
+        return cache
+
+
+def invalidate_palette_cache(db_file_path: Path = DB_FILE_PATH):
+    """Discard the cached palette slots and cascades; e.g. after modifying the colour_palette_entries or
+    colour_cascade_properties tables."""
+    palette_cache(db_file_path=db_file_path).invalidate()
+
+
 @log_call
 def cascade_dict(palette_id: int) -> list:
-    """The cascade_dict function, extracts all the colour_cascade_properties entries, for a specified palette_id. Each
-    dictionary entry represents a row from the colour_cascade_properties table.
+    """The cascade_dict function, returns all the colour_cascade_properties entries, for a specified palette_id. Each
+    dictionary entry represents a row from the colour_cascade_properties table. These are served from the palette
+    cache.
 
     :param palette_id: Palette# of a displayed colour palette
     :return list: List of cascade_dict dictionaries.
     """
-    if not db_file_exists(db_file_path=DB_FILE_PATH):
-        print(f'Unable to locate database file located at {DB_FILE_PATH}')
-        raise FileNotFoundError
-
-    db_conn = sqlite3.connect(DB_FILE_PATH)
-    db_conn.row_factory = sqlite_dict_factory
-    cur = db_conn.cursor()
-    cur.execute("select widget_type, widget_property "
-                "from colour_cascade_properties "
-                "where entry_id = :entry_id", {"entry_id": palette_id})
-    _cascade_dict = cur.fetchall()
-    db_conn.close()
-    return _cascade_dict
+    return [{"widget_type": widget_type, "widget_property": widget_property}
+            for widget_type, widget_property in palette_cache().cascade_properties(palette_id=palette_id)]
 
 
 @log_call
@@ -433,11 +528,8 @@ def cascade_display_string(palette_id: int) -> str:
     :return list: List of cascade_dict dictionaries.
     """
 
-    _cascade_dict = cascade_dict(palette_id=palette_id)
     _properties_string = ''
-    for record in _cascade_dict:
-        _widget_type = record["widget_type"]
-        _widget_property = record["widget_property"]
+    for _widget_type, _widget_property in palette_cache().cascade_properties(palette_id=palette_id):
         _properties_string = _properties_string + f'\n{_widget_type}: {_widget_property}'
 
     return _properties_string
@@ -451,22 +543,7 @@ def cascade_enabled(palette_id: int) -> bool:
     :param palette_id: Palette# of a displayed colour palette
     :return: Boolean.
     """
-    if not db_file_exists(db_file_path=DB_FILE_PATH):
-        print(f'Unable to locate database file located at {DB_FILE_PATH}')
-        raise FileNotFoundError
-
-    db_conn = sqlite3.connect(DB_FILE_PATH)
-    cur = db_conn.cursor()
-    cur.execute("select count(*) "
-                "from colour_cascade_properties "
-                "where entry_id = :entry_id", {"entry_id": palette_id})
-    _cascade_count_list = cur.fetchall()
-    _cascade_count_list, = _cascade_count_list[0]
-    db_conn.close()
-    if _cascade_count_list:
-        return True
-    else:
-        return False
+    return bool(palette_cache().cascade_properties(palette_id=palette_id))
 
 
 @log_call
@@ -612,6 +689,50 @@ def widget_property_split(widget_property: str) -> tuple:
     return widget_type, _property
 
 
+@log_call
+def theme_delta(applied_theme: dict, theme: dict, appearance_mode: str):
+    """Compare a theme (as JSON data) with the theme last applied to the Preview Panel, for the given appearance mode,
+    and return the differences as a list of [command_type, widget_type, widget_property, value] entries, suitable for
+    the Preview Panel's apply_theme_delta command. Colour properties resolve to the colour for the appearance mode,
+    geometry properties to their integer value.
+
+    None is returned, if any of the differences cannot be applied by reconfiguring the rendered widgets (e.g. fonts,
+    properties which need a forced refresh, or widgets the preview doesn't render); in which case a full refresh is
+    required.
+
+    :param applied_theme: The theme JSON data, as last rendered by the preview.
+    :param theme: The current theme JSON data.
+    :param appearance_mode: The preview's appearance mode, 'Light' or 'Dark'.
+    :return: list of changes, or None"""
+    mode_index = 0 if appearance_mode.lower() == 'light' else 1
+    delta = []
+    for widget_type, properties in theme.items():
+        if widget_type == 'provenance':
+            continue
+        applied_properties = applied_theme.get(widget_type)
+        if applied_properties == properties:
+            continue
+        if not isinstance(properties, dict) or not isinstance(applied_properties, dict) \
+                or widget_type not in RENDERED_PREVIEW_WIDGETS or set(properties) != set(applied_properties):
+            return None
+        for widget_property, value in properties.items():
+            applied_value = applied_properties[widget_property]
+            if isinstance(value, list) and isinstance(applied_value, list):
+                # A colour, held as a [light, dark] pair; only the current mode's colour is rendered.
+                value, applied_value = value[mode_index], applied_value[mode_index]
+            if value == applied_value:
+                continue
+            display_property = PropertyVector.display_property(widget_type=widget_type,
+                                                               widget_property=widget_property)
+            if display_property in FORCE_COLOR_REFRESH_PROPERTIES or display_property in FORCE_GEOM_REFRESH_PROPERTIES:
+                return None
+            if isinstance(value, bool) or not isinstance(value, (int, str)):
+                return None
+            command_type = 'geometry' if isinstance(value, int) else 'colour'
+            delta.append([command_type, widget_type, widget_property, value])
+    return delta
+
+
 @log_call
 def widget_member(widget_entries: dict, filter_list: list):
     """Generator method to run through our widgets, primarily in the render_widget_properties method.
@@ -676,20 +797,257 @@ METHOD_LISTENER_ADDRESS = method_listener_address()
 
 
 @log_call
-def send_command_json(command_type: str, command: str, parameters: list = None):
-    """Format our command into a JSON payload in string format. We have two command type. These are 'control' and
+def wire_format():
+    """The wire_format function returns the message framing format, used for comms between the Control Panel and the
+    Preview Panel. This is the compact format, unless the legacy format has been selected via the wire_format
+    preference. The preference is deliberately left out of the Preferences dialogue: receivers accept either format,
+    so the choice makes no difference to users, and the legacy format is only kept as a fallback, for diagnosing
+    framing problems, or for talking to a listener which pre-dates the compact format."""
+    _wire_format = pref.preference_setting(db_file_path=DB_FILE_PATH, scope='user_preference',
+                                           preference_name='wire_format', default=COMPACT_WIRE_FORMAT)
+    if _wire_format not in (COMPACT_WIRE_FORMAT, LEGACY_WIRE_FORMAT):
+        _wire_format = COMPACT_WIRE_FORMAT
+    return _wire_format
+
+
+WIRE_FORMAT = wire_format()
+
+
+@log_call
+def preview_acks_enabled() -> bool:
+    """Returns True if widget commands, sent to the Preview Panel, are to be acknowledged, so that their latency can
+    be measured. Controlled by the enable_preview_acks preference (on by default)."""
+    return bool(pref.preference_setting(db_file_path=DB_FILE_PATH, scope='user_preference',
+                                        preference_name='enable_preview_acks', default=1))
+
+
+PREVIEW_ACKS = preview_acks_enabled()
+
+
+@log_call
+def standby_preview_enabled() -> bool:
+    """Returns True if a warm standby preview process is to be kept, ready to take over on a preview reload.
+    Controlled by the enable_standby_preview preference (on by default)."""
+    return bool(pref.preference_setting(db_file_path=DB_FILE_PATH, scope='user_preference',
+                                        preference_name='enable_standby_preview', default=1))
+
+
+SUBPROCESS_PREVIEW = 'subprocess'
+IN_PROCESS_PREVIEW = 'in_process'
+
+
+@log_call
+def preview_mode() -> str:
+    """Returns how the Preview Panel is hosted; either in its own process (the default, which isolates the preview's
+    global CustomTkinter state from the Control Panel), or in process, in a CTkToplevel window. Controlled by the
+    preview_mode preference."""
+    _preview_mode = pref.preference_setting(db_file_path=DB_FILE_PATH, scope='user_preference',
+                                            preference_name='preview_mode', default=SUBPROCESS_PREVIEW)
+    if _preview_mode not in (SUBPROCESS_PREVIEW, IN_PROCESS_PREVIEW):
+        _preview_mode = SUBPROCESS_PREVIEW
+    return _preview_mode
+
+
+AUTO_TRANSPORT = 'auto'
+TCP_TRANSPORT = 'tcp'
+UNIX_TRANSPORT = 'unix'
+# The Unix domain socket path is chosen by the Control Panel and inherited by the Preview Panel (and any other child
+# process) via this environment variable.
+LISTENER_SOCKET_ENV = 'CTK_THEME_BUILDER_LISTENER_SOCKET'
+# sun_path is limited to 108 bytes on Linux (104 on macOS); we leave a little headroom.
+MAX_SOCKET_PATH_LENGTH = 100
+
+
+class TcpTransport:
+    """Listener transport, over TCP on the loopback interface, on the listener_port preference."""
+
+    name = TCP_TRANSPORT
+
+    def __init__(self):
+        # Pick up the address here, in case there has been a port change via preferences.
+        self.address = method_listener_address()
+
+    def describe(self) -> str:
+        return f'port {self.address[1]}'
+
+    def client_socket(self) -> socket.socket:
+        return socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    @staticmethod
+    def configure(conn: socket.socket):
+        """Commands are small and latency sensitive, so we disable Nagle's algorithm."""
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def listen(self) -> socket.socket:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if platform.system() != 'Windows':
+            # Allow an immediate rebind, when a relaunched preview panel follows hot on the heels of its predecessor.
+            # Under Windows, SO_REUSEADDR would permit two live listeners on the one port, so we don't go there.
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server.bind(self.address)
+            server.listen()
+        except OSError:
+            server.close()
+            raise
+        return server
+
+    def cleanup(self):
+        pass
+
+
+class UnixTransport:
+    """Listener transport, over a Unix domain socket. This avoids the TCP loopback overhead, and doesn't need a free
+    port."""
+
+    name = UNIX_TRANSPORT
+
+    def __init__(self, path: str):
+        self.address = path
+
+    def describe(self) -> str:
+        return f'socket {self.address}'
+
+    def client_socket(self) -> socket.socket:
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    @staticmethod
+    def configure(conn: socket.socket):
+        pass
+
+    def _in_use(self) -> bool:
+        probe = self.client_socket()
+        try:
+            probe.connect(self.address)
+            return True
+        except OSError:
+            return False
+        finally:
+            probe.close()
+
+    def listen(self) -> socket.socket:
+        if os.path.exists(self.address):
+            if self._in_use():
+                raise OSError(f'Socket {self.address} is in use by another listener.')
+            # Left behind by a preview panel which didn't exit cleanly.
+            os.remove(self.address)
+        server = self.client_socket()
+        try:
+            server.bind(self.address)
+            server.listen()
+        except OSError:
+            server.close()
+            raise
+        return server
+
+    def cleanup(self):
+        try:
+            os.remove(self.address)
+        except OSError:
+            pass
+
+
+@log_call
+def listener_socket_path() -> str:
+    """Return the Unix domain socket path for the method listener. The first process to ask (normally the Control
+    Panel) names the socket after its process id, and publishes it to its children via the environment."""
+    path = os.environ.get(LISTENER_SOCKET_ENV)
+    if path is None:
+        path = str(Path(tempfile.gettempdir()) / f'ctk_theme_builder-{os.getpid()}.sock')
+        os.environ[LISTENER_SOCKET_ENV] = path
+    return path
+
+
+# Publish the socket path now, so that it is inherited by any preview process we spawn.
+listener_socket_path()
+
+
+@log_call
+def listener_transport():
+    """Return the transport used for comms from the Control Panel to the Preview Panel. This is determined by the
+    listener_transport preference; when set to auto (the default), we use a Unix domain socket on Linux, and TCP
+    elsewhere. We also fall back to TCP, if the socket path is too long to bind."""
+    transport = pref.preference_setting(db_file_path=DB_FILE_PATH, scope='user_preference',
+                                        preference_name='listener_transport', default=AUTO_TRANSPORT)
+    if transport == AUTO_TRANSPORT:
+        transport = UNIX_TRANSPORT if platform.system() == 'Linux' else TCP_TRANSPORT
+    if transport == UNIX_TRANSPORT and hasattr(socket, 'AF_UNIX'):
+        path = listener_socket_path()
+        if len(path.encode(ENCODING_FORMAT)) <= MAX_SOCKET_PATH_LENGTH:
+            return UnixTransport(path)
+        log.log_warning(log_text=f'Listener socket path too long ({path}); falling back to TCP',
+                        class_name='ctk_theme_builder.py', method_name='listener_transport')
+    return TcpTransport()
+
+
+# While a command batch is open, send_command_json appends to this list, rather than sending immediately.
+_batched_commands = None
+_batch_depth = 0
+
+
+@contextlib.contextmanager
+def command_batch():
+    """Context manager, which collects all the commands sent via send_command_json, within its scope, and sends them
+    to the Preview Panel as a single, ordered, batch frame on exit. The Preview Panel applies the whole batch in one
+    Tk event. Batches may be nested; only the outermost batch results in a send.
+
+    Usage:
+        with mod.command_batch():
+            for ...:
+                mod.send_command_json(...)
+    """
+    global _batched_commands, _batch_depth
+    if _batch_depth == 0:
+        _batched_commands = []
+    _batch_depth += 1
+    try:
+        yield
+    finally:
+        _batch_depth -= 1
+        if _batch_depth == 0:
+            batched_commands = _batched_commands
+            _batched_commands = None
+            _send_command_batch(batched_commands)
+
+
+def _send_command_batch(batched_commands: list):
+    """Send the commands collected by command_batch. A single command is sent as is, otherwise the commands are
+    wrapped, in order, in a batch frame."""
+    if not batched_commands:
+        return
+    commands = [command_json['command'] for command_json in batched_commands]
+    if len(batched_commands) == 1:
+        message_json = batched_commands[0]
+    else:
+        message_json = {"command_type": BATCH_COMMAND_TYPE, "command": BATCH_COMMAND_TYPE,
+                        "parameters": batched_commands}
+    log.log_debug(log_text=f'Sending batch of {len(batched_commands)} command(s): {commands}',
+                  class_name='ctk_theme_builder.py',
+                  method_name='_send_command_batch')
+    send_message(message=message_json)
+    if 'quit' in commands:
+        preview_session.close()
+
+
+@log_call
+def send_command_json(command_type: str, command: str, parameters: list = None, acknowledge: bool = False):
+    """Format our command into a JSON payload. We have two command type. These are 'control' and
     'filter'. The parameters' parameter, can be used to accept a list to filter against, of a list to be used to pass
-    parameters to a target function/method, in the Preview Panel."""
+    parameters to a target function/method, in the Preview Panel. If a command_batch is open, the command is queued
+    to the batch, rather than sent immediately. The payload is serialised when the message is framed; parameters keep
+    their native types, unless the legacy wire format is in use, in which case scalar parameters are passed as
+    strings; structured parameters (e.g. the changes carried by apply_theme_delta) are passed as they are. If
+    acknowledge is set, the command carries a request id, which the preview panel acknowledges once the command is
+    applied; the request id is returned."""
     if parameters is None:
         parameters = []
 
     log.log_debug(log_text=f'Parameters: command_type={command_type}, command={command}, parameters={parameters}',
                   class_name='ctk_theme_builder.py',
                   method_name='send_command_json')
-    parameters_str = ''
-    for parameter in parameters:
-        parameters_str = parameters_str + '"' + str(parameter) + '", '
-    parameters_str = parameters_str.rstrip(", ")
+    if WIRE_FORMAT == LEGACY_WIRE_FORMAT:
+        parameters = [parameter if isinstance(parameter, (list, dict)) else str(parameter)
+                      for parameter in parameters]
 
     if command == 'update_widget_colour':
         # We need to keep track of dirtied entries
@@ -704,17 +1062,22 @@ def send_command_json(command_type: str, command: str, parameters: list = None):
         # So we update either light_status or
         # dark_status entry in our widgets dict.
 
-    message_json_str = '{ "command_type": "%command_type%",' \
-                       ' "command": "%command%",' \
-                       ' "parameters": [%parameters%] }'
-    message_json_str = message_json_str.replace('%parameters%', parameters_str)
-
-    message_json_str = message_json_str.replace('%command_type%', command_type)
-    message_json_str = message_json_str.replace('%command%', command)
-    log.log_debug(log_text=f'Sending message; message={message_json_str}',
+    message_json = {"command_type": command_type, "command": command, "parameters": list(parameters)}
+    request_id = None
+    if acknowledge:
+        request_id = preview_session.next_request_id()
+        message_json['request_id'] = request_id
+    if _batched_commands is not None:
+        _batched_commands.append(message_json)
+        return request_id
+    log.log_debug(log_text=f'Sending message; message={message_json}',
                   class_name='ctk_theme_builder.py',
                   method_name='send_command_json')
-    send_message(message=message_json_str)
+    send_message(message=message_json)
+    if command == 'quit':
+        # The preview panel is going away, so there is no point in keeping the session open.
+        preview_session.close()
+    return request_id
 
 
 @log_call
@@ -733,88 +1096,485 @@ def sqlite_dict_factory(cursor, row):
 
 @log_call
 def update_preference_value(db_file_path: Path, scope: str, preference_name, preference_value):
-    if not db_file_exists(db_file_path=db_file_path):
-        print(f'Unable to locate database file located at {db_file_path}')
-        raise FileNotFoundError
-
-    db_conn = sqlite3.connect(db_file_path)
-    cur = db_conn.cursor()
+    """Update a preference value, returning the number of rows updated. The update is written through the process
+    wide preferences cache (see model.preferences)."""
+    return pref.update_preference_value(db_file_path=db_file_path, scope=scope, preference_name=preference_name,
+                                        preference_value=preference_value)
 
-    cur.execute("update preferences  "
-                "set preference_value = :preference_value "
-                "where scope = :scope and preference_name = :preference_name;",
-                {"scope": scope, "preference_name": preference_name, "preference_value": preference_value})
-    rowcount = cur.rowcount
 
-    db_conn.commit()
-    db_conn.close()
-    return rowcount
+@log_call
+def update_preference_values(db_file_path: Path, preference_values: dict) -> list:
+    """Update a set of preference values, keyed by (scope, preference_name), in a single transaction. Returns the keys
+    of any preferences not found (see model.preferences)."""
+    return pref.update_preference_values(db_file_path=db_file_path, preference_values=preference_values)
 
 
 @log_call
 def colour_palette_entries(db_file_path: Path):
-    if not db_file_exists(db_file_path=db_file_path):
-        print(f'Unable to locate database file located at {db_file_path}')
-        raise FileNotFoundError
-
-    db_conn = sqlite3.connect(db_file_path)
-    db_conn.row_factory = sqlite_dict_factory
-    cur = db_conn.cursor()
-
-    cur.execute("select entry_id, row, col, label "
-                "from colour_palette_entries "
-                "order by entry_id;")
-    colour_tiles = cur.fetchall()
-    db_conn.close()
-    return colour_tiles
+    """Return the theme palette slots, as a list of dictionaries (entry_id, row, col, label), from the palette
+    cache."""
+    return palette_cache(db_file_path=db_file_path).palette_entries()
 
 
 @log_call
-def prepare_message(message):
+def prepare_message(message, message_format: str = None):
+    """Frame a message for sending to the preview panel, returning the header (or prefix) and the encoded payload.
+    The message may be a JSON string, or a command dictionary, which is serialised here."""
+    if message_format is None:
+        message_format = WIRE_FORMAT
+    if not isinstance(message, str):
+        if message_format == LEGACY_WIRE_FORMAT:
+            message = json.dumps(message)
+        else:
+            message = json.dumps(message, separators=(',', ':'))
     message = message.encode(ENCODING_FORMAT)
     msg_length = len(message)
+    if message_format != LEGACY_WIRE_FORMAT:
+        return WIRE_PREFIX.pack(WIRE_FORMAT_MAGIC, WIRE_FORMAT_VERSION, msg_length), message
     send_length = str(msg_length).encode(ENCODING_FORMAT)
     send_length += b' ' * (HEADER_SIZE - len(send_length))
     return send_length, message
 
 
-@log_call
-def send_message(message):
-    listener_checks = 0
-    listener_started = False
-    while not listener_started:
-        if LISTENER_FILE.exists():
-            listener_started = True
+def receive_exact(conn, length: int) -> bytes:
+    """Read exactly length bytes from the connection. An empty bytes object is returned, if the peer closes the
+    connection before they arrive."""
+    chunks = []
+    while length > 0:
+        chunk = conn.recv(length)
+        if not chunk:
+            return b''
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+
+def receive_message(conn):
+    """Receive a single framed message (as built by prepare_message), returning it as a string, or None if the
+    connection is closed. Both the compact and legacy framing formats are accepted."""
+    magic = receive_exact(conn, len(WIRE_FORMAT_MAGIC))
+    if not magic:
+        return None
+    if magic == WIRE_FORMAT_MAGIC:
+        prefix = receive_exact(conn, WIRE_PREFIX.size - len(magic))
+        if not prefix:
+            return None
+        msg_length = _compact_message_length(magic + prefix)
+    else:
+        header = receive_exact(conn, HEADER_SIZE - len(magic))
+        if not header:
+            return None
+        msg_length = int((magic + header).decode(ENCODING_FORMAT))
+    message = receive_exact(conn, msg_length)
+    if msg_length and not message:
+        return None
+    return message.decode(ENCODING_FORMAT)
+
+
+def _compact_message_length(prefix: bytes) -> int:
+    _, version, msg_length = WIRE_PREFIX.unpack(prefix)
+    if version > WIRE_FORMAT_VERSION:
+        raise ValueError(f'Unsupported wire format version, {version}.')
+    return msg_length
+
+
+async def read_message(reader: asyncio.StreamReader):
+    """The asyncio counterpart of receive_message; read a single framed message from a stream reader, returning it
+    as a string, or None if the connection is closed."""
+    try:
+        magic = await reader.readexactly(len(WIRE_FORMAT_MAGIC))
+        if magic == WIRE_FORMAT_MAGIC:
+            prefix = await reader.readexactly(WIRE_PREFIX.size - len(magic))
+            msg_length = _compact_message_length(magic + prefix)
         else:
-            listener_checks += 1
-        if listener_checks > 50:
-            print('Timeout waiting for preview panel listener!')
-            exit(1)
-        time.sleep(0.1)
+            header = await reader.readexactly(HEADER_SIZE - len(magic))
+            msg_length = int((magic + header).decode(ENCODING_FORMAT))
+        message = await reader.readexactly(msg_length)
+    except asyncio.IncompleteReadError:
+        return None
+    return message.decode(ENCODING_FORMAT)
+
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    """Nearest rank percentile, of an already sorted list."""
+    rank = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class LatencyStats:
+    """The LatencyStats class accumulates round trip times for acknowledged preview panel commands, along with the
+    time the preview panel reports having spent applying each one. Only the most recent samples are retained."""
+
+    MAX_SAMPLES = 10000
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self):
+        self._samples = collections.deque(maxlen=self.MAX_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, label: str, round_trip_ms: float, apply_ms: float, status: str):
+        with self._lock:
+            self._samples.append((label, round_trip_ms, apply_ms, status))
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def summary(self) -> dict:
+        """Return a dictionary, summarising round trip and apply time percentiles (in milliseconds), overall and
+        by command. The slowest command keys, by apply time, are also listed; these point to the widget updates
+        which are expensive to render."""
+        with self._lock:
+            samples = list(self._samples)
+        summary = {"samples": len(samples), "statuses": {}, "round_trip_ms": {}, "apply_ms": {}, "commands": {},
+                   "slowest": []}
+        if not samples:
+            return summary
+        summary["statuses"] = dict(collections.Counter(sample[3] for sample in samples))
+        round_trips = sorted(sample[1] for sample in samples)
+        applied = sorted(sample[2] for sample in samples if sample[3] == ACK_STATUS_APPLIED) or [0.0]
+        for percent in self.PERCENTILES:
+            summary["round_trip_ms"][f'p{percent}'] = round(_percentile(round_trips, percent), 3)
+            summary["apply_ms"][f'p{percent}'] = round(_percentile(applied, percent), 3)
+        summary["round_trip_ms"]["max"] = round(round_trips[-1], 3)
+        summary["apply_ms"]["max"] = round(applied[-1], 3)
+
+        by_command = collections.defaultdict(list)
+        by_label = collections.defaultdict(list)
+        for label, round_trip_ms, apply_ms, status in samples:
+            by_command[label.split(' ')[0]].append(round_trip_ms)
+            if status == ACK_STATUS_APPLIED:
+                by_label[label].append(apply_ms)
+        for command, round_trips in by_command.items():
+            round_trips.sort()
+            summary["commands"][command] = {"count": len(round_trips),
+                                            "round_trip_p50_ms": round(_percentile(round_trips, 50), 3),
+                                            "round_trip_p90_ms": round(_percentile(round_trips, 90), 3)}
+        slowest = sorted(by_label.items(), key=lambda item: max(item[1]), reverse=True)[:10]
+        summary["slowest"] = [{"command": label, "count": len(apply_times),
+                               "apply_max_ms": round(max(apply_times), 3),
+                               "apply_mean_ms": round(sum(apply_times) / len(apply_times), 3)}
+                              for label, apply_times in slowest]
+        return summary
+
+    def export(self, file_path: Path) -> Path:
+        """Export the summary, together with the raw samples, to a JSON file."""
+        with self._lock:
+            samples = [{"command": label, "round_trip_ms": round(round_trip_ms, 3), "apply_ms": round(apply_ms, 3),
+                        "status": status} for label, round_trip_ms, apply_ms, status in self._samples]
+        with open(file_path, 'w') as f:
+            json.dump({"summary": self.summary(), "samples": samples}, f, indent=2)
+        return file_path
+
+
+class PreviewSession:
+    """The PreviewSession class maintains a single, long-lived connection from the Control Panel to the Preview
+    Panel's method listener. The connection is established on the first message sent and is then reused for the
+    lifetime of the preview process. If the preview panel is relaunched (e.g. on a theme reload), the stale
+    connection is detected and a new one is established transparently. Replies from the preview panel
+    (acknowledgements) are read on a background thread, which also tells us when the preview panel has gone away."""
+
+    CONNECT_TIMEOUT = 5
+    RETRY_INTERVAL = 0.02
+    SYNC_TIMEOUT = 5
+
+    def __init__(self):
+        self._client = None
+        self._client_closed = None
+        self._transport = None
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        # Acknowledgements outstanding, keyed on request id: (label, time sent).
+        self._pending = {}
+        self._acknowledged = threading.Condition()
+        self.latency_stats = LatencyStats()
+
+    def _connect(self, timeout: float, process=None) -> bool:
+        """Establish the connection to the preview panel listener, and wait for its ready message. We return as
+        soon as the listener is serving, rather than after a fixed interval. If a process is supplied (i.e. the
+        preview panel we have just launched), we give up early should it terminate."""
+        # Pick up the transport here, in case there has been a change via preferences.
+        self._transport = listener_transport()
+        deadline = time.monotonic() + timeout
+        while True:
+            client = self._transport.client_socket()
+            try:
+                client.settimeout(max(deadline - time.monotonic(), self.RETRY_INTERVAL))
+                client.connect(self._transport.address)
+                ready = receive_message(client)
+                if ready is not None and json.loads(ready)['command'] == READY_MESSAGE:
+                    break
+                client.close()
+            except OSError:
+                # Typically, connection refused (or no socket file); the listener is not yet bound.
+                client.close()
+            if process is not None and process.poll() is not None:
+                log.log_debug(log_text=f'Preview process exited with return code {process.returncode}, '
+                                       f'before its listener was ready',
+                              class_name='PreviewSession', method_name='_connect')
+                return False
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.RETRY_INTERVAL)
+        client.settimeout(None)
+        self._transport.configure(client)
+        self._client = client
+        self._client_closed = threading.Event()
+        reader_thread = threading.Thread(target=self._read_replies, args=(client, self._client_closed), daemon=True)
+        reader_thread.start()
+        log.log_debug(log_text=f'Preview session established via {self._transport.describe()}',
+                      class_name='PreviewSession', method_name='_connect')
+        return True
+
+    def connect(self, timeout: float = CONNECT_TIMEOUT, process=None) -> bool:
+        """Connect to a freshly launched preview panel, returning True once its listener has signalled that it is
+        ready, or False if it fails to do so within the timeout. Any existing (stale) session is dropped."""
+        with self._lock:
+            self._drop()
+            return self._connect(timeout=timeout, process=process)
 
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    connected = False
-    connect_tries = 0
-    while not connected:
+    def _read_replies(self, client: socket.socket, client_closed: threading.Event):
+        """Read replies from the preview panel, until it closes the connection. Acknowledgements are matched to
+        their requests, and the round trip times recorded. A malformed reply is logged and skipped."""
         try:
-            if connect_tries > 10:
-                print(f'Communication error sending message to preview panel, via {METHOD_LISTENER_ADDRESS}!')
-                exit(1)
-            connect_tries += 1
-            client.connect(METHOD_LISTENER_ADDRESS)
-            connected = True
-        except ConnectionRefusedError:
-            time.sleep(0.1)
-
-    send_length, message = prepare_message(message)
-    client.send(send_length)
-    client.send(message)
-    # print(f'Message sent: {message.decode(ENCODING_FORMAT)}')
-    # The disconnect command has to follow the required JSON command format...
-    send_length, message = prepare_message(DISCONNECT_JSON)
-    client.send(send_length)
-    client.send(message)
-    client.close()
+            while True:
+                try:
+                    reply = receive_message(client)
+                except (OSError, ValueError):
+                    reply = None
+                if reply is None:
+                    break
+                try:
+                    reply_json = json.loads(reply)
+                    if reply_json['command'] == ACK_MESSAGE:
+                        self._acknowledge(*reply_json['parameters'])
+                except (json.JSONDecodeError, KeyError, TypeError) as error:
+                    log.log_warning(log_text=f'Skipping malformed reply frame: {type(error).__name__}: {error}',
+                                    class_name='PreviewSession', method_name='_read_replies')
+        finally:
+            client_closed.set()
+
+    def _acknowledge(self, request_id: int, apply_ms: float, status: str):
+        received = time.perf_counter()
+        with self._acknowledged:
+            pending = self._pending.pop(request_id, None)
+            self._acknowledged.notify_all()
+        if pending is None:
+            return
+        label, sent = pending
+        self.latency_stats.record(label=label, round_trip_ms=(received - sent) * 1000, apply_ms=apply_ms,
+                                  status=status)
+
+    def next_request_id(self) -> int:
+        return next(self._request_ids)
+
+    def _register_requests(self, message):
+        """Note the send time of each command in the message (including those in a batch) carrying a request id."""
+        if isinstance(message, str):
+            return
+        commands = message['parameters'] if message['command_type'] == BATCH_COMMAND_TYPE else [message]
+        sent = time.perf_counter()
+        with self._acknowledged:
+            for command_json in commands:
+                request_id = command_json.get('request_id')
+                if request_id is not None:
+                    parameters = command_json['parameters']
+                    label = command_json['command']
+                    if command_json['command_type'] in ('colour', 'geometry') and len(parameters) > 1:
+                        label = f'{label} {parameters[0]}.{parameters[1]}'
+                    self._pending[request_id] = (label, sent)
+
+    def wait_for(self, request_id: int, timeout: float = SYNC_TIMEOUT) -> bool:
+        """Block until the request has been acknowledged (or abandoned), returning False on timeout."""
+        with self._acknowledged:
+            return self._acknowledged.wait_for(lambda: request_id not in self._pending, timeout=timeout)
+
+    def sync(self, timeout: float = SYNC_TIMEOUT) -> bool:
+        """Round trip a ping through the preview panel's command queue. Since commands are applied in order, once
+        this returns True, every command sent before it has been applied."""
+        request_id = self.next_request_id()
+        self.send({"command_type": "program", "command": "ping", "parameters": [], "request_id": request_id})
+        return self.wait_for(request_id, timeout=timeout)
+
+    def _stale(self) -> bool:
+        """The reply reader flags the session as closed, when the preview panel closes the connection (or resets
+        it)."""
+        return self._client_closed is None or self._client_closed.is_set()
+
+    def _drop(self):
+        if self._client is not None:
+            try:
+                self._client.shutdown(socket.SHUT_RDWR)
+                self._client.close()
+            except OSError:
+                pass
+        self._client = None
+        # Any acknowledgements still outstanding, are not coming now.
+        with self._acknowledged:
+            self._pending.clear()
+            self._acknowledged.notify_all()
+
+    def connected(self) -> bool:
+        return self._client is not None
+
+    def describe(self) -> str:
+        """Describe the listener address, for diagnostics."""
+        if self._transport is None:
+            self._transport = listener_transport()
+        return self._transport.describe()
+
+    def send(self, message):
+        """Send a message to the preview panel, connecting or reconnecting the session as required."""
+        send_length, payload = prepare_message(message)
+        with self._lock:
+            if self._client is not None and self._stale():
+                log.log_debug(log_text='Stale preview session detected - reconnecting',
+                              class_name='PreviewSession', method_name='send')
+                self._drop()
+            for attempt in range(2):
+                if self._client is None and not self._connect(timeout=self.CONNECT_TIMEOUT):
+                    break
+                self._register_requests(message)
+                try:
+                    self._client.sendall(send_length + payload)
+                    return
+                except OSError:
+                    # The preview panel has gone away since we last checked; we get one retry on a new connection.
+                    self._drop()
+            print(f'Communication error sending message to preview panel, via {self.describe()}!')
+            exit(1)
+
+    def close(self):
+        """Close the session, politely telling the preview panel listener that we are disconnecting."""
+        with self._lock:
+            if self._client is None:
+                return
+            # The disconnect command has to follow the required JSON command format...
+            send_length, message = prepare_message(DISCONNECT_JSON)
+            try:
+                self._client.sendall(send_length + message)
+            except OSError:
+                pass
+            self._drop()
+
+
+class LocalPreviewSession(PreviewSession):
+    """The LocalPreviewSession class stands in for PreviewSession, when the Preview Panel is hosted in process. Rather
+    than being framed and sent over a socket, commands are handed directly to the preview panel's dispatch_command
+    method, on the calling (Tk) thread. Acknowledgements are delivered in the same way, so latency statistics and
+    sync() behave as for the subprocess preview. Since the preview applies commands when Tk is next idle, and we
+    are on the Tk thread, queued commands are flushed before waiting on an acknowledgement, or closing."""
+
+    def __init__(self, preview_panel):
+        super().__init__()
+        self._preview_panel = preview_panel
+
+    def _reply(self, message_json: dict):
+        if message_json['command'] == ACK_MESSAGE:
+            self._acknowledge(*message_json['parameters'])
+
+    def connect(self, timeout: float = PreviewSession.CONNECT_TIMEOUT, process=None) -> bool:
+        return self._preview_panel is not None
+
+    def connected(self) -> bool:
+        return self._preview_panel is not None
+
+    def describe(self) -> str:
+        return 'in process preview'
+
+    def send(self, message):
+        if self._preview_panel is None:
+            return
+        if isinstance(message, str):
+            message = json.loads(message)
+        self._register_requests(message)
+        self._preview_panel.dispatch_command(message, reply=self._reply)
+
+    def wait_for(self, request_id: int, timeout: float = PreviewSession.SYNC_TIMEOUT) -> bool:
+        if self._preview_panel is not None:
+            self._preview_panel.flush_commands()
+        return super().wait_for(request_id, timeout=timeout)
+
+    def close(self):
+        if self._preview_panel is not None:
+            self._preview_panel.flush_commands()
+        self._preview_panel = None
+
+
+preview_session = PreviewSession()
+
+
+def set_preview_session(session: PreviewSession):
+    """Switch the session used to send commands to the Preview Panel; e.g. to a LocalPreviewSession, for an in
+    process preview. Returns the session replaced."""
+    global preview_session
+    replaced_session, preview_session = preview_session, session
+    return replaced_session
+
+
+class CommandRecorder:
+    """The CommandRecorder class records the command stream sent to the Preview Panel, so that it can be replayed
+    later (see utils/ctk_theme_builder_replay.py). Each framed message (a single command or a batch) is written as a
+    JSON line, with the time elapsed, in seconds, since recording started:
+    {"elapsed": 1.234567, "message": {...}}"""
+
+    def __init__(self, record_file: Path):
+        self.record_file = Path(record_file)
+        self._file = open(self.record_file, 'w', encoding=ENCODING_FORMAT)
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, message):
+        if isinstance(message, str):
+            message = json.loads(message)
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps({"elapsed": round(elapsed, 6), "message": message},
+                                        separators=(',', ':')) + '\n')
+            # Flush each line, so that a recording survives a crash; which is often when we want it most.
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# Set via start_command_recording; when set, every message sent to the Preview Panel is also recorded.
+command_recorder = None
+
+
+@log_call
+def start_command_recording(record_file: Path) -> CommandRecorder:
+    """Start recording the commands sent to the Preview Panel, to the specified file (which is overwritten)."""
+    global command_recorder
+    stop_command_recording()
+    command_recorder = CommandRecorder(record_file=record_file)
+    atexit.register(stop_command_recording)
+    log.log_info(log_text=f'Recording preview commands to {record_file}', class_name='ctk_theme_builder.py',
+                 method_name='start_command_recording')
+    return command_recorder
+
+
+@log_call
+def stop_command_recording():
+    global command_recorder
+    if command_recorder is not None:
+        command_recorder.close()
+        command_recorder = None
+
+
+@log_call
+def send_message(message):
+    if command_recorder is not None:
+        command_recorder.record(message)
+    preview_session.send(message)
 
 
 @dataclass
@@ -842,6 +1602,7 @@ class PropertyVector:
                 'render_preview_enabled',
                 'set_appearance_mode',
                 'refresh',
+                'apply_theme_delta',
                 'set_widget_scaling',
                 'quit',
                 'null',
@@ -1004,7 +1765,8 @@ class CommandStack:
 
         send_command_json(command_type=command_type,
                           command=command,
-                          parameters=parameters)
+                          parameters=parameters,
+                          acknowledge=PREVIEW_ACKS)
 
     @log_call
     def undo_length(self):
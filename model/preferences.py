@@ -5,6 +5,9 @@ __license__ = 'MIT - see LICENSE.md'
 from pathlib import Path
 import customtkinter as ctk
 import sqlite3
+import threading
+import contextlib
+import atexit
 import os
 
 
@@ -25,6 +28,288 @@ LOG_DIR = APP_HOME / 'log'
 
 db_file_found = None
 
+# The columns returned by preference_row and scope_preferences.
+PREFERENCE_ROW_COLUMNS = ('scope', 'preference_name', 'preference_value', 'preference_attr1', 'preference_attr2',
+                          'preference_attr3')
+
+
+# Seconds to hold queued preference writes, before flushing them (see PreferencesCache.queue_values).
+WRITE_BEHIND_DELAY = 2.0
+# How long (in milliseconds) a connection waits on a lock held by another process, before giving up.
+BUSY_TIMEOUT = 5000
+
+
+class DBConnectionManager:
+    """The DBConnectionManager class maintains a single, long-lived connection to a database file, for the lifetime
+    of the process, rather than each query connecting and disconnecting. The database is switched to write ahead
+    logging (WAL), so that readers (e.g. the Preview Panel) don't block on, or block, a writer in another process (e.g.
+    the Control Panel), and a busy timeout is set, so that writers queue for the lock, rather than fail. The
+    connection is shared between threads, and so is serialised by a lock; all access should be via the cursor and
+    transaction context managers."""
+
+    def __init__(self, db_file_path: Path):
+        self.db_file_path = Path(db_file_path)
+        self._connection = None
+        self._lock = threading.RLock()
+        self._transaction_depth = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # With isolation_level=None, the sqlite3 module leaves transaction control to us (see transaction).
+            connection = sqlite3.connect(self.db_file_path, timeout=BUSY_TIMEOUT / 1000, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute(f"pragma busy_timeout = {BUSY_TIMEOUT};")
+            connection.execute("pragma journal_mode = wal;")
+            connection.execute("pragma synchronous = normal;")
+            self._connection = connection
+        return self._connection
+
+    @contextlib.contextmanager
+    def cursor(self, row_factory=None):
+        """Context manager, which provides a cursor on the shared connection, for the duration of the with block.
+        Outside of a transaction, each statement is committed as it executes."""
+        with self._lock:
+            cur = self._connect().cursor()
+            if row_factory is not None:
+                cur.row_factory = row_factory
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    @contextlib.contextmanager
+    def transaction(self, row_factory=None):
+        """Context manager, which provides a cursor within a transaction. The transaction is committed at the end of
+        the with block, or rolled back should it raise an exception. The write lock is taken at the start of the
+        transaction (begin immediate), so that we wait for it up front, rather than fail part way through.
+        Transactions may be nested, in which case only the outermost transaction commits."""
+        with self._lock:
+            connection = self._connect()
+            outermost = self._transaction_depth == 0
+            if outermost:
+                connection.execute("begin immediate;")
+            self._transaction_depth += 1
+            try:
+                with self.cursor(row_factory=row_factory) as cur:
+                    yield cur
+            except BaseException:
+                self._transaction_depth -= 1
+                if outermost:
+                    connection.rollback()
+                raise
+            self._transaction_depth -= 1
+            if outermost:
+                connection.commit()
+
+    def data_version(self) -> int:
+        """Return SQLite's data version, for the shared connection. This changes whenever another connection (i.e.
+        another process) commits a change to the database; but not for our own changes."""
+        with self.cursor() as cur:
+            cur.execute("pragma data_version;")
+            return cur.fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_db_connection_managers = {}
+_db_connection_managers_lock = threading.Lock()
+
+
+def db_connection_manager(db_file_path: Path = DB_FILE_PATH) -> DBConnectionManager:
+    """Return the process wide connection manager for the database."""
+    manager_key = os.path.realpath(db_file_path)
+    with _db_connection_managers_lock:
+        manager = _db_connection_managers.get(manager_key)
+        if manager is None:
+            manager = _db_connection_managers[manager_key] = DBConnectionManager(db_file_path=db_file_path)
+        return manager
+
+
+def db_cursor(db_file_path: Path = DB_FILE_PATH, row_factory=None):
+    """Context manager, providing a cursor on the process wide connection to the database."""
+    return db_connection_manager(db_file_path=db_file_path).cursor(row_factory=row_factory)
+
+
+def db_transaction(db_file_path: Path = DB_FILE_PATH, row_factory=None):
+    """Context manager, providing a cursor within a transaction, on the process wide connection to the database."""
+    return db_connection_manager(db_file_path=db_file_path).transaction(row_factory=row_factory)
+
+
+@atexit.register
+def close_db_connections():
+    with _db_connection_managers_lock:
+        for manager in _db_connection_managers.values():
+            manager.close()
+
+
+class PreferencesCache:
+    """The PreferencesCache class holds the whole preferences table in memory, so that preference lookups don't each
+    need a query. The table is loaded on first use, and reloaded if another process has since committed a change to
+    the database (e.g. another Theme Builder process); we check this via SQLite's data version, which is far cheaper
+    than a query. Writes go through to the database, after which the affected row is re-read, so the cache always
+    reflects what is stored.
+
+    Values which change frequently (e.g. window geometry and the auto_save preferences) may instead be queued, via
+    queue_values. Queued values are reflected by lookups straight away, but are written behind: repeated writes to
+    a preference are coalesced, and the latest values flushed in a single transaction, once WRITE_BEHIND_DELAY has
+    elapsed, or at exit."""
+
+    def __init__(self, db_file_path: Path):
+        self.db_file_path = Path(db_file_path)
+        self._db_connection_manager = db_connection_manager(db_file_path=db_file_path)
+        self._rows = None
+        self._data_version = None
+        self._pending_values = {}
+        self._flush_timer = None
+        self._lock = threading.RLock()
+
+    def _load(self):
+        with self._db_connection_manager.cursor(row_factory=sqlite_dict_factory) as cur:
+            # Take the version first; should the table change while we load, we simply reload next time.
+            self._data_version = self._db_connection_manager.data_version()
+            cur.execute("select * from preferences;")
+            self._rows = {(row['scope'], row['preference_name']): row for row in cur.fetchall()}
+
+    def _current_rows(self) -> dict:
+        if self._rows is None or self._db_connection_manager.data_version() != self._data_version:
+            self._load()
+        return self._rows
+
+    def invalidate(self):
+        """Discard the cached rows; they are reloaded on the next lookup."""
+        with self._lock:
+            self._rows = None
+            self._data_version = None
+
+    def row(self, scope: str, preference_name) -> dict:
+        """Return the cached row, as a dictionary (which must not be modified), or None if there is no such
+        preference."""
+        with self._lock:
+            return self._pending_row(self._current_rows().get((scope, preference_name)))
+
+    def scope_rows(self, scope: str) -> list:
+        with self._lock:
+            return [self._pending_row(row) for (row_scope, _), row in self._current_rows().items()
+                    if row_scope == scope]
+
+    def _pending_row(self, row: dict) -> dict:
+        """Return the row, with any queued preference value applied."""
+        if row is None:
+            return None
+        preference_key = (row['scope'], row['preference_name'])
+        if preference_key not in self._pending_values:
+            return row
+        preference_value = self._pending_values[preference_key]
+        # Mirror the text affinity of the preference_value column.
+        if preference_value is not None and not isinstance(preference_value, str):
+            preference_value = str(preference_value)
+        return dict(row, preference_value=preference_value)
+
+    def queue_values(self, preference_values: dict):
+        """Queue preference value updates, keyed by (scope, preference_name), to be written behind."""
+        with self._lock:
+            self._pending_values.update(preference_values)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(WRITE_BEHIND_DELAY, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self) -> list:
+        """Write any queued preference values, in a single transaction. Returns the (scope, preference_name) keys, for
+        which there was no preference to update."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            pending_values, self._pending_values = self._pending_values, {}
+            if not pending_values:
+                return []
+            statements = [(UPDATE_PREFERENCE_VALUE_SQL,
+                           {"scope": scope, "preference_name": preference_name, "preference_value": preference_value},
+                           scope, preference_name)
+                          for (scope, preference_name), preference_value in pending_values.items()]
+            try:
+                rowcounts = self.write_many(statements)
+            except sqlite3.Error:
+                # Retain the values, for the next flush, unless they have since been superseded.
+                self._pending_values = {**pending_values, **self._pending_values}
+                raise
+        misses = [preference_key for preference_key, rowcount in zip(pending_values, rowcounts) if not rowcount]
+        for scope, preference_name in misses:
+            print(f'Row miss on queued preference update: {scope} > {preference_name}')
+        return misses
+
+    def write(self, sql: str, parameters: dict, scope: str, preference_name) -> int:
+        """Execute a DML statement against the preference identified by scope and preference_name, and write the
+        outcome through to the cache. Returns the number of rows affected."""
+        return self.write_many([(sql, parameters, scope, preference_name)])[0]
+
+    def write_many(self, statements: list) -> list:
+        """Execute a list of DML statements, each a (sql, parameters, scope, preference_name) tuple, in a single
+        transaction, and write the outcome through to the cache. Returns the number of rows affected, by each
+        statement."""
+        with self._lock:
+            rows = self._current_rows()
+            rowcounts = []
+            written_rows = {}
+            with self._db_connection_manager.transaction(row_factory=sqlite_dict_factory) as cur:
+                for sql, parameters, scope, preference_name in statements:
+                    cur.execute(sql, parameters)
+                    rowcounts.append(cur.rowcount)
+                    cur.execute("select * from preferences "
+                                "where scope = :scope "
+                                "and preference_name = :preference_name;",
+                                {"scope": scope, "preference_name": preference_name})
+                    written_rows[(scope, preference_name)] = cur.fetchone()
+            # Only once committed, do we update the cache. Any queued values, for the preferences written, are
+            # superseded.
+            for preference_key, row in written_rows.items():
+                self._pending_values.pop(preference_key, None)
+                if row is None:
+                    rows.pop(preference_key, None)
+                else:
+                    rows[preference_key] = row
+            return rowcounts
+
+
+_preferences_caches = {}
+_preferences_caches_lock = threading.Lock()
+
+
+def preferences_cache(db_file_path: Path = DB_FILE_PATH) -> PreferencesCache:
+    """Return the process wide preferences cache for the database."""
+    cache_key = os.path.realpath(db_file_path)
+    with _preferences_caches_lock:
+        cache = _preferences_caches.get(cache_key)
+        if cache is None:
+            cache = _preferences_caches[cache_key] = PreferencesCache(db_file_path=db_file_path)
+        return cache
+
+
+def invalidate_preferences_cache(db_file_path: Path = DB_FILE_PATH):
+    """Discard the cached preferences; e.g. after the database has been modified other than via this module."""
+    preferences_cache(db_file_path=db_file_path).invalidate()
+
+
+def queue_preference_values(db_file_path: Path, preference_values: dict):
+    """Queue a set of preference value updates, keyed by (scope, preference_name) tuples, to be written behind (see
+    PreferencesCache). Use for values which may change in quick succession, such as window geometry."""
+    preferences_cache(db_file_path=db_file_path).queue_values(preference_values=preference_values)
+
+
+# Registered after close_db_connections, so that (atexit being last in, first out) we flush first.
+@atexit.register
+def flush_preference_writes():
+    """Write any queued preference value updates, for all databases."""
+    with _preferences_caches_lock:
+        caches = list(_preferences_caches.values())
+    for cache in caches:
+        cache.flush()
+
 
 def all_widget_categories(widget_attributes):
     """This function receives a dictionary, based on JSON theme builder view file content,
@@ -58,15 +343,12 @@ def delete_preference(db_file_path: Path, scope: str, preference_name):
     if not db_file_exists(db_file_path=db_file_path):
         print(f'Unable to locate database file located at {db_file_path}')
         raise FileNotFoundError
-    db_conn = sqlite3.connect(db_file_path)
-    cur = db_conn.cursor()
-
-    cur.execute("delete "
-                "from preferences "
-                "where scope = :scope "
-                "and preference_name = :preference_name;", {"scope": scope, "preference_name": preference_name})
-    db_conn.commit()
-    db_conn.close()
+    preferences_cache(db_file_path=db_file_path).write("delete "
+                                                       "from preferences "
+                                                       "where scope = :scope "
+                                                       "and preference_name = :preference_name;",
+                                                       {"scope": scope, "preference_name": preference_name},
+                                                       scope=scope, preference_name=preference_name)
 
 
 def preferences_dict_list(db_file_path: Path):
@@ -80,20 +362,17 @@ def preferences_dict_list(db_file_path: Path):
         print(f'Unable to locate database file located at {db_file_path}')
         raise FileNotFoundError
 
-    db_conn = sqlite3.connect(db_file_path)
-    db_conn.row_factory = sqlite_dict_factory
-    cur = db_conn.cursor()
-    cur.execute("select scope, "
-                "preference_name, "
-                "preference_value, "
-                "preference_label, "
-                "preference_attr1, "
-                "preference_attr2, "
-                "preference_attr3 "
-                "from preferences "
-                "order by scope, preference_name;")
-    preferences = cur.fetchall()
-    db_conn.close()
+    with db_cursor(db_file_path=db_file_path, row_factory=sqlite_dict_factory) as cur:
+        cur.execute("select scope, "
+                    "preference_name, "
+                    "preference_value, "
+                    "preference_label, "
+                    "preference_attr1, "
+                    "preference_attr2, "
+                    "preference_attr3 "
+                    "from preferences "
+                    "order by scope, preference_name;")
+        preferences = cur.fetchall()
     return preferences
 
 
@@ -109,20 +388,18 @@ def preferences_scope_list(db_file_path: Path, scope: str):
         print(f'Unable to locate database file located at {db_file_path}')
         raise FileNotFoundError
 
-    db_conn = sqlite3.connect(db_file_path)
-    cur = db_conn.cursor()
-    cur.execute("select preference_name, "
-                "preference_value, "
-                "preference_attr1, "
-                "preference_attr2, "
-                "preference_attr3, "
-                "preference_attr4, "
-                "preference_attr5 "
-                "from preferences "
-                "where scope = :scope "
-                "order by preference_name;", {"scope": scope})
-    preferences = cur.fetchall()
-    db_conn.close()
+    with db_cursor(db_file_path=db_file_path) as cur:
+        cur.execute("select preference_name, "
+                    "preference_value, "
+                    "preference_attr1, "
+                    "preference_attr2, "
+                    "preference_attr3, "
+                    "preference_attr4, "
+                    "preference_attr5 "
+                    "from preferences "
+                    "where scope = :scope "
+                    "order by preference_name;", {"scope": scope})
+        preferences = cur.fetchall()
     list_of_preferences = []
     # We have a list of tuples; each tuple, representing a row.
     for row in preferences:
@@ -148,21 +425,10 @@ def preference_setting(scope: str, preference_name, db_file_path: Path = DB_FILE
         print(f'Unable to locate database file located at {db_file_path}')
         raise FileNotFoundError
 
-    db_conn = sqlite3.connect(db_file_path)
-    cur = db_conn.cursor()
-
-    cur.execute("select preference_value, data_type "
-                "from preferences "
-                "where scope = :scope "
-                "and preference_name = :preference_name;", {"scope": scope, "preference_name": preference_name})
-    row = cur.fetchone()
-    if row is not None:
-        preference_value, data_type = row
-    else:
-        db_conn.close()
-        preference_value = default
-        return preference_value
-    db_conn.close()
+    row = preferences_cache(db_file_path=db_file_path).row(scope=scope, preference_name=preference_name)
+    if row is None:
+        return default
+    preference_value, data_type = row['preference_value'], row['data_type']
     if data_type == 'str':
         return str(preference_value)
     elif data_type == 'int':
@@ -180,16 +446,8 @@ def scope_preferences(db_file_path: Path, scope: str):
         print(f'Unable to locate database file located at {db_file_path}')
         raise FileNotFoundError
 
-    db_conn = sqlite3.connect(db_file_path)
-    db_conn.row_factory = sqlite_dict_factory
-    cur = db_conn.cursor()
-
-    cur.execute("select scope, preference_name, preference_value, preference_attr1, preference_attr2, preference_attr3 "
-                "from preferences "
-                "where scope = :scope;", {"scope": scope})
-    scope_rows = cur.fetchall()
-    db_conn.close()
-    return scope_rows
+    return [{column: row[column] for column in PREFERENCE_ROW_COLUMNS}
+            for row in preferences_cache(db_file_path=db_file_path).scope_rows(scope=scope)]
 
 
 def preference_row(db_file_path: Path, scope: str, preference_name) -> dict:
@@ -201,17 +459,10 @@ def preference_row(db_file_path: Path, scope: str, preference_name) -> dict:
         print(f'Unable to locate database file located at {db_file_path}')
         raise FileNotFoundError
 
-    db_conn = sqlite3.connect(db_file_path)
-    db_conn.row_factory = sqlite_dict_factory
-    cur = db_conn.cursor()
-
-    cur.execute("select scope, preference_name, preference_value, preference_attr1, preference_attr2, preference_attr3 "
-                "from preferences "
-                "where scope = :scope "
-                "and preference_name = :preference_name;", {"scope": scope, "preference_name": preference_name})
-    preference_row = cur.fetchone()
-    db_conn.close()
-    return preference_row
+    row = preferences_cache(db_file_path=db_file_path).row(scope=scope, preference_name=preference_name)
+    if row is None:
+        return None
+    return {column: row[column] for column in PREFERENCE_ROW_COLUMNS}
 
 
 def user_themes_list():
@@ -243,23 +494,54 @@ def sqlite_dict_factory(cursor, row):
     return d
 
 
+UPDATE_PREFERENCE_VALUE_SQL = ("update preferences  "
+                               "set preference_value = :preference_value "
+                               "where scope = :scope "
+                               "and preference_name = :preference_name;")
+
+
 def update_preference_value(db_file_path: Path, scope: str, preference_name, preference_value):
     if not db_file_exists(db_file_path=db_file_path):
         print(f'Unable to locate database file located at {db_file_path}')
         raise FileNotFoundError
 
-    db_conn = sqlite3.connect(db_file_path)
-    cur = db_conn.cursor()
+    return preferences_cache(db_file_path=db_file_path).write(UPDATE_PREFERENCE_VALUE_SQL,
+                                                              {"scope": scope, "preference_name": preference_name,
+                                                               "preference_value": preference_value},
+                                                              scope=scope, preference_name=preference_name)
 
-    cur.execute("update preferences  "
-                "set preference_value = :preference_value "
-                "where scope = :scope and preference_name = :preference_name;",
-                {"scope": scope, "preference_name": preference_name, "preference_value": preference_value})
-    rowcount = cur.rowcount
 
-    db_conn.commit()
-    db_conn.close()
-    return rowcount
+def update_preference_values(db_file_path: Path, preference_values: dict) -> list:
+    """Update a set of preference values, in a single transaction.
+
+    :param db_file_path: Pathname to the database file.
+    :param preference_values: Dictionary of new preference values, keyed by (scope, preference_name) tuples.
+    :return (list): The (scope, preference_name) keys, for which there was no preference to update."""
+    if not db_file_exists(db_file_path=db_file_path):
+        print(f'Unable to locate database file located at {db_file_path}')
+        raise FileNotFoundError
+
+    statements = [(UPDATE_PREFERENCE_VALUE_SQL,
+                   {"scope": scope, "preference_name": preference_name, "preference_value": preference_value},
+                   scope, preference_name)
+                  for (scope, preference_name), preference_value in preference_values.items()]
+    rowcounts = preferences_cache(db_file_path=db_file_path).write_many(statements)
+    return [preference_key for preference_key, rowcount in zip(preference_values, rowcounts) if not rowcount]
+
+
+# Insert the preference or, where it already exists, update it (this relies on the scope, preference_name unique key).
+UPSERT_PREFERENCE_SQL = ("insert  "
+                         "into preferences (scope, preference_name, data_type, preference_value, "
+                         "preference_attr1, preference_attr2, preference_attr3) "
+                         "values "
+                         "(:scope, :preference_name, :data_type, :preference_value, "
+                         ":preference_attr1, :preference_attr2, :preference_attr3) "
+                         "on conflict (scope, preference_name) do update "
+                         "set "
+                         "    preference_value = excluded.preference_value, "
+                         "    preference_attr1 = excluded.preference_attr1, "
+                         "    preference_attr2 = excluded.preference_attr2, "
+                         "    preference_attr3 = excluded.preference_attr3;")
 
 
 def upsert_preference(db_file_path: Path,
@@ -270,39 +552,26 @@ def upsert_preference(db_file_path: Path,
     :param db_file_path: Pathname to the database file.
     :param preference_row_dict:
     """
+    upsert_preferences(db_file_path=db_file_path, preference_row_dicts=[preference_row_dict])
+
+
+def upsert_preferences(db_file_path: Path, preference_row_dicts: list):
+    """The upsert_preferences function performs an upsert (see upsert_preference) for each of a list of preference
+    row dictionaries, in a single transaction.
+    :param db_file_path: Pathname to the database file.
+    :param preference_row_dicts: List of preference row dictionaries (see new_preference_dict).
+    """
     if not db_file_exists(db_file_path=db_file_path):
         print(f'Unable to locate database file located at {db_file_path}')
         raise FileNotFoundError
 
-    db_conn = sqlite3.connect(db_file_path)
-    cur = db_conn.cursor()
-
-    # Check to see if the preference exists.
-    curr_preference = preference_setting(db_file_path=db_file_path,
-                                         scope=preference_row_dict['scope'],
-                                         preference_name=preference_row_dict['preference_name'])
-
-    if curr_preference == 'NO_DATA_FOUND':
-        # The preference does not exist
-        cur.execute("insert  "
-                    "into preferences (scope, preference_name, data_type, preference_value, "
-                    "preference_attr1, preference_attr2, preference_attr3) "
-                    "values "
-                    "(:scope, :preference_name, :data_type, :preference_value, "
-                    ":preference_attr1, :preference_attr2, :preference_attr3);",
-                    preference_row_dict)
-    else:
-        cur.execute("update preferences  "
-                    "set "
-                    "    preference_value = :preference_value, "
-                    "    preference_attr1 = :preference_attr1, "
-                    "    preference_attr2 = :preference_attr2, "
-                    "    preference_attr3 = :preference_attr3 "
-                    "where scope = :scope and preference_name = :preference_name;",
-                    preference_row_dict)
-
-    db_conn.commit()
-    db_conn.close()
+    statements = []
+    for preference_row_dict in preference_row_dicts:
+        # The data type is only used on insert; rows obtained via preference_row don't include it.
+        parameters = {"data_type": 'str', **preference_row_dict}
+        statements.append((UPSERT_PREFERENCE_SQL, parameters,
+                           preference_row_dict['scope'], preference_row_dict['preference_name']))
+    preferences_cache(db_file_path=db_file_path).write_many(statements)
 
 
 def new_preference_dict(scope: str, preference_name: str, data_type: str, preference_value,
@@ -0,0 +1,35 @@
+"""Fixtures shared by the test modules."""
+import importlib
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+APP_HOME = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    """The theme_builder_setup module, pointed at an empty repository, as created for a greenfield install."""
+    # The setup script parses its command line, on import.
+    monkeypatch.setattr(sys, 'argv', ['theme_builder_setup.py', '-p', str(tmp_path / 'package.zip')])
+    setup = importlib.import_module('theme_builder_setup')
+    monkeypatch.setattr(setup, 'LOG_FILE', io.StringIO(), raising=False)
+    monkeypatch.setattr(setup, 'db_file', tmp_path / 'ctk_theme_builder.db', raising=False)
+    monkeypatch.setattr(setup, 'user_themes_location', tmp_path / 'user_themes', raising=False)
+    monkeypatch.setattr(setup, 'os_user_name', 'tester')
+    setup.initialise_database()
+    yield setup
+    setup.close_db_connections()
+
+
+@pytest.fixture
+def repository(setup) -> Path:
+    """The pathname of a repository, with every repo_updates.json update applied, as for a fresh install."""
+    app_version = setup.app_file_version(APP_HOME / 'model' / 'ctk_theme_builder.py')
+    setup.apply_repo_updates(data_directory=setup.db_file.parent, app_file_version=app_version,
+                             db_file_path=setup.db_file,
+                             updates_dict_list=setup.load_repo_updates(APP_HOME / 'assets' / 'config' /
+                                                                       'repo_updates.json'))
+    return setup.db_file
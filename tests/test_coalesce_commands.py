@@ -0,0 +1,61 @@
+"""Coalescing of the widget updates, received by the Preview Panel within one frame interval."""
+import pytest
+
+pytest.importorskip('customtkinter')
+
+from view.ctk_theme_preview import coalesce_commands
+
+
+def colour(widget_type: str, widget_property: str, colour_code: str) -> dict:
+    return {"command_type": "colour", "command": "update_widget_colour",
+            "parameters": [widget_type, widget_property, colour_code]}
+
+
+def geometry(widget_type: str, widget_property: str, value: int) -> dict:
+    return {"command_type": "geometry", "command": "update_widget_geometry",
+            "parameters": [widget_type, widget_property, value]}
+
+
+def program(command: str, *parameters) -> dict:
+    return {"command_type": "program", "command": command, "parameters": list(parameters)}
+
+
+def test_last_write_wins_at_its_own_position():
+    commands = [colour('CTkButton', 'fg_color', '#111111'),
+                colour('CTkLabel', 'text_color', '#222222'),
+                colour('CTkButton', 'fg_color', '#333333')]
+    assert coalesce_commands(commands) == [commands[1], commands[2]]
+
+
+def test_distinct_keys_keep_their_order():
+    commands = [colour('CTkButton', 'fg_color', '#111111'),
+                colour('CTkButton', 'hover_color', '#222222'),
+                geometry('CTkButton', 'border_width', 2),
+                colour('CTkEntry', 'fg_color', '#333333')]
+    assert coalesce_commands(commands) == commands
+
+
+def test_colour_and_geometry_updates_are_keyed_apart():
+    commands = [colour('CTkButton', 'border_width', '#111111'),
+                geometry('CTkButton', 'border_width', 2)]
+    assert coalesce_commands(commands) == commands
+
+
+def test_program_commands_are_barriers():
+    commands = [colour('CTkButton', 'fg_color', '#111111'),
+                program('set_appearance_mode', 'Light'),
+                colour('CTkButton', 'fg_color', '#333333'),
+                colour('CTkButton', 'fg_color', '#444444')]
+    assert coalesce_commands(commands) == [commands[0], commands[1], commands[3]]
+
+
+def test_malformed_updates_are_kept_as_barriers():
+    # A malformed update is left to fail, and be reported, when applied; nothing is coalesced across it.
+    commands = [colour('CTkButton', 'fg_color', '#111111'),
+                {"command_type": "colour", "command": "update_widget_colour", "parameters": ['CTkButton']},
+                colour('CTkButton', 'fg_color', '#333333')]
+    assert coalesce_commands(commands) == commands
+
+
+def test_empty():
+    assert coalesce_commands([]) == []
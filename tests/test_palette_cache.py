@@ -0,0 +1,54 @@
+"""The palette cache, which serves the theme palette slots and their colour cascades from memory."""
+import sqlite3
+
+import pytest
+
+pytest.importorskip('customtkinter')
+
+import model.ctk_theme_builder as mod
+
+
+@pytest.fixture
+def db_file(repository, monkeypatch):
+    """A freshly installed repository, with its own palette cache, which is discarded afterwards."""
+    monkeypatch.setattr(mod, 'db_file_found', None)
+    yield repository
+    with mod._palette_caches_lock:
+        mod._palette_caches.pop(str(repository.resolve()), None)
+
+
+def test_palette_entries_are_ordered_by_entry_id(db_file):
+    palette_entries = mod.palette_cache(db_file_path=db_file).palette_entries()
+
+    assert [palette_entry['entry_id'] for palette_entry in palette_entries] == list(range(16))
+    assert palette_entries[0] == {"entry_id": 0, "row": 0, "col": 0, "label": 'Scratch 1'}
+
+
+def test_cascade_properties_are_ordered(db_file):
+    assert mod.palette_cache(db_file_path=db_file).cascade_properties(palette_id=12) == \
+           [('CTkProgressBar', 'progress_color'), ('CTkSwitch', 'progress_color')]
+    # The scratch slots have no cascades.
+    assert mod.palette_cache(db_file_path=db_file).cascade_properties(palette_id=0) == []
+    assert mod.palette_cache(db_file_path=db_file).cascade_properties(palette_id=99) == []
+
+
+def test_callers_receive_copies(db_file):
+    palette_cache = mod.palette_cache(db_file_path=db_file)
+    palette_cache.palette_entries()[0]['label'] = 'Changed'
+    palette_cache.cascade_properties(palette_id=12).clear()
+
+    assert palette_cache.palette_entries()[0]['label'] == 'Scratch 1'
+    assert len(palette_cache.cascade_properties(palette_id=12)) == 2
+
+
+def test_changes_are_only_seen_once_invalidated(db_file):
+    palette_cache = mod.palette_cache(db_file_path=db_file)
+    palette_cache.palette_entries()
+    with sqlite3.connect(db_file) as db_conn:
+        db_conn.execute("update colour_palette_entries set label = 'Renamed' where entry_id = 0;")
+        db_conn.execute("delete from colour_cascade_properties where entry_id = 12;")
+    assert palette_cache.palette_entries()[0]['label'] == 'Scratch 1'
+
+    mod.invalidate_palette_cache(db_file_path=db_file)
+    assert palette_cache.palette_entries()[0]['label'] == 'Renamed'
+    assert palette_cache.cascade_properties(palette_id=12) == []
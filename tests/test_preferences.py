@@ -0,0 +1,160 @@
+"""The preferences model: the in-memory preferences cache and its writes."""
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip('customtkinter')
+
+import model.preferences as pref
+
+
+@pytest.fixture
+def db_file(repository, monkeypatch):
+    """A freshly installed repository, with its own preferences cache, which is discarded afterwards."""
+    monkeypatch.setattr(pref, 'db_file_found', None)
+    yield repository
+    with pref._preferences_caches_lock:
+        cache = pref._preferences_caches.pop(str(repository.resolve()), None)
+    if cache is not None:
+        # Cancels any pending write behind.
+        cache.flush()
+    with pref._db_connection_managers_lock:
+        manager = pref._db_connection_managers.pop(str(repository.resolve()), None)
+    if manager is not None:
+        manager.close()
+
+
+def stored_value(db_file, scope: str, preference_name: str):
+    """Return a preference value as stored, via a connection of our own (i.e. as seen by another process)."""
+    with sqlite3.connect(db_file) as db_conn:
+        return db_conn.execute("select preference_value from preferences "
+                               "where scope = ? and preference_name = ?;", (scope, preference_name)).fetchone()[0]
+
+
+def test_cache_is_reloaded_when_another_connection_commits(db_file):
+    assert pref.preference_setting(db_file_path=db_file, scope='user_preference',
+                                   preference_name='control_panel_mode') == 'Light'
+    with sqlite3.connect(db_file) as db_conn:
+        db_conn.execute("update preferences set preference_value = 'Dark' "
+                        "where scope = 'user_preference' and preference_name = 'control_panel_mode';")
+
+    assert pref.preference_setting(db_file_path=db_file, scope='user_preference',
+                                   preference_name='control_panel_mode') == 'Dark'
+
+
+def test_writes_go_through_to_the_cache_and_database(db_file):
+    pref.preference_setting(db_file_path=db_file, scope='user_preference', preference_name='enable_tooltips')
+    pref.update_preference_value(db_file_path=db_file, scope='user_preference', preference_name='enable_tooltips',
+                                 preference_value=0)
+
+    assert pref.preference_setting(db_file_path=db_file, scope='user_preference',
+                                   preference_name='enable_tooltips') == 0
+    assert stored_value(db_file, 'user_preference', 'enable_tooltips') == '0'
+
+
+def test_update_preference_values_reports_misses(db_file):
+    misses = pref.update_preference_values(db_file_path=db_file,
+                                           preference_values={('scaling', 'preview_panel'): '90%',
+                                                              ('scaling', 'no_such_panel'): '90%'})
+    assert misses == [('scaling', 'no_such_panel')]
+    assert pref.preference_setting(db_file_path=db_file, scope='scaling', preference_name='preview_panel') == '90%'
+
+
+def test_missing_preference_returns_the_default(db_file):
+    assert pref.preference_setting(db_file_path=db_file, scope='user_preference', preference_name='no_such',
+                                   default=7) == 7
+
+
+def test_invalidate_discards_unnoticed_changes(db_file):
+    pref.preference_setting(db_file_path=db_file, scope='scaling', preference_name='control_panel')
+    # A change made on the cache's own connection, but not through the cache, doesn't alter the data version.
+    with pref.db_cursor(db_file_path=db_file) as cur:
+        cur.execute("update preferences set preference_value = '110%' "
+                    "where scope = 'scaling' and preference_name = 'control_panel';")
+    assert pref.preference_setting(db_file_path=db_file, scope='scaling', preference_name='control_panel') == '90%'
+
+    pref.invalidate_preferences_cache(db_file_path=db_file)
+    assert pref.preference_setting(db_file_path=db_file, scope='scaling', preference_name='control_panel') == '110%'
+
+
+def test_queued_values_are_read_back_but_written_behind(db_file):
+    for geometry in ('700x500+10+10', '710x510+10+10', '720x520+10+10'):
+        pref.queue_preference_values(db_file_path=db_file,
+                                     preference_values={('window_geometry', 'preview_panel'): geometry})
+
+    assert pref.preference_setting(db_file_path=db_file, scope='window_geometry',
+                                   preference_name='preview_panel') == '720x520+10+10'
+    assert stored_value(db_file, 'window_geometry', 'preview_panel') == '624x510+100+15'
+
+    assert pref.preferences_cache(db_file_path=db_file).flush() == []
+    assert stored_value(db_file, 'window_geometry', 'preview_panel') == '720x520+10+10'
+
+
+def test_queued_values_are_flushed_after_the_delay(db_file, monkeypatch):
+    monkeypatch.setattr(pref, 'WRITE_BEHIND_DELAY', 0.01)
+    pref.queue_preference_values(db_file_path=db_file, preference_values={('auto_save', 'render_disabled'): 1})
+
+    deadline = time.monotonic() + 5
+    while stored_value(db_file, 'auto_save', 'render_disabled') != '1' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stored_value(db_file, 'auto_save', 'render_disabled') == '1'
+
+
+def test_flush_preference_writes_flushes_every_cache(db_file):
+    # flush_preference_writes is registered to run at exit.
+    pref.queue_preference_values(db_file_path=db_file,
+                                 preference_values={('auto_save', 'properties_view'): 'Advanced'})
+    pref.flush_preference_writes()
+    assert stored_value(db_file, 'auto_save', 'properties_view') == 'Advanced'
+
+
+def test_flush_reports_misses(db_file):
+    pref.queue_preference_values(db_file_path=db_file, preference_values={('auto_save', 'no_such'): 'x'})
+    assert pref.preferences_cache(db_file_path=db_file).flush() == [('auto_save', 'no_such')]
+
+
+def test_written_values_supersede_queued_values(db_file):
+    pref.queue_preference_values(db_file_path=db_file, preference_values={('scaling', 'preview_panel'): '70%'})
+    pref.update_preference_value(db_file_path=db_file, scope='scaling', preference_name='preview_panel',
+                                 preference_value='100%')
+    pref.preferences_cache(db_file_path=db_file).flush()
+
+    assert pref.preference_setting(db_file_path=db_file, scope='scaling', preference_name='preview_panel') == '100%'
+    assert stored_value(db_file, 'scaling', 'preview_panel') == '100%'
+
+
+def test_upsert_inserts_new_preferences(db_file):
+    pref.upsert_preference(db_file_path=db_file,
+                           preference_row_dict=pref.new_preference_dict(scope='user_preference',
+                                                                        preference_name='new_setting',
+                                                                        data_type='int', preference_value=3,
+                                                                        preference_attr1='attr'))
+
+    assert pref.preference_setting(db_file_path=db_file, scope='user_preference', preference_name='new_setting') == 3
+    assert pref.preference_row(db_file_path=db_file, scope='user_preference',
+                               preference_name='new_setting')['preference_attr1'] == 'attr'
+
+
+def test_upsert_updates_existing_preferences_in_place(db_file):
+    pref.upsert_preferences(db_file_path=db_file, preference_row_dicts=[
+        pref.new_preference_dict(scope='user_preference', preference_name='listener_port', data_type='str',
+                                 preference_value=6061),
+        pref.new_preference_dict(scope='user_preference', preference_name='preview_mode', data_type='str',
+                                 preference_value='in_process')])
+
+    with sqlite3.connect(db_file) as db_conn:
+        rows = db_conn.execute("select preference_name, data_type, preference_value from preferences "
+                               "where preference_name in ('listener_port', 'preview_mode') "
+                               "order by 1;").fetchall()
+    # The data type is only set on insert.
+    assert rows == [('listener_port', 'int', '6061'), ('preview_mode', 'str', 'in_process')]
+    assert pref.preference_setting(db_file_path=db_file, scope='user_preference',
+                                   preference_name='listener_port') == 6061
+
+
+def test_upsert_defaults_the_data_type(db_file):
+    # Rows obtained via preference_row carry no data type.
+    row = pref.preference_row(db_file_path=db_file, scope='scaling', preference_name='qa_application')
+    pref.upsert_preference(db_file_path=db_file, preference_row_dict=dict(row, preference_name='new_panel'))
+    assert pref.preference_setting(db_file_path=db_file, scope='scaling', preference_name='new_panel') == '80%'
@@ -0,0 +1,73 @@
+"""Preview Panel command queue handling."""
+import asyncio
+
+import pytest
+
+pytest.importorskip('customtkinter')
+
+import model.ctk_theme_builder as mod
+from utils.fake_widgets import ConfigureLog
+from utils.headless_preview import headless_preview_panel
+
+
+class FakeStreamWriter:
+    """Accepts the calls _handle_client makes on its stream writer."""
+
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return ('127.0.0.1', 0)
+
+    def write(self, frame: bytes):
+        self.frames.append(frame)
+
+    async def drain(self):
+        pass
+
+    def is_closing(self) -> bool:
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+def test_failed_command_is_acknowledged_and_the_pass_continues(repository):
+    preview_panel = headless_preview_panel(configure_log=ConfigureLog(), db_file_path=repository)
+    replies = []
+    commands = [{"command_type": "colour", "command": "update_widget_colour",
+                 "parameters": ['CTkButton', 'fg_color', '#111111'], "request_id": 1},
+                # Too few parameters, so applying it raises.
+                {"command_type": "geometry", "command": "update_widget_geometry",
+                 "parameters": ['CTkButton'], "request_id": 2},
+                {"command_type": "colour", "command": "update_widget_colour",
+                 "parameters": ['CTkLabel', 'text_color', '#222222'], "request_id": 3}]
+    for command_json in commands:
+        preview_panel._command_queue.put((command_json, replies.append))
+    preview_panel._apply_queued_commands()
+
+    statuses = {reply['parameters'][0]: reply['parameters'][2] for reply in replies}
+    assert statuses == {1: mod.ACK_STATUS_APPLIED, 2: mod.ACK_STATUS_FAILED, 3: mod.ACK_STATUS_APPLIED}
+    assert preview_panel._rendered_widgets['CTkLabel'][0].cget('text_color') == '#222222'
+
+
+def test_malformed_frame_is_skipped_and_writer_released(repository):
+    preview_panel = headless_preview_panel(configure_log=ConfigureLog(), db_file_path=repository)
+    preview_panel._client_writers = set()
+    writer = FakeStreamWriter()
+    command_json = {"command_type": "colour", "command": "update_widget_colour",
+                    "parameters": ['CTkButton', 'fg_color', '#111111']}
+
+    async def handle_client():
+        preview_panel._listener_loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        for message in ('{"command_type": "colour", "comm', command_json):
+            reader.feed_data(b''.join(mod.prepare_message(message)))
+        reader.feed_eof()
+        await preview_panel._handle_client(reader, writer)
+
+    asyncio.run(handle_client())
+    assert preview_panel._command_queue.get_nowait()[0] == command_json
+    assert preview_panel._command_queue.empty()
+    assert writer.closed and not preview_panel._client_writers
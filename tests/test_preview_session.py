@@ -0,0 +1,34 @@
+"""Control Panel side of the preview session."""
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('customtkinter')
+
+import model.ctk_theme_builder as mod
+
+
+def ack(request_id: int) -> dict:
+    return {"command_type": "program", "command": mod.ACK_MESSAGE,
+            "parameters": [request_id, 0.5, mod.ACK_STATUS_APPLIED]}
+
+
+def test_malformed_replies_are_skipped():
+    session = mod.PreviewSession()
+    session._pending[1] = ('update_widget_colour', time.perf_counter())
+    client_closed = threading.Event()
+    sender, receiver = socket.socketpair()
+    try:
+        for reply in ('{"command_type": "program", "comm', {"command_type": "program"},
+                      {"command_type": "program", "command": mod.ACK_MESSAGE, "parameters": [2]}, ack(request_id=1)):
+            sender.sendall(b''.join(mod.prepare_message(reply)))
+        sender.close()
+        session._read_replies(receiver, client_closed)
+    finally:
+        receiver.close()
+
+    assert client_closed.is_set()
+    assert not session._pending
+    assert len(session.latency_stats) == 1
@@ -0,0 +1,50 @@
+"""Control Panel refreshes of the preview, by theme delta or in full."""
+import copy
+import types
+
+import pytest
+
+pytest.importorskip('customtkinter')
+
+import model.ctk_theme_builder as mod
+from view.control_panel import ControlPanel
+
+THEME = {'CTkButton': {'fg_color': ['#111111', '#222222'], 'border_width': 2}}
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    monkeypatch.setattr(mod, 'WIRE_FORMAT', mod.COMPACT_WIRE_FORMAT)
+    monkeypatch.setattr(mod, 'send_message', lambda message: sent.append(message))
+    return sent
+
+
+@pytest.fixture
+def control_panel():
+    """Just enough of a Control Panel, for refresh_preview, with the preview up to date with THEME."""
+    control_panel = types.SimpleNamespace(appearance_mode='Light', theme_json_data=copy.deepcopy(THEME),
+                                          preview_panel_scaling_pct='80%', update_wip_file=lambda: None)
+    control_panel.snapshot_preview_theme = lambda: ControlPanel.snapshot_preview_theme(control_panel)
+    control_panel.snapshot_preview_theme()
+    return control_panel
+
+
+def test_unchanged_theme_sends_nothing(sent, control_panel):
+    ControlPanel.refresh_preview(control_panel, set_scaling=False)
+    assert sent == []
+
+
+def test_changed_theme_sends_delta(sent, control_panel):
+    control_panel.theme_json_data['CTkButton']['fg_color'][0] = '#333333'
+    ControlPanel.refresh_preview(control_panel, set_scaling=False)
+    assert sent == [{"command_type": "program", "command": "apply_theme_delta",
+                     "parameters": [['colour', 'CTkButton', 'fg_color', '#333333']]}]
+    # The snapshot is brought up to date, so the change isn't sent again.
+    ControlPanel.refresh_preview(control_panel, set_scaling=False)
+    assert len(sent) == 1
+
+
+def test_forced_refresh_rebuilds(sent, control_panel):
+    ControlPanel.refresh_preview(control_panel, set_scaling=False, force=True)
+    assert sent == [{"command_type": "program", "command": "refresh", "parameters": ['Light']}]
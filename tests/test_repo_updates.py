@@ -0,0 +1,84 @@
+"""Repository updates, applied by theme_builder_setup, and recorded in the migration ledger."""
+import sqlite3
+
+import pytest
+
+UPDATES = {"001": {"sql_apply_version": "2.0.0",
+                   "description": "Theme author",
+                   "sql_statement": "insert into preferences (scope, preference_name, data_type, preference_value) "
+                                    "values ('user_preference', 'theme_author', 'str', '%os_user_name%');"},
+           "002": {"sql_apply_version": "2.3.0",
+                   "description": "Confirm cascade",
+                   "sql_statement": "insert into preferences (scope, preference_name, data_type, preference_value) "
+                                    "values ('user_preference', 'confirm_cascade', 'int', '1');"},
+           "003": {"sql_apply_version": "3.1.0",
+                   "description": "Preview mode",
+                   "sql_statement": "insert into preferences (scope, preference_name, data_type, preference_value) "
+                                    "values ('user_preference', 'preview_mode', 'str', 'subprocess');"}}
+
+BROKEN_UPDATE = {"004": {"sql_apply_version": "3.1.0",
+                         "description": "Broken",
+                         "sql_statement": "insert into no_such_table (a) values (1);"}}
+
+
+def apply_updates(setup, updates_dict_list: dict, dry_run: bool = False):
+    setup.apply_repo_updates(data_directory=setup.db_file.parent, app_file_version='3.1.0',
+                             db_file_path=setup.db_file, updates_dict_list=updates_dict_list, dry_run=dry_run)
+
+
+def query(setup, sql: str) -> list:
+    return setup.db_connection(setup.db_file).execute(sql).fetchall()
+
+
+def test_updates_are_applied_once(setup):
+    apply_updates(setup, UPDATES)
+    apply_updates(setup, UPDATES)
+
+    assert query(setup, "select preference_name, preference_value from preferences order by 1;") == \
+           [('confirm_cascade', '1'), ('preview_mode', 'subprocess'), ('theme_author', 'tester')]
+    assert query(setup, "select sql_id from repo_updates_applied order by 1;") == [('001',), ('002',), ('003',)]
+    assert setup.app_versions() == ('3.1.0', '1.9.9')
+
+
+def test_new_updates_are_applied_on_upgrade(setup):
+    apply_updates(setup, {sql_id: UPDATES[sql_id] for sql_id in ('001', '002')})
+    apply_updates(setup, UPDATES)
+
+    assert query(setup, "select sql_id, applied_version from repo_updates_applied order by 1;") == \
+           [('001', '3.1.0'), ('002', '3.1.0'), ('003', '3.1.0')]
+    assert ('preview_mode',) in query(setup, "select preference_name from preferences;")
+
+
+def test_dry_run_rolls_back(setup):
+    apply_updates(setup, UPDATES, dry_run=True)
+
+    assert query(setup, "select count(*) from preferences;") == [(0,)]
+    assert query(setup, "select count(*) from repo_updates_applied;") == [(0,)]
+    assert setup.app_versions() == ('1.9.9', '1.9.9')
+
+
+def test_failed_update_rolls_back_all(setup):
+    with pytest.raises(sqlite3.OperationalError):
+        apply_updates(setup, {**UPDATES, **BROKEN_UPDATE})
+
+    assert query(setup, "select count(*) from preferences;") == [(0,)]
+    assert query(setup, "select count(*) from repo_updates_applied;") == [(0,)]
+
+
+def test_ledger_bootstrap_assumes_failed_updates_were_applied(setup):
+    # A repository which pre-dates the ledger, and has no version recorded; so it is taken to be 2.0.0, although the
+    # 2.3.0 update has in fact been applied.
+    db_conn = setup.db_connection(setup.db_file)
+    db_conn.execute("drop table repo_updates_applied;")
+    db_conn.execute("delete from application_control;")
+    db_conn.execute("insert into preferences (scope, preference_name, data_type, preference_value) "
+                    "values ('user_preference', 'theme_author', 'str', 'author'), "
+                    "('user_preference', 'confirm_cascade', 'int', '0');")
+    db_conn.commit()
+
+    apply_updates(setup, UPDATES)
+
+    assert query(setup, "select preference_name, preference_value from preferences order by 1;") == \
+           [('confirm_cascade', '0'), ('preview_mode', 'subprocess'), ('theme_author', 'author')]
+    assert query(setup, "select sql_id, applied_version from repo_updates_applied order by 1;") == \
+           [('001', '2.0.0'), ('002', '3.1.0'), ('003', '3.1.0')]
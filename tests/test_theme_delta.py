@@ -0,0 +1,53 @@
+"""Theme deltas, sent to the Preview Panel in place of a full refresh."""
+import copy
+
+import pytest
+
+pytest.importorskip('customtkinter')
+
+import model.ctk_theme_builder as mod
+
+THEME = {'provenance': {'theme name': 'Test'},
+         'CTkButton': {'fg_color': ['#111111', '#222222'], 'border_width': 2, 'corner_radius': 6},
+         'CTkLabel': {'text_color': ['#333333', '#444444']},
+         'CTkFont': {'family': 'Roboto', 'size': 13},
+         'CTkDropdownMenu': {'fg_color': ['#555555', '#666666']}}
+
+
+@pytest.fixture
+def theme() -> dict:
+    return copy.deepcopy(THEME)
+
+
+def test_unchanged_theme_has_an_empty_delta(theme):
+    assert mod.theme_delta(applied_theme=THEME, theme=theme, appearance_mode='Light') == []
+
+
+def test_changes_resolve_to_the_appearance_mode(theme):
+    theme['CTkButton']['fg_color'] = ['#AAAAAA', '#BBBBBB']
+    theme['CTkButton']['border_width'] = 3
+    theme['CTkLabel']['text_color'][0] = '#CCCCCC'
+
+    assert mod.theme_delta(applied_theme=THEME, theme=theme, appearance_mode='Dark') == \
+           [['colour', 'CTkButton', 'fg_color', '#BBBBBB'], ['geometry', 'CTkButton', 'border_width', 3]]
+    assert mod.theme_delta(applied_theme=THEME, theme=theme, appearance_mode='Light') == \
+           [['colour', 'CTkButton', 'fg_color', '#AAAAAA'], ['geometry', 'CTkButton', 'border_width', 3],
+            ['colour', 'CTkLabel', 'text_color', '#CCCCCC']]
+
+
+def test_provenance_changes_are_ignored(theme):
+    theme['provenance']['theme name'] = 'Renamed'
+    assert mod.theme_delta(applied_theme=THEME, theme=theme, appearance_mode='Light') == []
+
+
+@pytest.mark.parametrize('change', [
+    # Fonts aren't rendered by reconfiguring widgets.
+    lambda theme: theme['CTkFont'].update(size=14),
+    # A property which needs a forced refresh.
+    lambda theme: theme['CTkDropdownMenu']['fg_color'].__setitem__(0, '#777777'),
+    # Structural changes.
+    lambda theme: theme['CTkButton'].pop('corner_radius'),
+    lambda theme: theme.update(CTkSwitch={'fg_color': ['#888888', '#999999']})])
+def test_unappliable_changes_need_a_full_refresh(theme, change):
+    change(theme)
+    assert mod.theme_delta(applied_theme=THEME, theme=theme, appearance_mode='Light') is None
@@ -0,0 +1,50 @@
+"""Round trip preview panel commands through the message framing."""
+import json
+import socket
+
+import pytest
+
+pytest.importorskip('customtkinter')
+
+import model.ctk_theme_builder as mod
+from utils.fake_widgets import ConfigureLog
+from utils.headless_preview import headless_preview_panel
+
+THEME_DELTA = [['colour', 'CTkButton', 'fg_color', '#333333'],
+               ['geometry', 'CTkButton', 'border_width', 3]]
+
+
+def sent_message(monkeypatch, wire_format: str, **command) -> dict:
+    """Send a command, via send_command_json, in the given wire format, and return the message as the preview panel
+    receives it."""
+    sent = []
+    monkeypatch.setattr(mod, 'WIRE_FORMAT', wire_format)
+    monkeypatch.setattr(mod, 'send_message', lambda message: sent.append(message))
+    mod.send_command_json(**command)
+    header, payload = mod.prepare_message(sent[0], message_format=wire_format)
+    sender, receiver = socket.socketpair()
+    try:
+        sender.sendall(header + payload)
+        return json.loads(mod.receive_message(receiver))
+    finally:
+        sender.close()
+        receiver.close()
+
+
+@pytest.mark.parametrize('wire_format', [mod.LEGACY_WIRE_FORMAT, mod.COMPACT_WIRE_FORMAT])
+def test_apply_theme_delta_round_trip(monkeypatch, repository, wire_format):
+    message = sent_message(monkeypatch, wire_format, command_type='program', command='apply_theme_delta',
+                           parameters=THEME_DELTA)
+    assert message['parameters'] == THEME_DELTA
+
+    configure_log = ConfigureLog(record_calls=True)
+    preview_panel = headless_preview_panel(configure_log=configure_log, db_file_path=repository)
+    preview_panel._apply_theme_delta(message['parameters'])
+    assert all(widget.cget('fg_color') == '#333333' for widget in preview_panel._rendered_widgets['CTkButton'])
+    assert preview_panel.button_1.cget('border_width') == 3
+
+
+def test_legacy_scalar_parameters_are_strings(monkeypatch):
+    message = sent_message(monkeypatch, mod.LEGACY_WIRE_FORMAT, command_type='geometry',
+                           command='update_widget_geometry', parameters=['CTkButton', 'border_width', 3])
+    assert message['parameters'] == ['CTkButton', 'border_width', '3']
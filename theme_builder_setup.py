@@ -97,6 +97,11 @@ ap.add_argument("-p", "--package", required=True, action="store",
                 help=f"""Used for {PRODUCT_NAME} deployments & upgrades. Use -a along with the pathname to the 
                       {PRODUCT_NAME}  package ZIP file.""", dest='package', default=None)
 
+ap.add_argument("-d", "--dry-run", required=False, action="store_true",
+                help=f"""Report the repository updates, which the package would apply to the existing 
+                {PRODUCT_NAME} installation, and check that they apply cleanly, without changing anything.""",
+                dest='dry_run', default=False)
+
 operating_system = platform.system()
 home_directory = expanduser("~")
 
@@ -114,11 +119,16 @@ def app_file_version(python_file: Path):
     with open(python_file, 'r') as fp:
         # read all lines in a list
         lines = fp.readlines()
-        for line in lines:
-            # check if string present on a current line
-            if '__version__' in line:
-                version_line = line
-                break
+    return source_version(lines)
+
+
+def source_version(lines: list):
+    """Given the lines of a Python program, find the version, as defined by __version__."""
+    for line in lines:
+        # check if string present on a current line
+        if '__version__' in line:
+            version_line = line
+            break
     version_list = version_line.split()
     if len(version_list) == 3:
         version = version_list[2]
@@ -127,23 +137,41 @@ def app_file_version(python_file: Path):
     return version.replace('"', '')
 
 
-def apply_repo_updates(data_directory: Path, app_file_version: str, db_file_path: Path):
-    """Perform any system related data related migration steps required. This avoids the necessity of performing a
-    complicated migration, where data structures require change."""
+# The setup functions share a single connection, per database file, rather than each opening and closing its own.
+# The busy timeout (in seconds) allows for a Theme Builder process, still holding a lock on the database.
+DB_BUSY_TIMEOUT = 5.0
+_db_connections = {}
 
-    registered_app_version, _ = app_versions()
-    if registered_app_version is None:
-        lprint('No record of current repo version, assuming 2.0.0')
-        registered_app_version = '2.0.0'
-    lprint(f'Updating the {PRODUCT_NAME} repository:-')
-    lprint(f'Existing repository appears to be version {registered_app_version}...')
 
-    db_conn = sqlite3.connect(db_file_path)
-    cur = db_conn.cursor()
+def db_connection(db_file_path: Path) -> sqlite3.Connection:
+    """Return the shared connection to the database file, opening it on first use."""
+    db_file_path = Path(db_file_path)
+    if db_file_path not in _db_connections:
+        _db_connections[db_file_path] = sqlite3.connect(db_file_path, timeout=DB_BUSY_TIMEOUT)
+    return _db_connections[db_file_path]
+
+
+def close_db_connections():
+    """Close the shared database connections, committing any outstanding changes."""
+    for db_conn in _db_connections.values():
+        db_conn.commit()
+        db_conn.close()
+    _db_connections.clear()
 
-    updates_json_file = config_location / 'repo_updates.json'
-    updates_json_file = updates_json_file
 
+# The repository migration ledger. Records each repo_updates.json entry (keyed by its SQL Id) once applied, so that
+# each is only ever applied once.
+REPO_UPDATES_LEDGER_DDL = """create table if not exists
+     repo_updates_applied (
+       sql_id               text primary key,
+       sql_apply_version    text not null,
+       description          text,
+       applied_version      text not null,
+       applied_on           text not null);"""
+
+
+def load_repo_updates(updates_json_file: Path):
+    """Load the repository updates (repo_updates.json), as a dictionary keyed by SQL Id."""
     with open(updates_json_file) as json_file:
         try:
             updates_dict_list = json.load(json_file)
@@ -151,55 +179,180 @@ def apply_repo_updates(data_directory: Path, app_file_version: str, db_file_path
             lprint(f'ERROR: The file, "{updates_json_file}", does not appear to be a valid JSON file.')
             lprint('Bailing out!')
             raise
-        except IOError:
-            feedback = f'Failed to read file {updates_json_file} - possible permissions issue.'
+    return updates_dict_list
+
+
+def package_repo_updates(zip_pathname: Path):
+    """Return the repository updates, and the application version, shipped in a deployment package, without
+    unpacking it."""
+    if not zipfile.is_zipfile(zip_pathname):
+        lprint(f'ERROR: The package, {zip_pathname}, appears to be an invalid ZIP file.')
+        exit(1)
+    with ZipFile(zip_pathname, 'r') as archive:
+        member_names = archive.namelist()
+        updates_member = [name for name in member_names if name.endswith('assets/config/repo_updates.json')]
+        version_member = [name for name in member_names if name.endswith(f'model/{PRODUCT.lower()}.py')]
+        if not updates_member or not version_member:
+            lprint(f'ERROR: The package, {zip_pathname}, does not appear to be a {PRODUCT_NAME} package.')
+            exit(1)
+        updates_dict_list = json.loads(archive.read(updates_member[0]))
+        version_lines = archive.read(version_member[0]).decode().splitlines()
+    return updates_dict_list, source_version(version_lines)
+
+
+def applied_repo_updates(db_file_path: Path, updates_dict_list: dict, registered_app_version: str):
+    """Return the set of SQL Ids, already applied to the repository, according to the migration ledger. Where the
+    repository pre-dates the ledger, we infer them from the registered application version, as this is how the
+    updates used to be selected: those up to, and including, the registered version are taken as applied. The
+    returned flag indicates that the ledger needs to be created (and populated with the inferred SQL Ids)."""
+    db_conn = db_connection(db_file_path)
+    cur = db_conn.cursor()
+    cur.execute("select count(*) "
+                "from sqlite_master "
+                "where type = 'table' and name = 'repo_updates_applied';")
+    ledger_exists, = cur.fetchone()
+    if ledger_exists:
+        cur.execute("select sql_id from repo_updates_applied;")
+        return {sql_id for sql_id, in cur.fetchall()}, False
+
+    if registered_app_version == '1.9.9':
+        # Greenfield deployment.
+        return set(), True
+    return {sql_id for sql_id in updates_dict_list
+            if version_scalar(updates_dict_list[sql_id]["sql_apply_version"]) <= version_scalar(
+                registered_app_version)}, True
+
+
+def apply_repo_updates(data_directory: Path, app_file_version: str, db_file_path: Path, updates_dict_list: dict,
+                       dry_run: bool = False):
+    """Perform any system related data related migration steps required. This avoids the necessity of performing a
+    complicated migration, where data structures require change. The updates not yet recorded in the migration
+    ledger (repo_updates_applied), up to the application version being deployed, are applied and recorded in a
+    single transaction; so either all are applied, or none are. With dry_run set, the updates are applied and then
+    rolled back, to check that they apply cleanly. Where the ledger is yet to be created, an update which fails is
+    assumed to have been applied previously (see applied_repo_updates), rather than failing the upgrade."""
 
-    sql_to_apply = 0
-    for sql_id in updates_dict_list:
-        sql_apply_version = updates_dict_list[sql_id]["sql_apply_version"]
-        if version_scalar(registered_app_version) < version_scalar(sql_apply_version) <= version_scalar(
-                app_file_version):
-            sql_to_apply += 1
+    registered_app_version, _ = app_versions()
+    if registered_app_version is None:
+        lprint('No record of current repo version, assuming 2.0.0')
+        registered_app_version = '2.0.0'
+    lprint(f'Updating the {PRODUCT_NAME} repository:-')
+    lprint(f'Existing repository appears to be version {registered_app_version}...')
+
+    db_conn = db_connection(db_file_path)
+    cur = db_conn.cursor()
+
+    applied_sql_ids, create_ledger = applied_repo_updates(db_file_path=db_file_path,
+                                                          updates_dict_list=updates_dict_list,
+                                                          registered_app_version=registered_app_version)
+    pending_sql_ids = [sql_id for sql_id in updates_dict_list
+                       if sql_id not in applied_sql_ids
+                       and version_scalar(updates_dict_list[sql_id]["sql_apply_version"]) <= version_scalar(
+                           app_file_version)]
 
     backup_repo = (f'{PRODUCT.lower()}-{registered_app_version}.db')
     # If changes are to be made to the repo, and this is not a greenfield
     # deployment, then take a backup of the repo, as a safety measure.
-    if sql_to_apply > 0 and registered_app_version != '1.9.9':
-        lprint(f'There are {sql_to_apply} potential upgrade actions pending...')
+    if pending_sql_ids and registered_app_version != '1.9.9' and not dry_run:
+        lprint(f'There are {len(pending_sql_ids)} upgrade actions pending...')
         lprint(f'Backing up ${PRODUCT} repo to: {data_directory}/{backup_repo}')
+        # The application runs the database in WAL mode; fold any outstanding WAL content into the database file, so
+        # that the copy is complete.
+        cur.execute('pragma wal_checkpoint(truncate);')
         shutil.copy(db_file_path, Path(f'{data_directory}/{backup_repo}'))
+    elif pending_sql_ids:
+        lprint(f'There are {len(pending_sql_ids)} upgrade actions pending...')
     else:
         lprint(f'No upgrade actions pending.')
 
-    sql_count = 0
-    for sql_id in updates_dict_list:
-        description = updates_dict_list[sql_id]["description"]
-        sql_statement = updates_dict_list[sql_id]["sql_statement"]
-        sql_statement = sql_statement.replace('%os_user_name%', os_user_name)
-        sql_statement = sql_statement.replace('%user_themes_location%', str(user_themes_location))
-        sql_apply_version = updates_dict_list[sql_id]["sql_apply_version"]
-        if version_scalar(registered_app_version) < version_scalar(sql_apply_version) <= version_scalar(
-                app_file_version):
+    applied_on = datetime.now().isoformat(timespec='seconds')
+    # We manage the transaction explicitly, so that any DDL is included in it.
+    db_conn.commit()
+    db_conn.isolation_level = None
+    try:
+        cur.execute('begin immediate;')
+        if create_ledger:
+            cur.execute(REPO_UPDATES_LEDGER_DDL)
+            for sql_id in applied_sql_ids:
+                cur.execute("insert into repo_updates_applied "
+                            "(sql_id, sql_apply_version, description, applied_version, applied_on) "
+                            "values (:sql_id, :sql_apply_version, :description, :applied_version, :applied_on);",
+                            {"sql_id": sql_id,
+                             "sql_apply_version": updates_dict_list[sql_id]["sql_apply_version"],
+                             "description": updates_dict_list[sql_id]["description"],
+                             "applied_version": registered_app_version,
+                             "applied_on": applied_on})
+
+        for sql_id in pending_sql_ids:
+            description = updates_dict_list[sql_id]["description"]
+            sql_statement = updates_dict_list[sql_id]["sql_statement"]
+            sql_statement = sql_statement.replace('%os_user_name%', os_user_name)
+            sql_statement = sql_statement.replace('%user_themes_location%', str(user_themes_location))
+            cur.execute('savepoint repo_update;')
             try:
                 cur.execute(sql_statement)
-                lprint(f'Applying SQL Id: {sql_id}  :- {description} (Succeeded)')
-            except sqlite3.OperationalError:
-                if version_scalar(sql_apply_version) == version_scalar(app_file_version):
-                    # If it fails and the versions are the same, we assume that it's because a DDL
-                    # script has been previously run.
-                    lprint(f'Apply SQL Id: {sql_id}  :- {description} (FAILED - OperationalError)')
+            except sqlite3.Error as error:
+                cur.execute('rollback to repo_update;')
+                if not create_ledger:
+                    lprint(f'Apply SQL Id: {sql_id}  :- {description} (FAILED - {type(error).__name__}: {error})')
+                    lprint(f'Error processing SQL (Id = {sql_id}): {sql_statement}')
                     raise
-            except sqlite3.IntegrityError:
-                lprint(f'Error processing SQL (Id = {sql_id}): {sql_statement}')
-                raise
-            sql_count += 1
-    print(f'Repo updates applied: {sql_count}')
-    # Upsert preference opens the database, so ensure we close it here, to avoid a lock error,
-    db_conn.commit()
-    db_conn.close()
+                # Without a ledger, the applied updates are only inferred from the registered version, which may be
+                # missing or stale. So, as before the ledger, we take a failure to mean that the update has already
+                # been applied, and record it as such.
+                lprint(f'Apply SQL Id: {sql_id}  :- {description} (FAILED - {type(error).__name__}: {error}; '
+                       f'assumed previously applied)')
+                cur.execute('release repo_update;')
+            else:
+                cur.execute('release repo_update;')
+                lprint(f'Applying SQL Id: {sql_id}  :- {description} (Succeeded)')
+            cur.execute("insert into repo_updates_applied "
+                        "(sql_id, sql_apply_version, description, applied_version, applied_on) "
+                        "values (:sql_id, :sql_apply_version, :description, :applied_version, :applied_on);",
+                        {"sql_id": sql_id,
+                         "sql_apply_version": updates_dict_list[sql_id]["sql_apply_version"],
+                         "description": description,
+                         "applied_version": app_file_version,
+                         "applied_on": applied_on})
+    except BaseException:
+        cur.execute('rollback;')
+        lprint('Repository updates rolled back; no changes have been made.')
+        raise
+    else:
+        cur.execute('rollback;' if dry_run else 'commit;')
+    finally:
+        db_conn.isolation_level = ''
+
+    if dry_run:
+        print(f'Repo updates checked (dry run, rolled back): {len(pending_sql_ids)}')
+        return
+    print(f'Repo updates applied: {len(pending_sql_ids)}')
+    ensure_preferences_key(db_file_path=db_file_path)
     update_app_version(new_app_version=app_file_version)
 
 
+def ensure_preferences_key(db_file_path: Path):
+    """Ensure that the preferences table has a unique key on (scope, preference_name). Repositories created by this
+    script have one, by way of the primary key, but we can't take that for granted of older repositories. The key is
+    required by the preferences upserts (insert ... on conflict), and serves the preference lookups."""
+    db_conn = db_connection(db_file_path)
+    cur = db_conn.cursor()
+    cur.execute("pragma index_list(preferences);")
+    for _, index_name, unique, *_ in cur.fetchall():
+        if not unique:
+            continue
+        cur.execute(f"pragma index_info('{index_name}');")
+        if {column_name for _, _, column_name in cur.fetchall()} == {'scope', 'preference_name'}:
+            return
+    lprint('Adding the preferences unique key...')
+    # Remove any duplicate preferences, retaining the most recently added.
+    cur.execute("delete from preferences "
+                "where rowid not in (select max(rowid) from preferences group by scope, preference_name);")
+    cur.execute("create unique index if not exists preferences_uk "
+                "on preferences (scope, preference_name);")
+    db_conn.commit()
+
+
 def version_scalar(version: str):
     """Version scalar, takes a version number (with dot notation) and converts it to a scalar. The number of components
     within the version, is by default assumed to be 3. If you specifiy a shorter version format (e.g. 3.1), then it will
@@ -241,7 +394,7 @@ def initialise_database():
 
     :param db_file_path: Pathname of the sqllite3 database, to be created."""
     # print(f'DEBUG: DB File: {db_file}')
-    db_conn = sqlite3.connect(db_file)
+    db_conn = db_connection(db_file)
     cur = db_conn.cursor()
 
     cur.execute("""create table if not exists 
@@ -283,6 +436,8 @@ def initialise_database():
                         widget_property        text,
                         primary key (entry_id, widget_type, widget_property));""")
 
+    cur.execute(REPO_UPDATES_LEDGER_DDL)
+
     db_conn.commit()
 
 
@@ -294,7 +449,7 @@ def preference(db_file_path: Path, scope: str, preference_name):
     :param preference_name: (str) Preference name.
     :return: (str) The preference value
     """
-    db_conn = sqlite3.connect(db_file_path)
+    db_conn = db_connection(db_file_path)
     cur = db_conn.cursor()
 
     cur.execute("select preference_value "
@@ -304,7 +459,6 @@ def preference(db_file_path: Path, scope: str, preference_name):
     preference_value = cur.fetchone()
     if preference_value is not None:
         preference_value, = preference_value
-    db_conn.close()
     return preference_value
 
 
@@ -313,7 +467,7 @@ def app_versions():
     value.
     :return: (tuple) The app_version, previous_app_version
     """
-    db_conn = sqlite3.connect(db_file)
+    db_conn = db_connection(db_file)
     cur = db_conn.cursor()
 
     cur.execute("select app_version, previous_app_version "
@@ -325,12 +479,11 @@ def app_versions():
     else:
         previous_app_version, application_version = '0.0.0', '2.0.0'
 
-    db_conn.close()
     return application_version, previous_app_version
 
 
 def update_app_version(new_app_version: str):
-    db_conn = sqlite3.connect(db_file)
+    db_conn = db_connection(db_file)
     cur = db_conn.cursor()
     application_version, previous_app_version = app_versions()
     if new_app_version == application_version:
@@ -343,7 +496,6 @@ def update_app_version(new_app_version: str):
                 "set  app_version = :app_version "
                 "where record_number = 1;", {"app_version": new_app_version})
     db_conn.commit()
-    db_conn.close()
 
 
 def upsert_preference(db_file_path: Path,
@@ -359,32 +511,20 @@ def upsert_preference(db_file_path: Path,
     :param scope: A string, defining the preference scope/domain.
     :param preference_name: The preference withing the specified scope, to be inserted/updated.
     :param preference_value: The new value to set."""
-    db_conn = sqlite3.connect(db_file_path)
+    db_conn = db_connection(db_file_path)
     cur = db_conn.cursor()
 
-    # Check to see if the preference exists.
-    pref_exists = preference(db_file_path=db_file_path, scope=scope, preference_name=preference_name)
-
-    if pref_exists is None:
-        # The preference does not exist
-        cur.execute("insert  "
-                    "into preferences (scope, preference_name, data_type, preference_value) "
-                    "values "
-                    "(:scope, :preference_name, :preference_value, :data_type);",
-                    {"scope": scope, "preference_name": preference_name,
-                     "data_type": data_type, "preference_value": preference_value})
-    else:
-        cur.execute("update preferences  "
-                    "set preference_value = :preference_value, "
-                    "    data_type = :data_type "
-                    "where scope = :scope and preference_name = :preference_name;",
-                    {"scope": scope,
-                     "preference_name": preference_name,
-                     "preference_value": preference_value,
-                     "data_type": data_type})
+    cur.execute("insert  "
+                "into preferences (scope, preference_name, data_type, preference_value) "
+                "values "
+                "(:scope, :preference_name, :data_type, :preference_value) "
+                "on conflict (scope, preference_name) do update "
+                "set preference_value = excluded.preference_value, "
+                "    data_type = excluded.data_type;",
+                {"scope": scope, "preference_name": preference_name,
+                 "data_type": data_type, "preference_value": preference_value})
 
     db_conn.commit()
-    db_conn.close()
 
 
 def app_home_contents_ok():
@@ -531,6 +671,20 @@ if __name__ == "__main__":
         lprint(f'ERROR: Cannot locate the specified package ZIP file: {package_path}')
         exit(1)
 
+    if args_list["dry_run"]:
+        if not exists(db_file):
+            lprint(f'ERROR: There is no {PRODUCT_NAME} repository to check, at: {db_file}')
+            exit(1)
+        lprint(f'Dry run: checking the repository updates in package {package}, against: {db_file}')
+        package_updates_dict_list, package_app_version = package_repo_updates(zip_pathname=package_path)
+        lprint(f'Package version: {package_app_version}')
+        apply_repo_updates(data_directory=data_location, app_file_version=package_app_version, db_file_path=db_file,
+                           updates_dict_list=package_updates_dict_list, dry_run=True)
+        close_db_connections()
+        LOG_FILE.close()
+        print(f'Dry run log can be found at: {Path(stage_dir) / LOGFILE_NAME}')
+        exit(0)
+
     greenfield = False
     if app_home.exists():
         action = f'Updating existing application at: {app_home}'
@@ -649,7 +803,9 @@ if __name__ == "__main__":
 
     app_version = app_file_version(app_home / 'model' / f'{version_script}')
 
-    apply_repo_updates(data_directory=data_location, app_file_version=app_version, db_file_path=db_file)
+    apply_repo_updates(data_directory=data_location, app_file_version=app_version, db_file_path=db_file,
+                       updates_dict_list=load_repo_updates(config_location / 'repo_updates.json'))
+    close_db_connections()
     lprint(f'App Home for {PRODUCT_NAME}: ' + str(os.path.abspath(app_home)))
 
     lprint(f'\nTo launch the application run the ctk_theme_builder command script, located at:')
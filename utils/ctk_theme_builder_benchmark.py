@@ -0,0 +1,217 @@
+"""CTk Theme Builder, edit to preview latency benchmark."""
+__title__ = 'CTk Theme Builder Benchmark'
+__author__ = 'Clive Bostock'
+__version__ = "1.0.0"
+__license__ = 'MIT - see LICENSE.md'
+
+# The benchmark starts the Control Panel (and hence the Preview Panel) for real, and so requires a display. On a
+# headless Linux box, run it via ctk_theme_builder_benchmark.sh, which starts it under Xvfb.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from argparse import HelpFormatter
+from datetime import datetime
+from operator import attrgetter
+from pathlib import Path
+import model.ctk_theme_builder as mod
+import model.preferences as pref
+from view.control_panel import ControlPanel
+from view.geometry_dialog import GeometryDialog
+
+PROG = os.path.basename(__file__)
+
+ASSETS_DIR = mod.ASSETS_DIR
+DB_FILE_PATH = mod.DB_FILE_PATH
+LOG_DIR = mod.LOG_DIR
+BENCHMARK_THEMES_DIR = ASSETS_DIR / 'themes'
+
+DEFAULT_THEMES = ('Anthracite', 'Greengage', 'MoonlitSky')
+DEFAULT_ITERATIONS = 5
+# The widget property, and alternate colours, used for the paste colour operation.
+PASTE_PROPERTY = 'Button: fg_color'
+PASTE_COLOURS = ('#2A6EA6', '#4A8ED0')
+GEOMETRY_WIDGET_TYPE = 'CTkButton'
+GEOMETRY_PROPERTY = 'border_width'
+# Milliseconds to allow, from the Control Panel main loop starting, before we start.
+BENCHMARK_START_DELAY = 500
+# The auto save preferences, updated by the operations we perform, and restored once we are done.
+AUTO_SAVE_PREFERENCES = ('selected_theme', 'appearance_mode')
+
+
+class SortingHelpFormatter(HelpFormatter):
+    def add_arguments(self, actions):
+        actions = sorted(actions, key=attrgetter('option_strings'))
+        super(SortingHelpFormatter, self).add_arguments(actions)
+
+
+def timing_summary(timings: list) -> dict:
+    """Summarise a list of timings (in milliseconds)."""
+    if not timings:
+        return {"count": 0}
+    ordered = sorted(timings)
+    p90_index = min(len(ordered) - 1, round(0.9 * (len(ordered) - 1)))
+    return {"count": len(ordered),
+            "min_ms": round(ordered[0], 3),
+            "p50_ms": round(statistics.median(ordered), 3),
+            "p90_ms": round(ordered[p90_index], 3),
+            "max_ms": round(ordered[-1], 3),
+            "mean_ms": round(statistics.mean(ordered), 3)}
+
+
+class BenchmarkControlPanel(ControlPanel):
+    """A Control Panel, which runs a fixed script of operations, once its main loop has started, and then exits.
+    Each operation is timed from its invocation, until the Preview Panel acknowledges that it has applied every
+    command sent as a result (see PreviewSession.sync); the operations are driven through the same methods as the
+    corresponding Control Panel widgets."""
+
+    def __init__(self, themes: list, iterations: int, output_file: Path, *args, **kwargs):
+        self.benchmark_themes = themes
+        self.benchmark_iterations = iterations
+        self.benchmark_output_file = output_file
+        self.benchmark_timings = {}
+        self.benchmark_failures = []
+        self.saved_auto_save = {preference_name: pref.preference_setting(db_file_path=DB_FILE_PATH,
+                                                                         scope='auto_save',
+                                                                         preference_name=preference_name)
+                                for preference_name in AUTO_SAVE_PREFERENCES}
+        self.exit_status = 1
+        # The ControlPanel constructor finishes, by entering our main loop.
+        super().__init__(*args, **kwargs)
+
+    def mainloop(self, n=0):
+        self.after(BENCHMARK_START_DELAY, self.run_benchmark)
+        super().mainloop(n)
+
+    def time_operation(self, operation: str, action):
+        """Perform the action, and record the time taken for the preview panel to apply its effects."""
+        started = time.perf_counter()
+        action()
+        synced = mod.preview_session.sync()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not synced:
+            self.benchmark_failures.append(operation)
+            return
+        self.benchmark_timings.setdefault(operation, []).append(elapsed_ms)
+
+    def bench_load_theme(self, theme_name: str):
+        self.json_state = 'clean'
+        self.opm_theme.set(theme_name)
+        self.load_theme()
+
+    def bench_paste_colour(self):
+        widget_property = PASTE_PROPERTY if PASTE_PROPERTY in self.widgets else sorted(self.widgets)[0]
+        current_colour = self.widgets[widget_property]['colour']
+        new_colour = PASTE_COLOURS[0] if current_colour != PASTE_COLOURS[0] else PASTE_COLOURS[1]
+        self.paste_colour(event=None, widget_property=widget_property, property_colour=new_colour)
+
+    def bench_cascade(self):
+        for palette_id in range(len(self.palette_button_list)):
+            if self.cascade_enabled(palette_id=palette_id):
+                self.cascade_colour(palette_id=palette_id)
+                return
+
+    def bench_switch_appearance_mode(self):
+        self.tk_seg_mode.set('Light Mode' if self.appearance_mode == 'Dark' else 'Dark Mode')
+        self.switch_preview_appearance_mode()
+
+    def bench_geometry_save(self):
+        """Open the widget geometry dialogue, adjust a property, and save; the dialogue is modal, so we drive it
+        from the Tk event loop, once it is open."""
+        def save_geometry():
+            for child in self.winfo_children():
+                if isinstance(child, GeometryDialog):
+                    current_value = int(self.theme_json_data[GEOMETRY_WIDGET_TYPE][GEOMETRY_PROPERTY])
+                    child.geometry_edit_values[GEOMETRY_PROPERTY] = 1 if current_value == 0 else current_value - 1
+                    child.save_geometry_edits(widget_type=GEOMETRY_WIDGET_TYPE)
+                    return
+            self.after(10, save_geometry)
+
+        self.after(10, save_geometry)
+        self.launch_widget_geometry(widget_type=GEOMETRY_WIDGET_TYPE)
+
+    def run_benchmark(self):
+        try:
+            # Suppress the confirmation dialogues, and work from the themes shipped with the application.
+            self.confirm_cascade = 0
+            self.theme_json_dir = BENCHMARK_THEMES_DIR
+            self.json_files = [theme_name for theme_name in self.benchmark_themes]
+            for theme_name in self.benchmark_themes:
+                self.time_operation('load_theme', lambda: self.bench_load_theme(theme_name))
+                for _ in range(self.benchmark_iterations):
+                    self.time_operation('paste_colour', self.bench_paste_colour)
+                    self.time_operation('cascade', self.bench_cascade)
+                    self.time_operation('undo', self.undo_change)
+                    self.time_operation('redo', self.redo_change)
+                    self.time_operation('switch_appearance_mode', self.bench_switch_appearance_mode)
+                    self.time_operation('geometry_save', self.bench_geometry_save)
+                    self.time_operation('refresh_preview', self.refresh_preview)
+                    self.time_operation('reload_preview', self.reload_preview)
+            self.write_results()
+            self.exit_status = 0 if not self.benchmark_failures else 1
+        finally:
+            mod.update_preference_values(db_file_path=DB_FILE_PATH,
+                                         preference_values={('auto_save', preference_name): preference_value
+                                                            for preference_name, preference_value
+                                                            in self.saved_auto_save.items()
+                                                            if preference_value != 'NO_DATA_FOUND'})
+            # We never save the theme edits made.
+            self.json_state = 'clean'
+            self.close_panels()
+
+    def write_results(self):
+        results = {"timestamp": datetime.now().isoformat(timespec='seconds'),
+                   "platform": platform.platform(),
+                   "python_version": platform.python_version(),
+                   "customtkinter_version": mod.CTK_VERSION,
+                   "preview_mode": mod.preview_mode(),
+                   "listener": mod.preview_session.describe(),
+                   "wire_format": mod.WIRE_FORMAT,
+                   "themes": list(self.benchmark_themes),
+                   "iterations": self.benchmark_iterations,
+                   "failures": self.benchmark_failures,
+                   "operations": {operation: timing_summary(timings)
+                                  for operation, timings in self.benchmark_timings.items()},
+                   "preview_latency": mod.preview_session.latency_stats.summary()}
+        with open(self.benchmark_output_file, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(json.dumps(results["operations"], indent=2))
+        print(f'Benchmark results written to {self.benchmark_output_file}')
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(formatter_class=SortingHelpFormatter,
+                                 description=f"{PROG}: Run a fixed script of Control Panel operations, against "
+                                             f"the themes shipped in assets/themes, and time each until the Preview "
+                                             f"Panel has applied it. The results are written as JSON.")
+
+    ap.add_argument("-t", "--themes", required=False, action="store",
+                    help=f"Comma separated list of theme names to load (default: {','.join(DEFAULT_THEMES)}).",
+                    dest='themes', default=','.join(DEFAULT_THEMES))
+
+    ap.add_argument("-i", "--iterations", required=False, action="store", type=int,
+                    help=f"The number of times to repeat the operations, per theme (default: {DEFAULT_ITERATIONS}).",
+                    dest='iterations', default=DEFAULT_ITERATIONS)
+
+    ap.add_argument("-o", "--output-file", required=False, action="store",
+                    help="The pathname of the JSON results file (default: a timestamped file in the log directory).",
+                    dest='output_file', default=None)
+
+    args_list = vars(ap.parse_args())
+    themes = [theme_name.strip() for theme_name in args_list["themes"].split(',') if theme_name.strip()]
+    for theme_name in themes:
+        if not (BENCHMARK_THEMES_DIR / f'{theme_name}.json').exists():
+            print(f'ERROR: Theme {theme_name} not found in {BENCHMARK_THEMES_DIR}')
+            exit(1)
+
+    output_file = args_list["output_file"]
+    if output_file is None:
+        output_file = LOG_DIR / f'benchmark_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+
+    control_panel = BenchmarkControlPanel(themes=themes, iterations=args_list["iterations"],
+                                          output_file=Path(output_file))
+    sys.exit(control_panel.exit_status)
@@ -0,0 +1,126 @@
+"""CTk Theme Builder, headless Preview Panel dispatch micro-benchmark."""
+__title__ = 'CTk Theme Builder Micro-benchmark'
+__author__ = 'Clive Bostock'
+__version__ = "1.0.0"
+__license__ = 'MIT - see LICENSE.md'
+
+import argparse
+import itertools
+import json
+import os
+import time
+import tkinter as tk
+from argparse import HelpFormatter
+from operator import attrgetter
+from utils.fake_widgets import ConfigureLog
+from utils.headless_preview import headless_preview_panel
+from view.ctk_theme_preview import COLOUR_DISPATCH, GEOMETRY_DISPATCH, coalesce_commands
+
+PROG = os.path.basename(__file__)
+
+DEFAULT_DURATION = 1.0
+# The number of commands queued, per render pass, for the render_pass benchmark.
+RENDER_PASS_COMMANDS = 100
+
+
+class SortingHelpFormatter(HelpFormatter):
+    def add_arguments(self, actions):
+        actions = sorted(actions, key=attrgetter('option_strings'))
+        super(SortingHelpFormatter, self).add_arguments(actions)
+
+
+def colour_commands() -> list:
+    """Return a list of every colour update the preview handles, as (widget_type, widget_property) pairs."""
+    return sorted(COLOUR_DISPATCH)
+
+
+def geometry_commands() -> list:
+    """Return a list of geometry update commands, for every geometry property the preview handles."""
+    return [{"command_type": "geometry", "command": "update_widget_geometry",
+             "parameters": [widget_type, widget_property, 2]}
+            for widget_type, widget_property in sorted(GEOMETRY_DISPATCH)]
+
+
+def measure(operation, duration: float) -> tuple:
+    """Call the operation repeatedly, for at least the duration (in seconds). Returns the number of calls, and the
+    elapsed time."""
+    calls = 0
+    batch = 1
+    started = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            operation()
+        calls += batch
+        elapsed = time.perf_counter() - started
+        if elapsed >= duration:
+            return calls, elapsed
+        batch = min(batch * 2, 10000)
+
+
+def run_benchmarks(duration: float, unwrapped: bool) -> dict:
+    configure_log = ConfigureLog()
+    preview_panel = headless_preview_panel(configure_log=configure_log)
+
+    def method(method_name: str):
+        bound_method = getattr(preview_panel, method_name)
+        if unwrapped and hasattr(bound_method, '__wrapped__'):
+            # Strip the log_call decorator, to isolate the dispatch logic.
+            return bound_method.__wrapped__.__get__(preview_panel)
+        return bound_method
+
+    update_widget_colour = method('update_widget_colour')
+    exec_geometry_command = method('_exec_geometry_command')
+    toggle_preview_disabled = method('_toggle_preview_disabled')
+
+    colours = itertools.cycle(colour_commands())
+    geometries = itertools.cycle(geometry_commands())
+    states = itertools.cycle((tk.DISABLED, tk.NORMAL))
+    pass_commands = [{"command_type": "colour", "command": "update_widget_colour",
+                      "parameters": [widget_type, widget_property, '#2A6EA6']}
+                     for widget_type, widget_property in itertools.islice(colours, RENDER_PASS_COMMANDS)]
+
+    def render_pass():
+        for command_json in pass_commands:
+            preview_panel._command_queue.put((command_json, None))
+        preview_panel._apply_queued_commands()
+
+    benchmarks = {"update_widget_colour": lambda: update_widget_colour(*next(colours), '#2A6EA6'),
+                  "_exec_geometry_command": lambda: exec_geometry_command(next(geometries)),
+                  "_toggle_preview_disabled": lambda: toggle_preview_disabled(render_state=next(states)),
+                  "coalesce_commands": lambda: coalesce_commands(pass_commands),
+                  "render_pass": render_pass}
+    results = {}
+    for name, operation in benchmarks.items():
+        configure_log.clear()
+        calls, elapsed = measure(operation, duration=duration)
+        results[name] = {"calls": calls,
+                         "calls_per_second": round(calls / elapsed, 1),
+                         "mean_us": round(elapsed / calls * 1e6, 3),
+                         "configure_calls_per_call": round(configure_log.call_count / calls, 2)}
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(formatter_class=SortingHelpFormatter,
+                                 description=f"{PROG}: Micro-benchmark the Preview Panel command dispatch logic, "
+                                             f"against fake widgets, without a display.")
+
+    ap.add_argument("-d", "--duration", required=False, action="store", type=float,
+                    help=f"Seconds to run each benchmark for (default: {DEFAULT_DURATION}).",
+                    dest='duration', default=DEFAULT_DURATION)
+
+    ap.add_argument("-u", "--unwrapped", required=False, action="store_true",
+                    help="Bypass the log_call decorator, on the dispatch methods, to measure the dispatch logic "
+                         "alone.",
+                    dest='unwrapped', default=False)
+
+    ap.add_argument("-o", "--output-file", required=False, action="store",
+                    help="Also write the results, as JSON, to the specified file.",
+                    dest='output_file', default=None)
+
+    args_list = vars(ap.parse_args())
+    results = run_benchmarks(duration=args_list["duration"], unwrapped=args_list["unwrapped"])
+    print(json.dumps(results, indent=2))
+    if args_list["output_file"] is not None:
+        with open(args_list["output_file"], 'w') as f:
+            json.dump(results, f, indent=2)
@@ -241,12 +241,9 @@ class App(customtkinter.CTk):
 
     def save_app_geometry(self):
         """Save the control panel geometry to the repo, for the next time the program is launched."""
-        geometry_row = pref.preference_row(db_file_path=DB_FILE_PATH,
-                                           scope='window_geometry',
-                                           preference_name='qa_application')
         qa_geometry = self.geometry()
-        geometry_row["preference_value"] = qa_geometry
-        pref.upsert_preference(db_file_path=DB_FILE_PATH, preference_row_dict=geometry_row)
+        pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                     preference_values={('window_geometry', 'qa_application'): qa_geometry})
 
     @staticmethod
     def sidebar_button_event():
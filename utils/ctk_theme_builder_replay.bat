@@ -0,0 +1,18 @@
+::##############################################################################
+::# Author: Clive Bostock
+::#   Date: 18 Oct 2026
+::#   Name: ctk_theme_builder_replay.bat
+::#  Descr:CustomTkinter Theme Builder Command Replay Launcher  (Windows)
+::##############################################################################
+@echo off
+:: Get the directory of the batch script
+set PROG_PATH=%~dp0
+
+:: Derive the parent directory of PROG_PATH
+for %%I in ("%PROG_PATH%\..") do set "APP_HOME=%%~fI"
+
+set APP_ENV=%APP_HOME%\venv
+set PYTHONPATH=%PYTHONPATH%;%APP_HOME%
+
+call %APP_ENV%\Scripts\activate.bat
+%APP_HOME%\utils\ctk_theme_builder_replay.py %1 %2 %3 %4 %5 %6
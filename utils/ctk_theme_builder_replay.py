@@ -0,0 +1,141 @@
+"""CTk Theme Builder, preview command stream replay."""
+__title__ = 'CTk Theme Builder Replay'
+__author__ = 'Clive Bostock'
+__version__ = "1.0.0"
+__license__ = 'MIT - see LICENSE.md'
+
+import argparse
+import json
+import os
+import time
+from argparse import HelpFormatter
+from operator import attrgetter
+from pathlib import Path
+import model.ctk_theme_builder as mod
+
+PROG = os.path.basename(__file__)
+
+BATCH_COMMAND_TYPE = mod.BATCH_COMMAND_TYPE
+
+
+class SortingHelpFormatter(HelpFormatter):
+    def add_arguments(self, actions):
+        actions = sorted(actions, key=attrgetter('option_strings'))
+        super(SortingHelpFormatter, self).add_arguments(actions)
+
+
+def load_recording(record_file: Path) -> list:
+    """Load a command recording, as written by the Control Panel's --record-commands option. Returns a list of
+    (elapsed, message) tuples."""
+    recording = []
+    with open(record_file, encoding=mod.ENCODING_FORMAT) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                recording.append((float(entry['elapsed']), entry['message']))
+            except (ValueError, KeyError) as e:
+                print(f'WARNING: Skipping malformed entry at line {line_number} of {record_file}: {e}')
+    return recording
+
+
+def prepare_replay_message(session: mod.PreviewSession, message: dict):
+    """Prepare a recorded message for replay. Each command (including those in a batch) is given a fresh request id,
+    so that its latency is measured. We drop any quit commands, since they would close the preview panel under
+    us. Returns the message and the number of commands it carries, or (None, 0) if there is nothing left to send."""
+    if message['command_type'] == BATCH_COMMAND_TYPE:
+        commands = message['parameters']
+    else:
+        commands = [message]
+    commands = [dict(command_json, request_id=session.next_request_id()) for command_json in commands
+                if command_json['command'] != 'quit']
+    if not commands:
+        return None, 0
+    if len(commands) == 1:
+        return commands[0], 1
+    return {"command_type": BATCH_COMMAND_TYPE, "command": BATCH_COMMAND_TYPE, "parameters": commands}, len(commands)
+
+
+def replay(record_file: Path, max_speed: bool) -> dict:
+    """Replay a command recording against a running Preview Panel, either honouring the original timings, or as fast
+    as possible. Returns a report, including the applied commands per second and per command latency."""
+    recording = load_recording(record_file)
+    session = mod.PreviewSession()
+    if not session.connect():
+        print(f'ERROR: Unable to connect to a preview panel listener, via {session.describe()}.')
+        exit(1)
+
+    commands_sent = 0
+    started = time.perf_counter()
+    for elapsed, message in recording:
+        if not max_speed:
+            delay = started + elapsed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        message, command_count = prepare_replay_message(session=session, message=message)
+        if message is None:
+            continue
+        session.send(message)
+        commands_sent += command_count
+    # Commands are applied in order, so once the sync completes, everything we sent has been applied.
+    synced = session.sync()
+    duration = time.perf_counter() - started
+    session.close()
+
+    summary = session.latency_stats.summary()
+    # Discount the sync ping.
+    summary['commands'].pop('ping', None)
+    applied = summary['statuses'].get(mod.ACK_STATUS_APPLIED, 0) - (1 if synced else 0)
+    return {"record_file": str(record_file),
+            "mode": 'max_speed' if max_speed else 'original_speed',
+            "transport": session.describe(),
+            "wire_format": mod.WIRE_FORMAT,
+            "completed": synced,
+            "commands_sent": commands_sent,
+            "commands_applied": applied,
+            "commands_coalesced": summary['statuses'].get(mod.ACK_STATUS_COALESCED, 0),
+            "duration_seconds": round(duration, 3),
+            "commands_per_second": round(commands_sent / duration, 1) if duration else 0.0,
+            "applied_per_second": round(applied / duration, 1) if duration else 0.0,
+            "latency": summary}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(formatter_class=SortingHelpFormatter,
+                                 description=f"{PROG}: Replay a preview command recording (see the Theme Builder "
+                                             f"--record-commands option), against a running Preview Panel, and "
+                                             f"report the command throughput and latency.")
+
+    ap.add_argument("-f", "--record-file", required=True, action="store",
+                    help="The pathname of the command recording to replay.",
+                    dest='record_file')
+
+    ap.add_argument("-m", "--max-speed", required=False, action="store_true",
+                    help="Replay the commands as fast as possible, rather than at their originally recorded timings.",
+                    dest='max_speed', default=False)
+
+    ap.add_argument("-o", "--output-file", required=False, action="store",
+                    help="Also write the report, as JSON, to the specified file.",
+                    dest='output_file', default=None)
+
+    ap.add_argument("-S", "--socket", required=False, action="store",
+                    help="The Unix domain socket path of the preview panel listener. This is reported by the "
+                         "Control Panel's Preview Latency dialogue (or see the listener_transport preference).",
+                    dest='socket_path', default=None)
+
+    args_list = vars(ap.parse_args())
+    record_file = Path(args_list["record_file"])
+    if not record_file.exists():
+        print(f'ERROR: Cannot open file: {record_file}')
+        exit(1)
+
+    if args_list["socket_path"] is not None:
+        os.environ[mod.LISTENER_SOCKET_ENV] = args_list["socket_path"]
+
+    report = replay(record_file=record_file, max_speed=args_list["max_speed"])
+    print(json.dumps(report, indent=2))
+    if args_list["output_file"] is not None:
+        with open(args_list["output_file"], 'w') as f:
+            json.dump(report, f, indent=2)
+    exit(0 if report["completed"] else 1)
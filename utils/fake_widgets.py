@@ -0,0 +1,99 @@
+"""Lightweight, headless stand-ins for CustomTkinter widgets. A FakeWidget accepts the calls the Preview Panel makes
+on its rendered widgets, and records configure calls, rather than drawing anything; so the preview's dispatch logic
+can be exercised, profiled and micro-benchmarked without a display."""
+__title__ = 'CTk Theme Builder Fake Widgets'
+__author__ = 'Clive Bostock'
+__version__ = "1.0.0"
+__license__ = 'MIT - see LICENSE.md'
+
+import collections
+
+# The CustomTkinter widget classes, for which we provide fakes (see FAKE_CTK_CLASSES).
+CTK_CLASS_NAMES = ('CTk', 'CTkButton', 'CTkCheckBox', 'CTkComboBox', 'CTkEntry', 'CTkFrame', 'CTkLabel',
+                   'CTkOptionMenu', 'CTkProgressBar', 'CTkRadioButton', 'CTkScrollableFrame', 'CTkScrollbar',
+                   'CTkSegmentedButton', 'CTkSlider', 'CTkSwitch', 'CTkTabview', 'CTkTextbox', 'CTkToplevel', 'CTkImage')
+
+
+class ConfigureLog:
+    """Accumulates the configure calls made on a set of fake widgets. Calls are always counted, by widget class and
+    option; with record_calls set, each call is also retained, as a (widget, options) tuple, in order."""
+
+    def __init__(self, record_calls: bool = False):
+        self.record_calls = record_calls
+        self.calls = []
+        self.call_count = 0
+        self.option_counts = collections.Counter()
+
+    def record(self, widget, options: dict):
+        self.call_count += 1
+        for option in options:
+            self.option_counts[(type(widget).__name__, option)] += 1
+        if self.record_calls:
+            self.calls.append((widget, dict(options)))
+
+    def clear(self):
+        self.calls.clear()
+        self.call_count = 0
+        self.option_counts.clear()
+
+
+class FakeWidget:
+    """A headless widget, which retains its configured options and reports configure calls to its ConfigureLog.
+    Geometry management and other calls, which have no bearing on the theme, are accepted and ignored."""
+
+    def __init__(self, master=None, configure_log: ConfigureLog = None, **kwargs):
+        self.master = master
+        self.configure_log = configure_log
+        self._options = dict(kwargs)
+        self._exists = True
+
+    def configure(self, require_redraw=False, **kwargs):
+        self._options.update(kwargs)
+        if self.configure_log is not None:
+            self.configure_log.record(self, kwargs)
+
+    config = configure
+
+    def cget(self, attribute_name: str):
+        return self._options.get(attribute_name)
+
+    def winfo_exists(self) -> int:
+        return int(self._exists)
+
+    def destroy(self):
+        self._exists = False
+
+    def tab(self, name: str):
+        """A CTkTabview's tabs are simply the tabview itself, so that widgets placed in a tab are parented by it."""
+        return self
+
+    def _ignore(self, *args, **kwargs):
+        return None
+
+    grid = grid_forget = grid_remove = pack = pack_forget = place = place_forget = _ignore
+    columnconfigure = rowconfigure = grid_columnconfigure = grid_rowconfigure = _ignore
+    bind = select = deselect = set = insert = delete = add = title = _ignore
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {id(self):#x}>'
+
+
+class FakeVariable:
+    """A headless stand-in for the tkinter variable classes (e.g. IntVar), which otherwise require a Tk root."""
+
+    def __init__(self, master=None, value=None, name=None):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+
+
+def fake_widget_class(class_name: str) -> type:
+    """Return a FakeWidget subclass, named after the CustomTkinter class it stands in for."""
+    return type(class_name, (FakeWidget,), {})
+
+
+FAKE_CTK_CLASSES = {class_name: fake_widget_class(class_name) for class_name in CTK_CLASS_NAMES}
@@ -0,0 +1,76 @@
+"""Support for running the Preview Panel headless. The CustomTkinter widget classes are swapped for the fakes in
+utils/fake_widgets.py, whilst the preview widgets are rendered, so that the panel's real render and command dispatch
+code can be exercised, tested and micro-benchmarked without a display."""
+__title__ = 'CTk Theme Builder Headless Preview'
+__author__ = 'Clive Bostock'
+__version__ = "1.0.0"
+__license__ = 'MIT - see LICENSE.md'
+
+import contextlib
+import queue
+import tkinter as tk
+from pathlib import Path
+from unittest import mock
+import customtkinter as ctk
+from customtkinter import ThemeManager
+import model.ctk_theme_builder as mod
+import view.ctk_theme_preview as ctk_theme_preview
+from utils.fake_widgets import ConfigureLog, FAKE_CTK_CLASSES, FakeVariable
+from view.ctk_theme_preview import PreviewPanel
+
+# The theme rendered by default. Being the Control Panel's default theme, it is always present.
+DEFAULT_THEME_FILE = mod.APP_THEMES_DIR / 'GreyGhost.json'
+
+
+@contextlib.contextmanager
+def fake_ctk_widgets(configure_log: ConfigureLog, db_file_path: Path = ctk_theme_preview.DB_FILE_PATH):
+    """Whilst active, the CustomTkinter widget classes (and tkinter's IntVar) are replaced by fakes, which report their
+    configure calls to the configure_log, and the Preview Panel takes its preferences from the db_file_path
+    repository. CustomTkinter's current theme is restored on exit."""
+    saved_theme = ThemeManager.theme
+    with contextlib.ExitStack() as stack:
+        for class_name, fake_class in FAKE_CTK_CLASSES.items():
+            logged_class = type(class_name, (fake_class,), {'__init__': _logged_init(fake_class, configure_log)})
+            stack.enter_context(mock.patch.object(ctk, class_name, logged_class))
+        stack.enter_context(mock.patch.object(tk, 'IntVar', FakeVariable))
+        stack.enter_context(mock.patch.object(ctk_theme_preview, 'DB_FILE_PATH', db_file_path))
+        try:
+            yield
+        finally:
+            ThemeManager.theme = saved_theme
+
+
+def _logged_init(fake_class: type, configure_log: ConfigureLog):
+    """Return an __init__ method for a subclass of fake_class, which binds its instances to the configure_log."""
+
+    def __init__(self, *args, **kwargs):
+        fake_class.__init__(self, *args, configure_log=configure_log, **kwargs)
+
+    return __init__
+
+
+def headless_preview_panel(configure_log: ConfigureLog, theme_file: Path = DEFAULT_THEME_FILE,
+                           appearance_mode: str = 'Dark',
+                           db_file_path: Path = ctk_theme_preview.DB_FILE_PATH) -> PreviewPanel:
+    """Return a PreviewPanel, rendered by its own render_preview_frames method, but with fake widgets (see
+    fake_ctk_widgets). The panel's constructor is bypassed, so there is no Tk window, method listener or main loop;
+    only the state used by the render and command dispatch methods is set up. Tooltips are disabled, since they are
+    not themed. The Control Panel theme and mode are taken from the db_file_path repository, as for the real panel,
+    so the repository must exist. The configure calls made during rendering are cleared from the configure_log, before
+    returning."""
+    preview_panel = PreviewPanel.__new__(PreviewPanel)
+    preview_panel._appearance_mode = appearance_mode
+    preview_panel._theme_file = theme_file
+    preview_panel._theme_json_dir = mod.APP_THEMES_DIR
+    preview_panel._in_process = False
+    preview_panel._enable_tooltips = 0
+    preview_panel._render_disabled = 0
+    preview_panel.refresh_widgets = []
+    preview_panel._command_queue = queue.Queue()
+    with fake_ctk_widgets(configure_log=configure_log, db_file_path=db_file_path):
+        preview_panel.preview = ctk.CTk()
+        with preview_panel._preview_theme():
+            preview_panel.render_preview_frames()
+    configure_log.clear()
+    return preview_panel
+
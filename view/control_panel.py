@@ -14,6 +14,7 @@ from view.provenance_dialog import ProvenanceDialog
 from view.export_import import Exporter
 from view.export_import import Importer
 from view.geometry_dialog import GeometryDialog
+from view.ctk_theme_preview import PreviewPanel
 from CTkToolTip import *
 # import view.ctk_button_dnd as dnd
 import model.preferences as pref
@@ -21,13 +22,13 @@ import operator
 import platform
 import pyperclip
 from pathlib import Path
-import time
 from datetime import datetime
 import shutil
 import os
 import subprocess as sp
 from tkinter.colorchooser import askcolor
 import json
+import copy
 from CTkMessagebox import CTkMessagebox
 import sys
 
@@ -43,7 +44,6 @@ HEADING4 = mod.HEADING4
 
 REGULAR_TEXT = cbtk.REGULAR_TEXT
 SMALL_TEXT = mod.SMALL_TEXT
-LISTENER_FILE = mod.LISTENER_FILE
 PROG_NAME = mod.PROG_NAME
 
 APP_HOME = mod.APP_HOME
@@ -57,6 +57,13 @@ DEFAULT_VIEW = mod.DEFAULT_VIEW
 VIEWS_DIR = mod.VIEWS_DIR
 default_view_file = VIEWS_DIR / f'{DEFAULT_VIEW}.json'
 DEFAULT_VIEW_WIDGET_ATTRIBUTES = mod.json_dict(json_file_path=default_view_file)
+# Seconds we are prepared to wait for a newly launched preview panel to report that it is ready, or for a retiring
+# one to exit.
+PREVIEW_LAUNCH_TIMEOUT = 40
+PREVIEW_EXIT_TIMEOUT = 5
+# Milliseconds to hold off spawning a new standby preview, so that it doesn't compete with the rendering of the
+# preview panel just launched.
+STANDBY_SPAWN_DELAY = 2000
 
 
 class ControlPanel(ctk.CTk):
@@ -111,16 +118,15 @@ class ControlPanel(ctk.CTk):
         self.new_theme_json_dir = None
         self.wip_json = None
 
-        if LISTENER_FILE.exists():
-            try:
-                os.remove(LISTENER_FILE)
-            except PermissionError:
-                log.log_critical(f'ERROR: Could not remove listener semaphore file, {LISTENER_FILE}.')
-                log.log_supplementary(f'Only one instance of {PROG_NAME}, should be running.')
-                exit(0)
-
         # Initialise class properties
         self.process = None
+        # Set instead of self.process, when the preview panel is hosted in process.
+        self.preview_panel = None
+        # A pre-spawned preview process, fully imported, and waiting to be activated on the next (re)launch.
+        self.standby_process = None
+        # The appearance mode and theme JSON data last rendered in full by the preview panel. A refresh only sends
+        # the differences from this.
+        self.preview_theme_snapshot = None
 
         self.json_state = 'clean'
         self.widgets = {}
@@ -571,7 +577,7 @@ class ControlPanel(ctk.CTk):
         if prev_colour != new_colour and widget_property in mod.FORCE_COLOR_REFRESH_PROPERTIES:
             # Then either this isn't a real widget, or is a property which cannot be updated
             # dynamically, and so we force a refresh to update the widgets dependent upon its properties.
-            self.refresh_preview()
+            self.refresh_preview(force=True)
         elif prev_colour != new_colour:
             # Grab a change vector - we need it for undo/redo
             change_vector = mod.PropertyVector(command_type='colour',
@@ -636,6 +642,7 @@ class ControlPanel(ctk.CTk):
         self.tools_menu.add_command(label='Preferences', command=self.launch_preferences_dialog)
         self.tools_menu.add_command(label='Colour Harmonics', command=self.launch_harmony_dialog, state=tk.DISABLED)
         self.tools_menu.add_command(label='Merge Themes', command=self.launch_theme_merger)
+        self.tools_menu.add_command(label='Preview Latency', command=self.show_preview_latency)
 
         self.tools_menu.add_command(label='About', command=self.about)
 
@@ -678,6 +685,37 @@ class ControlPanel(ctk.CTk):
                       class_name='ControlPanel', method_name='about')
         about_dialog = About()
 
+    @log_call
+    def show_preview_latency(self):
+        """Display the round trip latency percentiles, for commands acknowledged by the Preview Panel, along with the
+        slowest widget updates, offering to export the details to the log directory."""
+        log.log_debug(log_text='Show preview latency statistics',
+                      class_name='ControlPanel', method_name='show_preview_latency')
+        latency_stats = mod.preview_session.latency_stats
+        summary = latency_stats.summary()
+        if not summary['samples']:
+            CTkMessagebox(master=self, title='Preview Latency',
+                          message='No acknowledged preview commands have been recorded yet.'
+                                  + ('' if mod.PREVIEW_ACKS else '\n\nPreview acknowledgements are disabled '
+                                                                  '(see the Preview Latency preference).'),
+                          option_1='OK')
+            return
+        round_trip, apply = summary['round_trip_ms'], summary['apply_ms']
+        message = f'Listener: {mod.preview_session.describe()}\nSamples: {summary["samples"]}\n\n' \
+                  f'Round trip (ms): p50 {round_trip["p50"]}, p90 {round_trip["p90"]}, p99 {round_trip["p99"]}, ' \
+                  f'max {round_trip["max"]}\n' \
+                  f'Apply (ms): p50 {apply["p50"]}, p90 {apply["p90"]}, p99 {apply["p99"]}, max {apply["max"]}\n\n' \
+                  'Slowest updates (max apply ms):\n'
+        for entry in summary['slowest'][:5]:
+            message += f'  {entry["command"]}: {entry["apply_max_ms"]}\n'
+        confirm = CTkMessagebox(master=self, title='Preview Latency', message=message, width=560,
+                                option_1='Export', option_2='OK')
+        if confirm.get() == 'Export':
+            now = datetime.now()
+            export_file = self.log_dir / f'preview_latency_{now.strftime("%Y%m%d_%H%M%S")}.json'
+            latency_stats.export(file_path=export_file)
+            self.status_bar.set_status_text(status_text=f'Preview latency statistics exported to {export_file}')
+
     @log_call
     def launch_export_dialog(self):
         log.log_debug(log_text='Launching export dialogue',
@@ -1197,32 +1235,34 @@ class ControlPanel(ctk.CTk):
             old_mode_index = 0
             new_mode_index = 1
 
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='auto_save',
-                                           preference_name='appearance_mode',
-                                           preference_value=self.appearance_mode):
-            log.log_warning(log_text=f'Row miss: on update of auto save of selected theme.')
+        pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                     preference_values={('auto_save', 'appearance_mode'): self.appearance_mode})
 
         self.lbl_palette_header.configure(text=f'Theme Palette ({preview_appearance_mode})')
         self.update_wip_file()
         self.stash_theme_palette(mode=old_mode_index)
         self.render_widget_properties()
         self.load_stashed_theme_palette(mode=new_mode_index)
-        # We only log change vectors for appearance mode, where there might be colour changes involved.
-        if self.command_stack.undo_length() > 0 or self.command_stack.redo_length() > 0:
-            change_vector = mod.PropertyVector(command_type='program',
-                                               command='set_appearance_mode',
-                                               new_value=self.appearance_mode,
-                                               old_value=old_value)
-
-            self.command_stack.exec_command(property_vector=change_vector)
-        else:
-            mod.send_command_json(command_type='program',
-                                  command='set_appearance_mode',
-                                  parameters=[self.appearance_mode])
+        # The mode switch and the frame mode which follows it, are sent as a single batch.
+        with mod.command_batch():
+            # We only log change vectors for appearance mode, where there might be colour changes involved.
+            if self.command_stack.undo_length() > 0 or self.command_stack.redo_length() > 0:
+                change_vector = mod.PropertyVector(command_type='program',
+                                                   command='set_appearance_mode',
+                                                   new_value=self.appearance_mode,
+                                                   old_value=old_value)
+
+                self.command_stack.exec_command(property_vector=change_vector)
+            else:
+                mod.send_command_json(command_type='program',
+                                      command='set_appearance_mode',
+                                      parameters=[self.appearance_mode])
 
-        # Ensure we honor the Top Frame switch setting
-        self.set_option_states()
-        self.toggle_frame_mode()
+            # Ensure we honor the Top Frame switch setting
+            self.set_option_states()
+            self.toggle_frame_mode()
+        # The preview re-renders from the work in progress file, on a mode switch.
+        self.snapshot_preview_theme()
 
     @log_call
     def render_theme_palette(self):
@@ -1388,16 +1428,18 @@ class ControlPanel(ctk.CTk):
             if response == 'No':
                 return
 
-        for _property in cascade_dict_list:
-            _widget_property = f'{_property["widget_type"]}: {_property["widget_property"]}'
-            if _property["widget_type"] != 'CTk':
-                # Except for the CTk() class, we strip out the CTk string,
-                # from the widget name, for display purposes.
-                _widget_property = _widget_property.replace('CTk', '')
+        # The resulting preview panel updates are sent as a single batch.
+        with mod.command_batch():
+            for _property in cascade_dict_list:
+                _widget_property = f'{_property["widget_type"]}: {_property["widget_property"]}'
+                if _property["widget_type"] != 'CTk':
+                    # Except for the CTk() class, we strip out the CTk string,
+                    # from the widget name, for display purposes.
+                    _widget_property = _widget_property.replace('CTk', '')
 
-            # We call the paste_colour method here, overriding the cut/paste mode, by supplying the
-            # property colour directly, as a parameter.
-            self.paste_colour(event=None, widget_property=_widget_property, property_colour=property_colour)
+                # We call the paste_colour method here, overriding the cut/paste mode, by supplying the
+                # property colour directly, as a parameter.
+                self.paste_colour(event=None, widget_property=_widget_property, property_colour=property_colour)
 
     @log_call
     def cascade_enabled(self, palette_id: int) -> bool:
@@ -1476,10 +1518,8 @@ class ControlPanel(ctk.CTk):
             else:
                 self.appearance_mode = 'Dark'
 
-            if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='auto_save',
-                                               preference_name='appearance_mode',
-                                               preference_value=self.appearance_mode):
-                log.log_warning(log_text=f'Row miss: on update of auto save of selected theme.')
+            pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                         preference_values={('auto_save', 'appearance_mode'): self.appearance_mode})
 
             self.lbl_palette_header.configure(text=f'Theme Palette ({preview_appearance_mode})')
             self.update_wip_file()
@@ -1512,10 +1552,8 @@ class ControlPanel(ctk.CTk):
             else:
                 self.appearance_mode = 'Dark'
 
-            if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='auto_save',
-                                               preference_name='appearance_mode',
-                                               preference_value=self.appearance_mode):
-                log.log_warning(log_text=f'Row miss: on update of auto save of selected theme.')
+            pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                         preference_values={('auto_save', 'appearance_mode'): self.appearance_mode})
 
             self.lbl_palette_header.configure(text=f'Theme Palette ({preview_appearance_mode})')
             self.update_wip_file()
@@ -1629,10 +1667,8 @@ class ControlPanel(ctk.CTk):
 
         # Update the auto-save section of the preferences, to record the last theme we opened.
         # This may be required on the next app startup, if the last_theme_on_start preference is enabled.
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='auto_save',
-                                           preference_name='selected_theme',
-                                           preference_value=selected_theme):
-            log.log_warning(log_text=f'Row miss: on update of auto save of selected theme.')
+        pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                     preference_values={('auto_save', 'selected_theme'): selected_theme})
         self.status_bar.set_status_text(status_text_life=30,
                                         status_text=f'Theme file, {self.theme_file}, loaded. ')
         self.json_state = 'clean'
@@ -1641,12 +1677,9 @@ class ControlPanel(ctk.CTk):
     @log_call
     def save_harmonics_geometry(self):
         """Save the harmonics panel geometry to the repo, for the next time the dialog is launched."""
-        geometry_row = pref.preference_row(db_file_path=DB_FILE_PATH,
-                                           scope='window_geometry',
-                                           preference_name='harmonics_panel')
         panel_geometry = self.geometry()
-        geometry_row["preference_value"] = panel_geometry
-        pref.upsert_preference(db_file_path=DB_FILE_PATH, preference_row_dict=geometry_row)
+        pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                     preference_values={('window_geometry', 'harmonics_panel'): panel_geometry})
 
     @log_call
     def close_harmonics(self):
@@ -1963,10 +1996,8 @@ class ControlPanel(ctk.CTk):
             self.theme = new_theme
             self.json_state = 'clean'
             self.command_stack.reset_stacks()
-            if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='auto_save',
-                                               preference_name='selected_theme',
-                                               preference_value=new_theme):
-                log.log_warning(log_text=f'Row miss: on update of auto save of selected theme.')
+            pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                         preference_values={('auto_save', 'selected_theme'): new_theme})
             self.set_option_states()
 
     @log_call
@@ -2358,7 +2389,8 @@ class ControlPanel(ctk.CTk):
                      class_name='ControlPanel', method_name='sync_appearance_mode()')
         self.json_state = 'dirty'
         self.set_option_states()
-        self.reload_preview()
+        # Only the other appearance mode's colours have changed, so there is normally nothing to re-render.
+        self.refresh_preview(set_scaling=False)
 
     @log_call
     def sync_theme_palette(self):
@@ -2394,47 +2426,83 @@ class ControlPanel(ctk.CTk):
         self.set_option_states()
 
     @log_call
-    def refresh_preview(self, set_scaling: bool = True):
-        """The refresh_preview method, instructs the Preview Panel to perform a re-rendering of all widgets."""
-        log.log_debug(log_text=f'Refresh preview set_scaling={set_scaling}',
+    def snapshot_preview_theme(self):
+        """Record the theme, as now rendered in full by the preview panel, for use by refresh_preview."""
+        self.preview_theme_snapshot = (self.appearance_mode, copy.deepcopy(self.theme_json_data))
+
+    @log_call
+    def refresh_preview(self, set_scaling: bool = True, force: bool = False):
+        """The refresh_preview method, brings the Preview Panel up to date with the work in progress theme. Where
+        possible, only the properties which differ from those last rendered are sent, and the preview reconfigures
+        just the affected widgets; so if nothing has changed, nothing is sent. Otherwise (e.g. for properties with no
+        configure option), or where force is set, the Preview Panel is instructed to perform a re-rendering of all
+        widgets."""
+        log.log_debug(log_text=f'Refresh preview set_scaling={set_scaling}, force={force}',
                       class_name='ControlPanel', method_name='refresh_preview')
         self.update_wip_file()
-        mod.send_command_json(command_type='program',
-                              command='refresh',
-                              parameters=[self.appearance_mode])
-
-        if set_scaling:
-            mod.send_command_json(command_type='program',
-                                  command='set_widget_scaling',
-                                  parameters=[self.preview_panel_scaling_pct])
+        theme_delta = None
+        if not force and self.preview_theme_snapshot is not None \
+                and self.preview_theme_snapshot[0] == self.appearance_mode:
+            theme_delta = mod.theme_delta(applied_theme=self.preview_theme_snapshot[1],
+                                          theme=self.theme_json_data,
+                                          appearance_mode=self.appearance_mode)
+        with mod.command_batch():
+            if theme_delta is None:
+                mod.send_command_json(command_type='program',
+                                      command='refresh',
+                                      parameters=[self.appearance_mode])
+            elif theme_delta:
+                log.log_debug(log_text=f'Refresh preview, with a delta of {len(theme_delta)} change(s)',
+                              class_name='ControlPanel', method_name='refresh_preview')
+                mod.send_command_json(command_type='program',
+                                      command='apply_theme_delta',
+                                      parameters=theme_delta)
+
+            if set_scaling:
+                mod.send_command_json(command_type='program',
+                                      command='set_widget_scaling',
+                                      parameters=[self.preview_panel_scaling_pct])
+        self.snapshot_preview_theme()
 
     @log_call
     def reload_preview(self):
         """The reload_preview method causes a full reload of the preview panel."""
         log.log_debug(log_text=f'Reload preview panel',
                       class_name='ControlPanel', method_name='reload_preview')
-        if self.process:
+        if self.process or self.preview_panel:
             mod.send_command_json(command_type='program',
                                   command='quit',
                                   parameters=None)
+        if self.process:
+            # The new preview panel needs the listener port, so we wait for the old one to release it. This
+            # returns as soon as the process has gone.
+            try:
+                self.process.wait(timeout=PREVIEW_EXIT_TIMEOUT)
+            except sp.TimeoutExpired:
+                log.log_warning(log_text='Preview panel slow to exit on reload',
+                                class_name='ControlPanel', method_name='reload_preview')
 
         self.update_wip_file()
 
         self.process = None
+        self.preview_panel = None
+
+        # The initial program commands for the new preview panel, are sent as a single batch.
+        with mod.command_batch():
+            self.launch_preview()
+            if self.tk_render_disabled.get():
+                mod.send_command_json(command_type='program',
+                                      command='render_preview_disabled',
+                                      parameters=None)
+            else:
+                mod.send_command_json(command_type='program',
+                                      command='render_preview_enabled',
+                                      parameters=None)
 
-        self.launch_preview()
-        if self.tk_render_disabled.get():
-            mod.send_command_json(command_type='program',
-                                  command='render_preview_disabled',
-                                  parameters=None)
-        else:
-            mod.send_command_json(command_type='program',
-                                  command='render_preview_enabled',
-                                  parameters=None)
-
-        frame_mode = self.tk_swt_frame_mode.get()
-        if frame_mode == 'base':
-            mod.send_command_json(command_type='program', command='render_base_frame')
+            frame_mode = self.tk_swt_frame_mode.get()
+            if frame_mode == 'base':
+                mod.send_command_json(command_type='program', command='render_base_frame')
+        self.snapshot_preview_theme()
 
     @log_call
     def close_panels(self, event=None):
@@ -2452,12 +2520,15 @@ class ControlPanel(ctk.CTk):
                       class_name='ControlPanel', method_name='close_panels')
         if self.qa_launched:
             mod.request_close_qa_app()
-        if self.process:
+        if self.process or self.preview_panel:
             mod.send_command_json(command_type='program',
                                   command='quit',
                                   parameters=None)
+        self.retire_standby_preview()
 
         self.save_controller_geometry()
+        # Write any queued preference updates (e.g. window geometry), before we go.
+        pref.flush_preference_writes()
         log.log_complete(class_name='ControlPanel', supplementary_text='Theme Builder Control Panel exiting')
         self.destroy()
 
@@ -2470,46 +2541,36 @@ class ControlPanel(ctk.CTk):
         self.protocol("WM_DELETE_WINDOW", self.block_window_close)
         appearance_mode_ = self.appearance_mode
         self.update_wip_file()
-        designer = str(APP_HOME / 'ctk_theme_builder.py')
-        if platform.system() == 'Windows':
-            designer = designer.replace('.py', '.bat')
-        else:
-            designer = designer.replace('.py', '.sh')
 
-        if self.process is None:
-            designer = APP_HOME / designer
-            program = [designer, '-a', appearance_mode_, '-t', self.wip_json]
-            log.log_debug(log_text=f'Launching designer: {designer}', class_name='ControlPanel',
-                          method_name='launch_preview')
-            self.process = sp.Popen(program)
-            listener_started = False
-            # Wait for Preview Pamel to start the listener.
-            # We expect a semaphore file to be created when this
-            # is so.
-            sleep_count = 0
-            while not listener_started:
-                log.log_debug(log_text=f'Checking for a listener - try {sleep_count + 1}...', class_name='ControlPanel',
+        if self.process is None and self.preview_panel is None and mod.preview_mode() == mod.IN_PROCESS_PREVIEW:
+            self.launch_in_process_preview()
+        elif self.process is None and self.preview_panel is None:
+            if isinstance(mod.preview_session, mod.LocalPreviewSession):
+                # We've switched back from an in process preview.
+                mod.set_preview_session(mod.PreviewSession())
+            self.process = self.activate_standby_preview(appearance_mode=appearance_mode_)
+            if self.process is None:
+                designer = self.preview_launcher()
+                program = [designer, '-a', appearance_mode_, '-t', self.wip_json]
+                log.log_debug(log_text=f'Launching designer: {designer}', class_name='ControlPanel',
                               method_name='launch_preview')
-                sleep_count += 1
-                if LISTENER_FILE.exists():
-                    log.log_debug(log_text='Listener started', class_name='ControlPanel',
-                                  method_name='launch_preview')
-                    listener_started = True
-                if sleep_count > 80:
-                    confirm = CTkMessagebox(master=self,
-                                            title='Listener Timeout',
-                                            message=f'TIMEOUT: Waited too long for preview listener!\n\n'
-                                                    f'Ensure that only one instance of {mod.app_title()} is '
-                                                    f'running on port {self.listener_port}, and that no other process '
-                                                    f'is using the port.',
-                                            option_1='OK')
-                    log.log_critical('ERROR: Waited too long for listener!',
-                                     supplementary_text=f'Ensure that only one instance of {mod.app_title()} is running.',
-                                     class_name='ControlPanel',
-                                     method_name='launch_preview')
-                    if confirm.get() == 'OK':
-                        exit(1)
-                time.sleep(0.5)
+                self.process = sp.Popen(program)
+            # Wait for the Preview Panel to start its listener. It greets each new session with a ready message,
+            # so we carry on the moment it is serving, or bail out early if the process dies on us.
+            if not mod.preview_session.connect(timeout=PREVIEW_LAUNCH_TIMEOUT, process=self.process):
+                confirm = CTkMessagebox(master=self,
+                                        title='Listener Timeout',
+                                        message=f'TIMEOUT: Waited too long for preview listener!\n\n'
+                                                f'Ensure that only one instance of {mod.app_title()} is '
+                                                f'running on {mod.preview_session.describe()}, and that no '
+                                                f'other process is using it.',
+                                        option_1='OK')
+                log.log_critical('ERROR: Waited too long for listener!',
+                                 supplementary_text=f'Ensure that only one instance of {mod.app_title()} is running.',
+                                 class_name='ControlPanel',
+                                 method_name='launch_preview')
+                if confirm.get() == 'OK':
+                    exit(1)
 
             log.log_info(log_text='Listener established', class_name='ControlPanel',
                          method_name='launch_preview')
@@ -2519,9 +2580,73 @@ class ControlPanel(ctk.CTk):
             mod.send_command_json(command_type='program',
                                   command='set_widget_scaling',
                                   parameters=[self.preview_panel_scaling_pct])
+            if mod.standby_preview_enabled():
+                self.after(STANDBY_SPAWN_DELAY, self.spawn_standby_preview)
 
         self.protocol("WM_DELETE_WINDOW", self.close_panels)
 
+    @staticmethod
+    def preview_launcher() -> Path:
+        """Return the path of the platform specific script, used to launch a preview panel process."""
+        designer = str(APP_HOME / 'ctk_theme_builder.py')
+        if platform.system() == 'Windows':
+            designer = designer.replace('.py', '.bat')
+        else:
+            designer = designer.replace('.py', '.sh')
+        return APP_HOME / designer
+
+    @log_call
+    def spawn_standby_preview(self):
+        """Spawn a standby preview process, in the background. It completes its imports and then waits, on its
+        standard input, to be activated by activate_standby_preview. This takes the interpreter start up cost out of
+        the next preview (re)launch."""
+        if self.standby_process is not None and self.standby_process.poll() is None:
+            return
+        log.log_debug(log_text='Spawning standby preview panel', class_name='ControlPanel',
+                      method_name='spawn_standby_preview')
+        self.standby_process = sp.Popen([self.preview_launcher(), '-s'], stdin=sp.PIPE)
+
+    @log_call
+    def activate_standby_preview(self, appearance_mode: str):
+        """Hand the work in progress theme to the standby preview process, if we have one, returning the process.
+        None is returned, if there is no standby available."""
+        standby_process, self.standby_process = self.standby_process, None
+        if standby_process is None or standby_process.poll() is not None:
+            return None
+        activation = json.dumps({"theme_file": str(self.wip_json), "appearance_mode": appearance_mode})
+        try:
+            standby_process.stdin.write(f'{activation}\n'.encode(mod.ENCODING_FORMAT))
+            standby_process.stdin.close()
+        except OSError:
+            log.log_warning(log_text='Standby preview panel unavailable; launching afresh',
+                            class_name='ControlPanel', method_name='activate_standby_preview')
+            return None
+        log.log_debug(log_text='Activated standby preview panel', class_name='ControlPanel',
+                      method_name='activate_standby_preview')
+        return standby_process
+
+    @log_call
+    def retire_standby_preview(self):
+        """Let any standby preview process go; closing its standard input, causes it to exit."""
+        standby_process, self.standby_process = self.standby_process, None
+        if standby_process is None:
+            return
+        try:
+            standby_process.stdin.close()
+        except OSError:
+            pass
+
+    @log_call
+    def launch_in_process_preview(self):
+        """Host the preview panel in a CTkToplevel, within the Control Panel's process. This avoids the start up
+        cost of a second interpreter, and commands are applied as direct calls, rather than via the listener. The
+        trade-off is that CustomTkinter's appearance mode and scaling are shared with the Control Panel."""
+        log.log_debug(log_text='Launching in process preview panel', class_name='ControlPanel',
+                      method_name='launch_in_process_preview')
+        self.preview_panel = PreviewPanel(theme_file=str(self.wip_json), appearance_mode=self.appearance_mode,
+                                          master=self)
+        mod.set_preview_session(mod.LocalPreviewSession(self.preview_panel))
+
     @log_call
     def restore_controller_geometry(self):
         log.log_debug(log_text=f'Restore Control Panel geometry',
@@ -2537,12 +2662,9 @@ class ControlPanel(ctk.CTk):
         """Save the control panel geometry to the repo, for the next time the program is launched."""
         log.log_debug(log_text=f'Save Control Panel geometry',
                       class_name='ControlPanel', method_name='restore_controller_geometry')
-        geometry_row = pref.preference_row(db_file_path=DB_FILE_PATH,
-                                           scope='window_geometry',
-                                           preference_name='control_panel')
         panel_geometry = self.geometry()
-        geometry_row["preference_value"] = panel_geometry
-        pref.upsert_preference(db_file_path=DB_FILE_PATH, preference_row_dict=geometry_row)
+        pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                     preference_values={('window_geometry', 'control_panel'): panel_geometry})
 
     @log_call
     def save_theme(self):
@@ -3,8 +3,7 @@ __author__ = 'Clive Bostock'
 __version__ = "2.4.0"
 __license__ = 'MIT - see LICENSE.md'
 
-import copy
-import time
+import contextlib
 import tkinter as tk
 import customtkinter as ctk
 from customtkinter import ThemeManager
@@ -12,9 +11,12 @@ import json
 import socket
 import os
 import platform
+import asyncio
+import queue
+import time
+import atexit
 import threading
 from pathlib import Path
-from datetime import datetime
 import utils.cbtk_kit as cbtk
 import model.ctk_theme_builder as mod
 from model.ctk_theme_builder import log_call
@@ -33,7 +35,6 @@ TEMP_DIR = mod.TEMP_DIR
 VIEWS_DIR = mod.VIEWS_DIR
 APP_THEMES_DIR = mod.APP_THEMES_DIR
 APP_IMAGES = mod.APP_IMAGES
-LISTENER_FILE = mod.LISTENER_FILE
 APP_DATA_DIR = mod.APP_DATA_DIR
 DB_FILE_PATH = mod.DB_FILE_PATH
 
@@ -46,42 +47,253 @@ METHOD_LISTENER_ADDRESS = mod.method_listener_address()
 ENCODING_FORMAT = mod.ENCODING_FORMAT
 DISCONNECT_MESSAGE = mod.DISCONNECT_MESSAGE
 DISCONNECT_JSON = mod.DISCONNECT_JSON
+BATCH_COMMAND_TYPE = mod.BATCH_COMMAND_TYPE
+READY_JSON = mod.READY_JSON
+ACK_MESSAGE = mod.ACK_MESSAGE
 
 DEFAULT_VIEW = mod.DEFAULT_VIEW
-
-listener_status = 0
+# How often (in milliseconds) the Tk main loop drains the command queue, fed by the method listener. This is our
+# frame interval (~60 Hz); repeated updates to the same widget property, within a frame, are coalesced.
+COMMAND_PUMP_INTERVAL = 16
+COALESCED_COMMANDS = ('update_widget_colour', 'update_widget_geometry')
+
+
+# The widget properties, which map directly onto a configure option of the same name.
+COLOUR_PROPERTIES = ('border_color', 'button_color', 'button_hover_color', 'checkmark_color', 'fg_color',
+                     'hover_color', 'label_fg_color', 'placeholder_text_color', 'progress_color',
+                     'scrollbar_button_color', 'scrollbar_button_hover_color', 'selected_color', 'selected_hover_color',
+                     'text_color', 'text_color_disabled', 'unselected_color', 'unselected_hover_color')
+GEOMETRY_PROPERTIES = ('corner_radius', 'button_corner_radius', 'border_width', 'border_width_unchecked',
+                       'border_width_checked', 'button_length')
+
+# Theme properties, which are rendered on a different widget group, or configure option, to their own. The CTkFrame
+# fg_color and top_fg_color properties are split between the base and top preview frames (frame_base / frame_top),
+# since top_fg_color has no configure option.
+REMAPPED_PROPERTIES = {('CTkFrame', 'fg_color'): [('frame_base', 'fg_color')],
+                       ('CTkFrame', 'top_fg_color'): [('frame_top', 'fg_color')]}
+
+# Composite widgets, which take on properties of other widget types, in addition to the widget type's own. The keys
+# are (widget_type, widget_property) and the values, lists of (target widget group, configure option).
+COMPOSITE_COLOUR_TARGETS = {
+    ('CTkFrame', 'fg_color'): [('CTkScrollableFrame', 'fg_color'),
+                               # Temporary work-around for CustomTkinter issue #1803 (tab colours) not applied.
+                               ('CTkTabview', 'fg_color')],
+    ('CTkFrame', 'border_color'): [('CTkScrollableFrame', 'border_color'),
+                                   ('CTkTabview', 'border_color')],
+    ('CTkScrollbar', 'fg_color'): [('CTkScrollableFrame', 'scrollbar_fg_color'),
+                                   ('CTkTextbox', 'scrollbar_fg_color')],
+    ('CTkScrollbar', 'button_color'): [('CTkScrollableFrame', 'scrollbar_button_color'),
+                                       ('CTkTextbox', 'scrollbar_button_color')],
+    ('CTkScrollbar', 'button_hover_color'): [('CTkScrollableFrame', 'scrollbar_button_hover_color'),
+                                             ('CTkTextbox', 'scrollbar_button_hover_color')],
+    ('CTkLabel', 'fg_color'): [('CTkScrollableFrame', 'label_fg_color')],
+    ('CTkLabel', 'text_color'): [('CTkScrollableFrame', 'label_text_color')],
+    ('CTkSegmentedButton', 'fg_color'): [('CTkTabview', 'segmented_button_fg_color')],
+    ('CTkSegmentedButton', 'selected_color'): [('CTkTabview', 'segmented_button_selected_color')],
+    ('CTkSegmentedButton', 'selected_hover_color'): [('CTkTabview', 'segmented_button_selected_hover_color')],
+    ('CTkSegmentedButton', 'unselected_color'): [('CTkTabview', 'segmented_button_unselected_color')],
+    ('CTkSegmentedButton', 'unselected_hover_color'): [('CTkTabview', 'segmented_button_unselected_hover_color')],
+    ('CTkSegmentedButton', 'text_color'): [('CTkTabview', 'text_color')],
+    ('CTkSegmentedButton', 'text_color_disabled'): [('CTkTabview', 'text_color_disabled')]
+}
+COMPOSITE_GEOMETRY_TARGETS = {
+    ('CTkFrame', 'corner_radius'): [('CTkScrollableFrame', 'corner_radius'), ('CTkTabview', 'corner_radius')],
+    ('CTkFrame', 'border_width'): [('CTkScrollableFrame', 'border_width'), ('CTkTabview', 'border_width')]
+}
+
+# As of CTk 5.2.0 the configuring of button_corner_radius on CTkSlider causes an exception due to a bug.
+# We trap this, and hopefully this will be fixed soon.
+VALUE_ERROR_TOLERANT_OPTIONS = ('button_corner_radius',)
+
+
+def build_dispatch_table(widget_types, properties: tuple, composite_targets: dict,
+                         remapped_properties: dict = None) -> dict:
+    """Build a dispatch table, from each (widget_type, widget_property) to the list of (widget group, configure
+    option) pairs, which it updates. This is built once, so that applying an update, is a dictionary lookup,
+    followed by a loop over the target widgets.
+
+    :param widget_types: The widget types (i.e. widget groups) rendered by the preview.
+    :param properties: The properties, which configure the widget type's own option of the same name.
+    :param composite_targets: Additional (widget group, configure option) targets, keyed by (type, property).
+    :param remapped_properties: Replacement primary targets, keyed by (type, property).
+    :return: The dispatch table dictionary."""
+    remapped_properties = remapped_properties or {}
+    dispatch_table = {}
+    for widget_type in widget_types:
+        for widget_property in properties:
+            dispatch_table[(widget_type, widget_property)] = [(widget_type, widget_property)]
+    for key, targets in remapped_properties.items():
+        dispatch_table[key] = list(targets)
+    for key, targets in composite_targets.items():
+        dispatch_table.setdefault(key, []).extend(targets)
+    return dispatch_table
+
+
+COLOUR_DISPATCH = build_dispatch_table(widget_types=mod.RENDERED_PREVIEW_WIDGETS,
+                                       properties=COLOUR_PROPERTIES,
+                                       composite_targets=COMPOSITE_COLOUR_TARGETS,
+                                       remapped_properties=REMAPPED_PROPERTIES)
+GEOMETRY_DISPATCH = build_dispatch_table(widget_types=mod.RENDERED_PREVIEW_WIDGETS,
+                                         properties=GEOMETRY_PROPERTIES,
+                                         composite_targets=COMPOSITE_GEOMETRY_TARGETS)
 
 
 @log_call
 def update_widget_geometry(widget, widget_property, property_value):
-    if widget_property == 'corner_radius':
-        widget.configure(corner_radius=property_value)
-    elif widget_property == 'button_corner_radius':
-        # As of CTk 5.2.0 the configuring of button_corner_radius on CTkSlider causes an exception due to a bug.
-        # We trap this here, and hopefully this will be fixed soon.
+    if widget_property not in GEOMETRY_PROPERTIES:
+        return
+    try:
+        widget.configure(**{widget_property: property_value})
+    except ValueError:
+        if widget_property not in VALUE_ERROR_TOLERANT_OPTIONS:
+            raise
+
+
+def coalesce_commands(commands: list) -> list:
+    """Coalesce a list of commands, received within one frame interval. For the widget update commands, only the last
+    value sent for a given (command, widget_type, property) key is retained, at the position of that last command.
+    The relative order of the remaining commands is preserved. Any other command (e.g. a program command, such as
+    refresh or set_appearance_mode) acts as a barrier; we never coalesce across it.
+
+    :param commands: List of command dictionaries, in the order received.
+    :return: The coalesced list of command dictionaries."""
+    coalesced = []
+    latest_positions = {}
+    for command_json in commands:
+        command = command_json['command']
+        parameters = command_json.get('parameters') or []
+        # A malformed widget update (too few parameters) isn't coalesced; it fails, and is reported, when applied.
+        if command in COALESCED_COMMANDS and len(parameters) >= 2:
+            key = (command, parameters[0], parameters[1])
+            superseded_position = latest_positions.get(key)
+            if superseded_position is not None:
+                coalesced[superseded_position] = None
+            latest_positions[key] = len(coalesced)
+        else:
+            latest_positions.clear()
+        coalesced.append(command_json)
+    return [command_json for command_json in coalesced if command_json is not None]
+
+
+class RenderScheduler:
+    """Paces the application of pending changes to the preview, so that a burst of changes results in one render
+    pass, rather than one per change. With an interval (in milliseconds), passes run at that fixed rate, from a Tk
+    timer; this suits changes which arrive on another thread (e.g. the method listener), since that thread cannot
+    safely call into Tk. Without an interval, a pass is only run once Tk is idle, after a change is requested; this
+    must be requested from the Tk thread. Optionally, any pending redraws are forced, via update_idletasks, once per
+    pass."""
+
+    def __init__(self, widget, render_pass, interval: int = None, update_idletasks: bool = False):
+        self._widget = widget
+        self._render_pass = render_pass
+        self._interval = interval
+        self._update_idletasks = update_idletasks
+        self._after_id = None
+
+    def start(self):
+        """Start the fixed rate render passes. This is a no-op for idle time scheduling."""
+        if self._interval is not None and self._after_id is None:
+            self._after_id = self._widget.after(self._interval, self._tick)
+
+    def stop(self):
+        """Cancel any scheduled render pass."""
+        if self._after_id is not None:
+            self._widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    def request(self):
+        """Request a render pass. With idle time scheduling, the pass is scheduled (unless it already is), to run
+        once Tk is idle; at a fixed rate, the next timed pass picks up the pending changes."""
+        if self._interval is None and self._after_id is None:
+            self._after_id = self._widget.after_idle(self._tick)
+
+    def flush(self):
+        """Run a render pass now, rather than waiting for the scheduled one."""
+        if self._interval is None:
+            self.stop()
+        self._run_pass()
+
+    def _run_pass(self):
+        self._render_pass()
+        if self._update_idletasks:
+            self._widget.update_idletasks()
+
+    def _tick(self):
+        self._after_id = None
         try:
-            widget.configure(button_corner_radius=property_value)
-        except ValueError:
-            pass
-    elif widget_property == 'border_width':
-        widget.configure(border_width=property_value)
-    elif widget_property == 'border_width_unchecked':
-        widget.configure(border_width_unchecked=property_value)
-    elif widget_property == 'border_width_checked':
-        widget.configure(border_width_checked=property_value)
-    elif widget_property == 'button_length':
-        widget.configure(button_length=property_value)
+            self._run_pass()
+        finally:
+            self.start()
+
+
+class WidgetRegistry:
+    """Registry of the widgets rendered by the preview. Widgets are registered, under their widget group, as they are
+    rendered; registry[widget_group] returns the group's list of widgets, so that it can be appended to. Once
+    rendering is complete, build_index resolves the dispatch tables against the rendered widgets, so that each
+    (widget_type, widget_property) maps to exactly the (widget, configure option) pairs it updates, and each widget
+    maps back to the theme properties which are rendered on it."""
+
+    def __init__(self, widget_groups):
+        self._widget_groups = {widget_group: [] for widget_group in widget_groups}
+        self._index = {}
+        self._reverse_index = {}
+
+    def __getitem__(self, widget_group: str) -> list:
+        return self._widget_groups[widget_group]
+
+    def __iter__(self):
+        return iter(self._widget_groups)
+
+    def build_index(self, *dispatch_tables):
+        """Resolve the supplied dispatch tables, against the widgets rendered. Any widget registered more than once,
+        within a widget group, is only indexed once.
+
+        :param dispatch_tables: Dispatch tables, as returned by build_dispatch_table."""
+        self._index = {}
+        self._reverse_index = {}
+        for dispatch_table in dispatch_tables:
+            for key, targets in dispatch_table.items():
+                widget_targets = []
+                for widget_group, configure_option in targets:
+                    widgets = self._widget_groups.get(widget_group, ())
+                    for widget in dict.fromkeys(widgets):
+                        widget_targets.append((widget, configure_option))
+                        self._reverse_index.setdefault(widget, []).append((*key, configure_option))
+                if widget_targets:
+                    self._index[key] = widget_targets
+
+    def targets(self, widget_type: str, widget_property: str) -> list:
+        """Return the list of (widget, configure option) pairs, updated by the specified theme property."""
+        return self._index.get((widget_type, widget_property), [])
+
+    def theme_properties(self, widget) -> list:
+        """Return the list of (widget_type, widget_property, configure option) tuples, rendered on the specified
+        widget. If the widget is not registered (e.g. it is one of the Tk widgets making up a CustomTkinter widget),
+        we work back through its masters, to the nearest registered widget."""
+        while widget is not None:
+            if widget in self._reverse_index:
+                return self._reverse_index[widget]
+            widget = getattr(widget, 'master', None)
+        return []
 
 
 class PreviewPanel:
     PANEL_WIDTH = 800
     PANEL_HEIGHT = 740
 
-    def __init__(self, theme_file: str, appearance_mode: str = 'Dark'):
+    def __init__(self, theme_file: str, appearance_mode: str = 'Dark', master=None):
+        """Launch the preview panel. By default, the panel runs as its own process, with its own Tk main loop,
+        taking commands from the Control Panel via the method listener. If a master is supplied, the panel is instead
+        hosted in process, in a CTkToplevel, and commands are passed directly to dispatch_command.
+
+        Note that CustomTkinter's appearance mode and widget scaling are global to the process. So when hosted in
+        process, appearance mode changes also apply to the Control Panel, and preview scaling is not applied. The
+        colour theme is also global, but is only swapped in while the preview widgets are being built."""
         log.log_started(class_name='PreviewPanel', supplementary_text='Theme Builder Preview Panel launched')
         self._appearance_mode = appearance_mode
         self._theme_file = theme_file
-        ctk.set_default_color_theme(self._theme_file)
+        self._in_process = master is not None
+        self._control_panel_theme = None
         ctk.set_appearance_mode(self._appearance_mode)
 
         self.refresh_widgets = []
@@ -93,14 +305,6 @@ class PreviewPanel:
         self._palettes_dir = ASSETS_DIR / 'palettes'
         self._theme_json_dir = ASSETS_DIR / 'themes'
 
-        # If the listener file exists, we assume someone has gone a bit
-        # bonkers, hitting the 'Refresh Preview' button. Things
-        # got complicated under Windows controlling this stuff, so
-        # this is a bit of a basic control mechanism, to avoid having
-        # to engineer a network ACK.
-        if LISTENER_FILE.exists():
-            exit(0)
-
         self._config_file = self._CONFIG_DIR / 'ctk_theme_maker.ini'
 
         operating_system = platform.system()
@@ -140,7 +344,8 @@ class PreviewPanel:
         theme_name = os.path.basename(self._theme_file)
         self._theme_name = os.path.splitext(theme_name)[0]
 
-        self.preview = ctk.CTk()
+        with self._preview_theme():
+            self.preview = ctk.CTkToplevel(master) if self._in_process else ctk.CTk()
         icon_photo = tk.PhotoImage(file=APP_IMAGES / 'bear-logo-colour-dark.png')
         self.preview.iconphoto(False, icon_photo)
         self.img_selected = cbtk.load_image(light_image=APP_IMAGES / 'colour_wheel.png', image_size=(10, 10))
@@ -150,21 +355,49 @@ class PreviewPanel:
         self.preview.columnconfigure(0, weight=1)
         self.preview.rowconfigure(0, weight=1)
 
-        # The exec_widget_command event is generated by the _method_listener -> _handle_client methods.
-        self.preview.bind("<<exec_widget_command>>", self._exec_client_command)
-        self.render_preview_frames()
+        # Commands received by the _method_listener -> _handle_client methods (or by dispatch_command, when in
+        # process) are queued here. The queue is drained, in order, on the Tk main loop by _apply_queued_commands,
+        # once per render pass. Passes run at a fixed rate for the method listener, which runs on its own thread,
+        # and when Tk is next idle for the in process preview.
+        self._command_queue = queue.Queue()
+        # Forcing the redraws, after each pass, is a diagnostic aid (e.g. for latency measurements, which are then
+        # taken to the pixel), rather than a user choice, so the preview_update_idletasks preference is not offered
+        # in the Preferences dialogue.
+        update_idletasks = pref.preference_setting(db_file_path=DB_FILE_PATH, scope='user_preference',
+                                                   preference_name='preview_update_idletasks', default=0)
+        self._render_scheduler = RenderScheduler(widget=self.preview, render_pass=self._apply_queued_commands,
+                                                 interval=None if self._in_process else COMMAND_PUMP_INTERVAL,
+                                                 update_idletasks=bool(update_idletasks))
+        with self._preview_theme():
+            self.render_preview_frames()
+        if self._in_process:
+            return
         # Start the command listener. This will listen for commands sent by
         # the control panel, and carry out any requested instructions.
         self.start_method_listener()
+        self._render_scheduler.start()
         self.preview.mainloop()
 
+    @contextlib.contextmanager
+    def _preview_theme(self):
+        """Make the theme being previewed, CustomTkinter's current theme, whilst building widgets. When hosted in
+        process, the Control Panel's theme is restored afterwards, so that any widgets it subsequently creates, are
+        not styled from the previewed theme."""
+        saved_theme = ThemeManager.theme if self._in_process else None
+        ctk.set_default_color_theme(str(self._theme_file))
+        try:
+            yield
+        finally:
+            if saved_theme is not None:
+                ThemeManager.theme = saved_theme
+
     @log_call
     def render_preview_frames(self):
 
         ipadx = 10
         ipady = 50
-        # Initialise/re-initialise rendered widgets' dictionary.
-        self._rendered_widgets = copy.deepcopy(mod.RENDERED_PREVIEW_WIDGETS)
+        # Initialise/re-initialise the rendered widgets' registry.
+        self._rendered_widgets = WidgetRegistry(widget_groups=mod.RENDERED_PREVIEW_WIDGETS)
         self._rendered_widgets['CTk'].append(self.preview)
 
         for widget in self.refresh_widgets:
@@ -243,20 +476,20 @@ class PreviewPanel:
         self.frm_preview_base.columnconfigure(0, weight=1)
         self.frm_preview_base.rowconfigure(1, weight=1)
         self.frm_preview_top.columnconfigure(0, weight=1)
+        self._rendered_widgets.build_index(COLOUR_DISPATCH, GEOMETRY_DISPATCH)
 
     @log_call
     def _switch_theme(self, theme_file: Path):
         self._theme_file = theme_file
-        ctk.set_default_color_theme(str(self._theme_file))
-
-        self.render_preview_frames()
+        with self._preview_theme():
+            self.render_preview_frames()
 
     @log_call
     def _switch_appearance_mode(self, appearance_mode: str):
-        ctk.set_default_color_theme(self._theme_file)
         self._appearance_mode = appearance_mode
         ctk.set_appearance_mode(self._appearance_mode)
-        self.render_preview_frames()
+        with self._preview_theme():
+            self.render_preview_frames()
 
     @log_call
     def _render_frame_top_preview(self):
@@ -629,39 +862,41 @@ class PreviewPanel:
     @log_call
     def _save_preview_geometry(self):
         # save current geometry to the preferences
-        geometry_row = pref.preference_row(db_file_path=DB_FILE_PATH,
-                                           scope='window_geometry',
-                                           preference_name='preview_panel')
         panel_geometry = self.preview.geometry()
-        geometry_row["preference_value"] = panel_geometry
-        pref.upsert_preference(db_file_path=DB_FILE_PATH, preference_row_dict=geometry_row)
+        pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                     preference_values={('window_geometry', 'preview_panel'): panel_geometry})
 
     @log_call
-    def exec_program_command(self):
+    def exec_program_command(self, command_json: dict):
 
-        command_json = self._command_json
         command = command_json['command']
         if command == 'quit':
             self._save_preview_geometry()
             log.log_debug(log_text='Preview panel received quit command', class_name='PreviewPanel',
                           method_name='exec_program_command')
-            if LISTENER_FILE.exists():
-                os.remove(LISTENER_FILE)
-                log.log_debug('Listener file removed.')
             log.log_complete(class_name='PreviewPanel', supplementary_text='Theme Builder Preview Panel closed')
+            if self._in_process:
+                # We share the process with the Control Panel, so just close our window.
+                self.preview.destroy()
+                return
             exit(0)
         if command == 'refresh':
             log.log_debug(log_text='Preview panel received refresh command', class_name='PreviewPanel',
                           method_name='exec_program_command')
-            ctk.set_default_color_theme(self._theme_file)
             ctk.set_appearance_mode(self._appearance_mode)
             # So we need to call the render preview frames method. This
             # will destroy and rebuild the widgets.
-            self.render_preview_frames()
+            with self._preview_theme():
+                self.render_preview_frames()
             return
 
         parameters = command_json['parameters']
         # print(f'Command: {command} / Parameters: {parameters}')
+        if command == 'apply_theme_delta':
+            log.log_debug(log_text=f'Preview panel received apply_theme_delta command, with {len(parameters)} '
+                                   f'change(s)', class_name='PreviewPanel', method_name='exec_program_command')
+            self._apply_theme_delta(parameters)
+            return
         if command == 'set_appearance_mode':
             log.log_debug(log_text='Preview panel received set_appearance_mode command', class_name='PreviewPanel',
                           method_name='exec_program_command')
@@ -673,7 +908,12 @@ class PreviewPanel:
                           method_name='exec_program_command')
             scaling_pct = parameters[0]
             scaling_float = mod.scaling_float(scaling_pct)
-            ctk.set_widget_scaling(scaling_float)
+            if self._in_process:
+                # Widget scaling is process wide, so would rescale the Control Panel too.
+                log.log_debug(log_text=f'Widget scaling ({scaling_pct}) not applied to an in process preview',
+                              class_name='PreviewPanel', method_name='exec_program_command')
+            else:
+                ctk.set_widget_scaling(scaling_float)
         elif command == 'render_preview_disabled':
             log.log_debug(log_text='Preview panel received render_preview_disabled command', class_name='PreviewPanel',
                           method_name='exec_program_command')
@@ -690,10 +930,24 @@ class PreviewPanel:
             log.log_debug(log_text='Preview panel received render_base_frame command', class_name='PreviewPanel',
                           method_name='exec_program_command')
             self.render_base_frame()
+        elif command == 'ping':
+            # Nothing to do; the acknowledgement tells the sender that everything queued before it, has been applied.
+            pass
+
+    @log_call
+    def _apply_theme_delta(self, theme_delta: list):
+        """Apply the changes, between the theme last rendered and the current work in progress theme, by
+        reconfiguring just the affected widgets; the alternative being the full rebuild of a refresh. Each change is
+        a [command_type, widget_type, widget_property, value] list (see mod.theme_delta)."""
+        for command_type, widget_type, widget_property, value in theme_delta:
+            if command_type == 'colour':
+                self.update_widget_colour(widget_type, widget_property, value)
+            else:
+                self._exec_geometry_command({"command_type": command_type, "command": "update_widget_geometry",
+                                             "parameters": [widget_type, widget_property, value]})
 
     @log_call
-    def _exec_colour_command(self):
-        command_json = self._command_json
+    def _exec_colour_command(self, command_json: dict):
         command = command_json['command']
         if command == 'update_widget_colour':
             parameters = command_json['parameters']
@@ -707,10 +961,9 @@ class PreviewPanel:
                           method_name='exec_program_command')
 
     @log_call
-    def _exec_geometry_command(self):
+    def _exec_geometry_command(self, command_json: dict):
         """This method is responsible for updating widget geometry, based on commands JSON received from the
         Control Panel."""
-        command_json = self._command_json
         command = command_json['command']
         if command != 'update_widget_geometry':
             log.log_error(log_text=f'ERROR: Unrecognised method request: {command}', class_name='PreviewPanel',
@@ -722,18 +975,9 @@ class PreviewPanel:
         widget_property = parameters[1]
         property_value = parameters[2]
 
-        if widget_type == 'CTkFrame':
-            for widget in self._rendered_widgets['CTkFrame']:
-                update_widget_geometry(widget, widget_property, int(property_value))
-            if widget_property in ("corner_radius", "border_width"):
-                for widget in self._rendered_widgets['CTkScrollableFrame']:
-                    update_widget_geometry(widget, widget_property, int(property_value))
-                for widget in self._rendered_widgets['CTkTabview']:
-                    update_widget_geometry(widget, widget_property, int(property_value))
-
-        else:
-            for widget in self._rendered_widgets[widget_type]:
-                update_widget_geometry(widget, widget_property, int(property_value))
+        if (widget_type, widget_property) in GEOMETRY_DISPATCH:
+            for widget, configure_option in self._rendered_widgets.targets(widget_type, widget_property):
+                update_widget_geometry(widget, configure_option, int(property_value))
 
         # We contrive to always show a contrast of a button with and without a border.
         if widget_type == 'CTkButton' and widget_property == 'border_width':
@@ -773,37 +1017,133 @@ class PreviewPanel:
             if self._enable_tooltips:
                 self.entry_2_tooltip.configure(message=f'CTkEntry - with border setting of {second_border_width}')
 
+    def _apply_queued_commands(self):
+        """Drain the command queue on the Tk main loop, once per render pass (see RenderScheduler). Each queued
+        command is applied exactly once, and in the order received, subject to coalescing (see coalesce_commands).
+        The listener only ever puts to the queue, so it never blocks on Tk. Queue entries are (command, reply) pairs,
+        where reply sends a message back to the originating session; commands carrying a request id are
+        acknowledged, once applied (or superseded, via coalescing, or failed)."""
+        pending_commands = []
+        reply_routes = {}
+        while True:
+            try:
+                command_json, reply = self._command_queue.get_nowait()
+            except queue.Empty:
+                break
+            if command_json['command_type'] == BATCH_COMMAND_TYPE:
+                # A batch frame carries an ordered list of commands, which we apply within this one pass.
+                commands = command_json['parameters']
+            else:
+                commands = [command_json]
+            for command in commands:
+                if reply is not None and 'request_id' in command:
+                    reply_routes[id(command)] = reply
+            pending_commands.extend(commands)
+        acknowledged = set()
+        for command_json in coalesce_commands(pending_commands):
+            started = time.perf_counter()
+            status = mod.ACK_STATUS_APPLIED
+            try:
+                self._exec_command_json(command_json)
+            except Exception as exception:
+                # A failed command mustn't cost us the rest of the pass, nor leave its sender waiting on an ack.
+                log.log_error(log_text=f'Failed to apply command: {command_json}', class_name='PreviewPanel',
+                              method_name='_apply_queued_commands')
+                log.log_exception(exception)
+                status = mod.ACK_STATUS_FAILED
+            if id(command_json) in reply_routes:
+                acknowledged.add(id(command_json))
+                apply_ms = (time.perf_counter() - started) * 1000
+                self._acknowledge(command_json, reply_routes[id(command_json)], apply_ms, status)
+        for command_json in pending_commands:
+            if id(command_json) in reply_routes and id(command_json) not in acknowledged:
+                self._acknowledge(command_json, reply_routes[id(command_json)], 0, mod.ACK_STATUS_COALESCED)
+
+    def dispatch_command(self, command_json: dict, reply=None):
+        """Queue a command (or batch of commands), passed as a direct call, from the Tk thread; this is the entry
+        point for an in process preview. The command is applied on the next render pass, once Tk is idle, so that a
+        burst of commands is rendered in one pass. Commands carrying a request id are acknowledged via reply, once
+        applied."""
+        self._command_queue.put((command_json, reply))
+        self._render_scheduler.request()
+
+    def flush_commands(self):
+        """Apply any queued commands now, rather than on the next render pass."""
+        self._render_scheduler.flush()
+
+    @staticmethod
+    def _acknowledge(command_json: dict, reply, apply_ms: float, status: str):
+        reply({"command_type": "program", "command": ACK_MESSAGE,
+               "parameters": [command_json['request_id'], round(apply_ms, 3), status]})
+
+    def _reply_route(self, writer: asyncio.StreamWriter):
+        """Return a callable, which may be invoked from the Tk thread, to send a message back to the session
+        associated with the writer. The write itself, is handed over to the listener's event loop."""
+        def reply(message_json: dict):
+            send_length, message = mod.prepare_message(message_json)
+            try:
+                self._listener_loop.call_soon_threadsafe(self._write_reply, writer, send_length + message)
+            except RuntimeError:
+                # The event loop has been closed; we are on the way out.
+                pass
+        return reply
+
+    @staticmethod
+    def _write_reply(writer: asyncio.StreamWriter, frame: bytes):
+        if not writer.is_closing():
+            writer.write(frame)
+
     @log_call
-    def _exec_client_command(self, evt):
-        command_json = self._command_json
+    def _exec_command_json(self, command_json: dict):
         command_type = command_json['command_type']
 
         if command_type == 'program':
-            self.exec_program_command()
+            self.exec_program_command(command_json)
         # print('Calling exec_program_command')
         elif command_type == 'colour':
             # print('Calling exec_colour_command')
-            self._exec_colour_command()
+            self._exec_colour_command(command_json)
         elif command_type == 'geometry':
             # print('Calling exec_geometry_command')
-            self._exec_geometry_command()
+            self._exec_geometry_command(command_json)
 
-    @log_call
-    def _handle_client(self, conn, address: str):
-        """Here, handle client, expects a header frame, followed by a command frame.
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Here, handle client, expects a header frame (or compact prefix), followed by a command frame.
         The header frame tells us how long the content of the subsequent command
-        frame is. We then unpack the command frame and pass the contents to be
-        processed, by the process_client_command function."""
-        # print(f'[ NEW_CONNECTION ] {address} connected')
-        connected = True
-
-        while connected:
-            header_frame = conn.recv(HEADER_SIZE).decode(ENCODING_FORMAT)
-            # print(f'[ HEADER_FRAME ] <{header_frame}>')
-            if header_frame:
-                msg_length = int(header_frame)
-                command_json_str = conn.recv(msg_length).decode(ENCODING_FORMAT)
-                command_json = json.loads(command_json_str)
+        frame is. We then unpack the command frame and queue the contents to be
+        processed, on the Tk main loop. The Control Panel keeps
+        its session open, for the lifetime of the preview panel, so we loop here until
+        we either receive a disconnect command, or the connection is closed. All sessions are served by
+        the one event loop, so any number of senders can feed the preview panel at once."""
+        address = writer.get_extra_info('peername')
+        self._client_writers.add(writer)
+        reply = self._reply_route(writer)
+        # Let the Control Panel know that we are up and serving requests.
+        send_length, message = mod.prepare_message(READY_JSON)
+        try:
+            writer.write(send_length + message)
+            await writer.drain()
+            connected = True
+        except OSError:
+            connected = False
+
+        try:
+            while connected:
+                try:
+                    command_json_str = await mod.read_message(reader)
+                except (OSError, ValueError) as error:
+                    log.log_warning(log_text=f'[{address}] Dropping session, on receive error: {error}',
+                                    class_name='PreviewPanel', method_name='_handle_client')
+                    command_json_str = None
+                if command_json_str is None:
+                    # The client went away, without saying goodbye.
+                    break
+                try:
+                    command_json = json.loads(command_json_str)
+                except json.JSONDecodeError as error:
+                    log.log_warning(log_text=f'[{address}] Skipping malformed command frame: {error}',
+                                    class_name='PreviewPanel', method_name='_handle_client')
+                    continue
                 # print(command_json)
                 command_type = command_json['command_type']
                 command = command_json['command']
@@ -811,211 +1151,74 @@ class PreviewPanel:
                 if command == DISCONNECT_MESSAGE and command_type == 'program':
                     if DEBUG:
                         log.log_debug(f'[{address}] Session disconnected')
-                    if conn in self._client_handlers:
-                        del self._client_handlers[conn]
                     connected = False
                 else:
-                    self._command_json = command_json
-                    self.preview.event_generate('<<exec_widget_command>>', when='tail')
-
-        conn.close()
-        return
+                    self._command_queue.put((command_json, reply))
+        finally:
+            self._client_writers.discard(writer)
+            writer.close()
+
+    def _method_listener(self, server):
+        """Run the listener's event loop; this is the only listener thread, however many clients connect. Sessions
+        are accepted on the (already bound) server socket, and each is served by the handle_client coroutine."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._listener_loop = loop
+        if server.family == getattr(socket, 'AF_UNIX', None):
+            start_server = asyncio.start_unix_server(self._handle_client, sock=server)
+        else:
+            start_server = asyncio.start_server(self._handle_client, sock=server)
+        loop.run_until_complete(start_server)
+        log.log_debug(log_text='Waiting for client requests...', class_name='PreviewPanel',
+                      method_name='_method_listener')
+        loop.run_forever()
 
     @log_call
-    def _method_listener(self):
-        """Initialise our listener's client_handlers dictionary. This will keep track of connected
-        sessions (there should normally be only one). Each incoming request, is handed off to the
-        handle_client function.
-        """
-        global listener_status
-        self._client_handlers = {}
-        log.log_info(log_text=f"Starting method listener on port {METHOD_LISTENER_PORT}...",
-                     class_name='PreviewPanel', method_name='_method_listener')
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def start_method_listener(self):
+        """Bind the listener socket, here on the main thread, so that any failure is reported immediately, rather
+        than after an arbitrary wait. Once we are listening, connections are queued by the operating system, so the
+        Control Panel can connect straight away; it then waits for our ready message. We keep track of connected
+        sessions (there is normally only one) in the client_writers set."""
+        self._client_writers = set()
+        self._listener_loop = None
+        self._listener_transport = mod.listener_transport()
+        listener_description = self._listener_transport.describe()
+        log.log_info(log_text=f"Starting method listener on {listener_description}...",
+                     class_name='PreviewPanel', method_name='start_method_listener')
         try:
-            server.bind(METHOD_LISTENER_ADDRESS)
+            server = self._listener_transport.listen()
         except OSError:
-            log.log_critical(f'Preview Panel, socket bind error.',
-                             class_name='PreviewPanel', method_name='_method_listener')
-
-            log.log_supplementary('Ensure that no other instances of CTk Theme Builder '
-                                  f'are running and that port {METHOD_LISTENER_PORT} is free.')
-
             log.log_exception(OSError)
-            listener_status = -1
-            raise
-        server.listen()
-        # current dateTime
-        now = datetime.now()
-        # convert to string
-        date_started = now.strftime("%b %d %Y %H:%M:%S")
-        log.log_debug(log_text='Preview Panel: Checking for listener file...',
-                      class_name='PreviewPanel', method_name='_method_listener')
-        if not LISTENER_FILE.exists():
-            log.log_debug('Preview Panel: Listener file missing, creating...',
-                          class_name='PreviewPanel', method_name='_method_listener')
-            with open(LISTENER_FILE, 'w') as f:
-                pid = os.getpid()
-                f.write(f'[{pid}] CTk Theme Builder listener started at: {date_started}')
-            log.log_info(f'Method listener successfully started',
-                         class_name='PreviewPanel', method_name='_method_listener')
-        while True:
-            log.log_debug(log_text='Waiting for a client request...', class_name='PreviewPanel',
-                          method_name='_method_listener')
-            conn, address = server.accept()
-            client_thread = threading.Thread(target=self._handle_client,
-                                             args=(conn, address),
-                                             daemon=True)
-            client_thread.start()
-            self._client_handlers[conn] = client_thread
-            # print(f'Client handlers: {self._client_handlers[conn]}')
-            # Here we subtract two from the thread count. We don't count the listener or the main thread as clients.
-            # print(f'[ ACTIVE CONNECTIONS ] {threading.active_count() - 2}')
-
-    @staticmethod
-    @log_call
-    def _prepare_message(message):
-
-        message = message.encode(ENCODING_FORMAT)
-        msg_length = len(message)
-        send_length = str(msg_length).encode(ENCODING_FORMAT)
-        send_length += b' ' * (HEADER_SIZE - len(send_length))
-        return send_length, message
-
-    @log_call
-    def start_method_listener(self):
-        listener_thread = threading.Thread(target=self._method_listener, daemon=True)
-        listener_thread.start()
-        # Give the listener time to attempt to attach to the socket,
-        # and report if it has a problem.
-        time.sleep(0.1)
-        if listener_status == -1:
             confirm = CTkMessagebox(
                 title='Socket Error',
-                message=f'The listener failed to bind to port {METHOD_LISTENER_PORT}\n\n'
+                message=f'The listener failed to bind to {listener_description}\n\n'
                         f'Ensure that only one instance of {__title__} is running and that no '
-                        f'other process is using the port.',
+                        f'other process is using the {self._listener_transport.name} address.',
                 option_1='OK')
-            log.log_critical(log_text=f'The listener failed to bind to port {METHOD_LISTENER_PORT}\n\n',
+            log.log_critical(log_text=f'The listener failed to bind to {listener_description}\n\n',
                              class_name='PreviewPanel', method_name='start_method_listener')
             log.log_supplementary(f'Ensure that only one instance of {__title__} is running and that no '
-                                  f'other process is using the port.')
-            if confirm.get() == 'OK':
-                exit(1)
+                                  f'other process is using the {self._listener_transport.name} address.')
+            confirm.get()
+            exit(1)
+        # Remove any socket file, when we exit.
+        atexit.register(self._listener_transport.cleanup)
+        listener_thread = threading.Thread(target=self._method_listener, args=(server,), daemon=True)
+        listener_thread.start()
+        log.log_info(f'Method listener successfully started',
+                     class_name='PreviewPanel', method_name='start_method_listener')
 
     @log_call
     def update_widget_colour(self, widget_type, widget_property, widget_colour):
+        """Apply a colour change to every rendered widget it affects, including composite widgets, which share the
+        property with other widget types (see COLOUR_DISPATCH). The
+        affected widgets are looked up in the rendered widgets' registry."""
         # print(f'Updating widget colour {widget_type} / {widget_property} / {widget_colour}')
-        if widget_type == 'CTkFrame' and widget_property not in ['fg_color', 'top_fg_color']:
-            for widget in self._rendered_widgets['CTkScrollableFrame']:
-                widget.configure(border_color=widget_colour)
-            for widget in self._rendered_widgets['CTkTabview']:
-                widget.configure(border_color=widget_colour)
-
-        if widget_type == 'CTkFrame' and widget_property == 'top_fg_color':
-            widget_type = 'frame_top'
-            widget_property = 'fg_color'
-        elif widget_type == 'CTkFrame' and widget_property == 'fg_color':
-            widget_type = 'frame_base'
-
-        for widget in self._rendered_widgets[widget_type]:
-            # print(f'Updating {widget_property} for widget of type "{widget_type}"')
-            if widget_property == 'border_color':
-                widget.configure(border_color=widget_colour)
-            elif widget_property == 'button_color':
-                widget.configure(button_color=widget_colour)
-            elif widget_property == 'button_hover_color':
-                widget.configure(button_hover_color=widget_colour)
-            elif widget_property == 'checkmark_color':
-                widget.configure(checkmark_color=widget_colour)
-            elif widget_property == 'fg_color':
-                widget.configure(fg_color=widget_colour)
-            elif widget_property == 'hover_color':
-                widget.configure(hover_color=widget_colour)
-            elif widget_property == 'label_fg_color':
-                widget.configure(label_fg_color=widget_colour)
-            elif widget_property == 'placeholder_text_color':
-                widget.configure(placeholder_text_color=widget_colour)
-            elif widget_property == 'progress_color':
-                widget.configure(progress_color=widget_colour)
-            elif widget_property == 'scrollbar_button_color':
-                widget.configure(scrollbar_button_color=widget_colour)
-            elif widget_property == 'scrollbar_button_hover_color':
-                widget.configure(scrollbar_button_hover_color=widget_colour)
-            elif widget_property == 'selected_color':
-                widget.configure(selected_color=widget_colour)
-            elif widget_property == 'selected_hover_color':
-                widget.configure(selected_hover_color=widget_colour)
-            elif widget_property == 'text_color':
-                widget.configure(text_color=widget_colour)
-            elif widget_property == 'text_color_disabled':
-                widget.configure(text_color_disabled=widget_colour)
-            elif widget_property == 'unselected_color':
-                widget.configure(unselected_color=widget_colour)
-            elif widget_property == 'unselected_hover_color':
-                widget.configure(unselected_hover_color=widget_colour)
-            else:
-                log.log_warning(f'Unrecognised widget property: {widget_property}')
-        # Now deal with composite widgets, which share properties with other widget types.
-        # Scrollable Frames
-        if widget_type == 'frame_base':
-            for widget in self._rendered_widgets['CTkScrollableFrame']:
-                if widget_property == 'fg_color':
-                    widget.configure(fg_color=widget_colour)
-                elif widget_property == 'border_color':
-                    widget.configure(border_color=widget_colour)
-            for widget in self._rendered_widgets['CTkTabview']:
-                if widget_property == 'fg_color':
-                    widget.configure(fg_color=widget_colour)
-                    # Temporary work-around for CustomTkinter issue #1803
-                    # for tabs in widget._tab_dict.values():
-                    #    tabs.configure(fg_color=widget_colour, bg_color=widget_colour)
-                elif widget_property == 'border_color':
-                    widget.configure(border_color=widget_colour)
-
-        elif widget_type == 'CTkScrollbar' and widget_property in ('fg_color', 'button_color',
-                                                                   'button_hover_color'):
-            for widget in self._rendered_widgets['CTkScrollableFrame']:
-                if widget_property == 'fg_color':
-                    widget.configure(scrollbar_fg_color=widget_colour)
-                elif widget_property == 'button_color':
-                    widget.configure(scrollbar_button_color=widget_colour)
-                elif widget_property == 'button_hover_color':
-                    widget.configure(scrollbar_button_hover_color=widget_colour)
-            for widget in self._rendered_widgets['CTkTextbox']:
-                if widget_property == 'fg_color':
-                    widget.configure(scrollbar_fg_color=widget_colour)
-                elif widget_property == 'button_color':
-                    widget.configure(scrollbar_button_color=widget_colour)
-                elif widget_property == 'button_hover_color':
-                    widget.configure(scrollbar_button_hover_color=widget_colour)
-        elif widget_type == 'CTkLabel' and widget_property in ('fg_color', 'text_color'):
-            # TODO: print('Updating CTkScrollableFrame objects...')
-            for widget in self._rendered_widgets['CTkScrollableFrame']:
-                if widget_property == 'fg_color':
-                    widget.configure(label_fg_color=widget_colour)
-                elif widget_property == 'text_color':
-                    widget.configure(label_text_color=widget_colour)
-        elif widget_type == 'CTkFrame':
-            for widget in self._rendered_widgets['CTkTabview']:
-                if widget_property == 'fg_color':
-                    widget.configure(fg_color=widget_colour)
-        elif widget_type == 'CTkSegmentedButton':
-            for widget in self._rendered_widgets['CTkTabview']:
-                if widget_property == 'fg_color':
-                    widget.configure(segmented_button_fg_color=widget_colour)
-                elif widget_property == 'selected_color':
-                    widget.configure(segmented_button_selected_color=widget_colour)
-                elif widget_property == 'selected_hover_color':
-                    widget.configure(segmented_button_selected_hover_color=widget_colour)
-                elif widget_property == 'unselected_hover_color':
-                    widget.configure(segmented_button_unselected_hover_color=widget_colour)
-                elif widget_property == 'unselected_color':
-                    widget.configure(segmented_button_unselected_color=widget_colour)
-                elif widget_property == 'text_color':
-                    widget.configure(text_color=widget_colour)
-                elif widget_property == 'text_color_disabled':
-                    widget.configure(text_color_disabled=widget_colour)
+        if (widget_type, widget_property) not in COLOUR_DISPATCH:
+            log.log_warning(f'Unrecognised widget property: {widget_property}')
+            return
+        for widget, configure_option in self._rendered_widgets.targets(widget_type, widget_property):
+            widget.configure(**{configure_option: widget_colour})
 
 
 if __name__ == "__main__":
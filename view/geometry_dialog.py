@@ -516,9 +516,6 @@ class GeometryDialog(ctk.CTkToplevel):
     @log_call
     def save_widget_geom_geometry(self):
         """Save the widget geometry dialog's geometry to the repo, for the next time the dialog is launched."""
-        geometry_row = pref.preference_row(db_file_path=DB_FILE_PATH,
-                                           scope='window_geometry',
-                                           preference_name='widget_geometry')
         panel_geometry = self.geometry()
-        geometry_row["preference_value"] = panel_geometry
-        pref.upsert_preference(db_file_path=DB_FILE_PATH, preference_row_dict=geometry_row)
+        pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                     preference_values={('window_geometry', 'widget_geometry'): panel_geometry})
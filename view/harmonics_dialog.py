@@ -403,12 +403,9 @@ class HarmonicsDialog(ctk.CTkToplevel):
         log.log_debug(log_text='Save harmonics display geometry',
                       class_name='HarmonicsDialog',
                       method_name='save_harmonics_geometry')
-        geometry_row = pref.preference_row(db_file_path=DB_FILE_PATH,
-                                           scope='window_geometry',
-                                           preference_name='harmonics_panel')
         panel_geometry = self.geometry()
-        geometry_row["preference_value"] = panel_geometry
-        pref.upsert_preference(db_file_path=DB_FILE_PATH, preference_row_dict=geometry_row)
+        pref.queue_preference_values(db_file_path=DB_FILE_PATH,
+                                     preference_values={('window_geometry', 'harmonics_panel'): panel_geometry})
 
     @log_call
     def close_harmonics(self, event=None):
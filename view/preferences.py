@@ -5,6 +5,7 @@ from model.ctk_theme_builder import log_call
 import customtkinter as ctk
 import tkinter as tk
 import platform
+import socket
 import os
 from CTkToolTip import *
 import utils.cbtk_kit as cbtk
@@ -22,6 +23,15 @@ PADX = 5
 # Non-frame widgets to right of first widget
 RPADX = (20, PADX)
 
+# Listener Transport drop-down selections, mapped to the listener_transport preference values. Unix domain sockets
+# are only offered, where the platform supports them.
+LISTENER_TRANSPORT_DISP = {mod.AUTO_TRANSPORT: 'Auto', mod.TCP_TRANSPORT: 'TCP'}
+if hasattr(socket, 'AF_UNIX'):
+    LISTENER_TRANSPORT_DISP[mod.UNIX_TRANSPORT] = 'Unix Socket'
+
+# Preview Mode drop-down selections, mapped to the preview_mode preference values.
+PREVIEW_MODE_DISP = {mod.SUBPROCESS_PREVIEW: 'Subprocess', mod.IN_PROCESS_PREVIEW: 'In Process'}
+
 # Frame padding
 FRM_PADX = 10
 # Frames to right of left-most frame
@@ -97,10 +107,21 @@ class PreferencesDialog(ctk.CTkToplevel):
                                                      scope='user_preference',
                                                      preference_name='listener_port')
 
+        self.listener_transport = pref.preference_setting(db_file_path=DB_FILE_PATH,
+                                                          scope='user_preference',
+                                                          preference_name='listener_transport',
+                                                          default=mod.AUTO_TRANSPORT)
+        if self.listener_transport not in LISTENER_TRANSPORT_DISP:
+            self.listener_transport = mod.AUTO_TRANSPORT
+
         self.qa_application_scaling = pref.preference_setting(db_file_path=DB_FILE_PATH,
                                                               scope='scaling',
                                                               preference_name='qa_application')
 
+        self.preview_mode = mod.preview_mode()
+        self.enable_standby_preview = int(mod.standby_preview_enabled())
+        self.enable_preview_acks = int(mod.preview_acks_enabled())
+
         log_level = pref.preference_setting(scope='logger', preference_name='log_level', default="Info")
 
         self.log_level = log_level.upper()
@@ -388,10 +409,33 @@ class PreferencesDialog(ctk.CTkToplevel):
                                                            "run multiple instances of the application. Each instance "
                                                            "with its own port number.")
 
+        lbl_listener_transport = ctk.CTkLabel(master=frm_comms, text='Transport', justify="right")
+        lbl_listener_transport.grid(row=2, column=0, padx=5, pady=10, sticky='w')
+
+        self.opm_listener_transport = ctk.CTkOptionMenu(master=frm_comms,
+                                                        width=12,
+                                                        values=list(LISTENER_TRANSPORT_DISP.values()))
+        self.opm_listener_transport.grid(row=2, column=1, padx=(5, 100), pady=10, sticky='w')
+        self.opm_listener_transport.set(LISTENER_TRANSPORT_DISP[self.listener_transport])
+
+        if self.enable_tooltips:
+            CTkToolTip(lbl_listener_transport,
+                       wraplength=400,
+                       justify='left',
+                       border_width=1,
+                       padding=(10, 10),
+                       corner_radius=6,
+                       message="Choose how the Control Panel talks to the Preview Panel. Auto uses a Unix domain "
+                               "socket on Linux, and TCP (on the Listener Port) elsewhere. Select TCP, if the socket "
+                               "file cannot be created, for example on a read-only temporary directory."
+                               "\n\n"
+                               "Any changes will not take effect until after you "
+                               "re-start the application.")
+
         # Themes frame
         frm_themes = ctk.CTkFrame(master=frm_main, corner_radius=10)
         frm_themes.grid(column=0, row=3,
-                        padx=FRM_PADX, pady=FRM_BPADY,
+                        padx=FRM_PADX, pady=FRM_PADY,
                         sticky='nsew')
         lbl_behaviour = ctk.CTkLabel(master=frm_themes, text='User Themes', justify="right", font=mod.HEADING4)
         lbl_behaviour.grid(row=0, column=0, padx=5, pady=(5, 5), sticky='w')
@@ -424,7 +468,7 @@ class PreferencesDialog(ctk.CTkToplevel):
         # Logging frame
         frm_logging = ctk.CTkFrame(master=frm_main, corner_radius=10)
         frm_logging.grid(column=1, row=3,
-                         padx=FRM_RPADX, pady=FRM_BPADY,
+                         padx=FRM_RPADX, pady=FRM_PADY,
                          sticky='nsew')
         lbl_logging = ctk.CTkLabel(master=frm_logging, text='Logging', justify="right", font=mod.HEADING4)
         lbl_logging.grid(row=0, column=0, padx=5, pady=(5, 5), sticky='w')
@@ -489,6 +533,80 @@ class PreferencesDialog(ctk.CTkToplevel):
                    corner_radius=6,
                    message=f"Clear down the runtime log, which is located at:\n {logutl.LOG_DIR / logutl.RUNTIME_LOG}")
 
+        # Preview frame
+        frm_preview = ctk.CTkFrame(master=frm_main, corner_radius=10)
+        frm_preview.grid(column=0, row=4,
+                         padx=FRM_PADX, pady=FRM_BPADY,
+                         columnspan=2, sticky='nsew')
+        lbl_preview = ctk.CTkLabel(master=frm_preview, text='Preview', justify="right", font=mod.HEADING4)
+        lbl_preview.grid(row=0, column=0, padx=5, pady=(5, 5), sticky='w')
+
+        lbl_preview_mode = ctk.CTkLabel(master=frm_preview, text='Preview Mode', justify="right")
+        lbl_preview_mode.grid(row=1, column=0, padx=PADX, pady=10, sticky='e')
+
+        if self.enable_tooltips:
+            CTkToolTip(lbl_preview_mode,
+                       wraplength=400,
+                       justify="left",
+                       border_width=1,
+                       padding=(10, 10),
+                       corner_radius=6,
+                       message="Choose how the Preview Panel is hosted. By default (Subprocess), it runs as a "
+                               "separate program, which keeps the theme being previewed well away from the Control "
+                               "Panel's own theme. Select In Process, to host it in a window of the Control Panel "
+                               "instead; this starts more quickly and avoids the socket comms altogether."
+                               "\n\n"
+                               "Any change takes effect, the next time the Preview Panel is launched.")
+
+        self.opm_preview_mode = ctk.CTkOptionMenu(master=frm_preview,
+                                                  width=12,
+                                                  values=list(PREVIEW_MODE_DISP.values()))
+        self.opm_preview_mode.grid(row=1, column=1, padx=PADX, pady=10, sticky='w')
+        self.opm_preview_mode.set(PREVIEW_MODE_DISP[self.preview_mode])
+
+        self.tk_enable_standby_preview = tk.IntVar(master=frm_preview)
+        self.tk_enable_standby_preview.set(self.enable_standby_preview)
+        self.swt_enable_standby_preview = ctk.CTkSwitch(master=frm_preview,
+                                                        text='Standby Preview',
+                                                        variable=self.tk_enable_standby_preview,
+                                                        command=self.get_standby_preview_setting)
+        self.swt_enable_standby_preview.grid(row=1, column=2, padx=RPADX, pady=10, sticky='w')
+
+        if self.enable_tooltips:
+            CTkToolTip(self.swt_enable_standby_preview,
+                       wraplength=400,
+                       justify="left",
+                       border_width=1,
+                       padding=(10, 10),
+                       corner_radius=6,
+                       message="When enabled, a second Preview Panel process is kept waiting in the background, "
+                               "so that a preview reload (for example, on opening another theme) is near instant. "
+                               "Disable this to save the memory it takes up. It only applies to the Subprocess "
+                               "Preview Mode."
+                               "\n\n"
+                               "Any change takes effect, the next time the Preview Panel is launched.")
+
+        self.tk_enable_preview_acks = tk.IntVar(master=frm_preview)
+        self.tk_enable_preview_acks.set(self.enable_preview_acks)
+        self.swt_enable_preview_acks = ctk.CTkSwitch(master=frm_preview,
+                                                     text='Preview Latency',
+                                                     variable=self.tk_enable_preview_acks,
+                                                     command=self.get_preview_acks_setting)
+        self.swt_enable_preview_acks.grid(row=1, column=3, padx=RPADX, pady=10, sticky='w')
+
+        if self.enable_tooltips:
+            CTkToolTip(self.swt_enable_preview_acks,
+                       wraplength=400,
+                       justify="left",
+                       border_width=1,
+                       padding=(10, 10),
+                       corner_radius=6,
+                       message="When enabled, the Preview Panel acknowledges each widget update, so that the "
+                               "round trip latency can be recorded, and reviewed via Tools > Preview Latency."
+                               "\n\n"
+                               "Any changes will not take effect until after you "
+                               "re-start the application.")
+
         # Dialog buttons frame
         frm_buttons = ctk.CTkFrame(master=frm_main, corner_radius=0)
         frm_buttons.grid(column=0, row=10, padx=0, pady=(0, 0), columnspan=2, sticky='ew')
@@ -557,6 +675,14 @@ class PreferencesDialog(ctk.CTkToplevel):
     def get_single_click_paste_setting(self):
         self.enable_single_click_paste = int(self.tk_enable_single_click_paste.get())
 
+    @log_call
+    def get_standby_preview_setting(self):
+        self.enable_standby_preview = int(self.tk_enable_standby_preview.get())
+
+    @log_call
+    def get_preview_acks_setting(self):
+        self.enable_preview_acks = int(self.tk_enable_preview_acks.get())
+
     @log_call
     def save_preferences(self):
         """Save the selected preferences."""
@@ -566,77 +692,69 @@ class PreferencesDialog(ctk.CTkToplevel):
         log.log_debug(log_text='Save preferences and close dialogue',
                       class_name='PreferencesDialog',
                       method_name='save_preferences')
+        # Gather the preference changes, so that we can save them in a single transaction.
+        preference_values = {}
         if str(self.new_theme_json_dir) != '.':
             self.theme_json_dir = self.new_theme_json_dir
-            if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                               preference_name='theme_json_dir',
-                                               preference_value=str(self.theme_json_dir)):
-                print(f'Row miss updating preferences: user_preference > theme_json_dir')
-            self.json_files = mod.user_themes_list()
-            # TODO: Implement signal to improve this
-            self.master.opm_theme.configure(values=self.json_files)
+            preference_values[('user_preference', 'theme_json_dir')] = str(self.theme_json_dir)
 
         self.user_name = self.tk_author_name.get()
-
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='theme_author', preference_value=self.user_name):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > theme_author')
-
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='control_panel_theme',
-                                           preference_value=self.opm_control_panel_theme.get()):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > control_panel_theme')
+        preference_values[('user_preference', 'theme_author')] = self.user_name
+        preference_values[('user_preference', 'control_panel_theme')] = self.opm_control_panel_theme.get()
 
         control_panel_mode = self.tk_appearance_mode_var.get()
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='control_panel_mode',
-                                           preference_value=control_panel_mode):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > control_panel_mode')
-
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='enable_tooltips',
-                                           preference_value=self.enable_tooltips):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > enable_tooltips')
-
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='confirm_cascade',
-                                           preference_value=self.confirm_cascade):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > confirm_cascade')
-
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='last_theme_on_start',
-                                           preference_value=self.last_theme_on_start):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > last_theme_on_start')
-
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='enable_palette_labels',
-                                           preference_value=self.enable_palette_labels):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > enable_palette_labels')
-
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='enable_single_click_paste',
-                                           preference_value=self.enable_single_click_paste):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > enable_single_click_paste')
+        preference_values[('user_preference', 'control_panel_mode')] = control_panel_mode
+        preference_values[('user_preference', 'enable_tooltips')] = self.enable_tooltips
+        preference_values[('user_preference', 'confirm_cascade')] = self.confirm_cascade
+        preference_values[('user_preference', 'last_theme_on_start')] = self.last_theme_on_start
+        preference_values[('user_preference', 'enable_palette_labels')] = self.enable_palette_labels
+        preference_values[('user_preference', 'enable_single_click_paste')] = self.enable_single_click_paste
 
         self.shade_adjust_differential = self.opm_shade_adjust_differential.get()
         self.shade_adjust_differential = int(self.shade_adjust_differential)
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='shade_adjust_differential',
-                                           preference_value=self.shade_adjust_differential):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > shade_adjust_differential')
+        preference_values[('user_preference', 'shade_adjust_differential')] = self.shade_adjust_differential
 
         self.harmony_contrast_differential = self.opm_harmony_contrast_differential.get()
         self.harmony_contrast_differential = int(self.harmony_contrast_differential)
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='harmony_contrast_differential',
-                                           preference_value=self.harmony_contrast_differential):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > harmony_contrast_differential')
+        preference_values[('user_preference', 'harmony_contrast_differential')] = self.harmony_contrast_differential
 
         control_panel_scaling_pct = self.opm_control_panel_scaling.get()
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='scaling',
-                                           preference_name='control_panel',
-                                           preference_value=control_panel_scaling_pct):
-            log.log_error(log_text=f'Row miss updating preferences: scaling > control_panel')
+        preference_values[('scaling', 'control_panel')] = control_panel_scaling_pct
+        preview_panel_scale_pct = self.opm_preview_panel_scaling.get()
+        preference_values[('scaling', 'preview_panel')] = preview_panel_scale_pct
+        qa_application_scale_pct = self.opm_qa_application_scaling.get()
+        preference_values[('scaling', 'qa_application')] = qa_application_scale_pct
+
+        preference_values[('user_preference', 'listener_port')] = self.opm_listener_port.get()
+        preference_values[('logger', 'log_level')] = self.opm_log_level.get().upper()
+        preference_values[('logger', 'log_stderr')] = self.opm_log_stderr.get()
+
+        for scope, preference_name in mod.update_preference_values(db_file_path=DB_FILE_PATH,
+                                                                   preference_values=preference_values):
+            log.log_error(log_text=f'Row miss updating preferences: {scope} > {preference_name}')
+
+        # The Preview preferences (and the listener transport) post-date the repositories of some earlier installs,
+        # so we upsert these.
+        preview_mode = {disp: mode for mode, disp in PREVIEW_MODE_DISP.items()}[self.opm_preview_mode.get()]
+        listener_transport = {disp: transport
+                              for transport, disp in LISTENER_TRANSPORT_DISP.items()}[self.opm_listener_transport.get()]
+        preview_preferences = [pref.new_preference_dict(scope='user_preference', preference_name='preview_mode',
+                                                        data_type='str', preference_value=preview_mode),
+                               pref.new_preference_dict(scope='user_preference',
+                                                        preference_name='enable_standby_preview',
+                                                        data_type='int', preference_value=self.enable_standby_preview),
+                               pref.new_preference_dict(scope='user_preference',
+                                                        preference_name='enable_preview_acks',
+                                                        data_type='int', preference_value=self.enable_preview_acks),
+                               pref.new_preference_dict(scope='user_preference', preference_name='listener_transport',
+                                                        data_type='str', preference_value=listener_transport)]
+        pref.upsert_preferences(db_file_path=DB_FILE_PATH, preference_row_dicts=preview_preferences)
+
+        if ('user_preference', 'theme_json_dir') in preference_values:
+            self.json_files = mod.user_themes_list()
+            # TODO: Implement signal to improve this
+            self.master.opm_theme.configure(values=self.json_files)
+
         if control_panel_scaling_pct != self.master.control_panel_scaling_pct:
             scaling_float = mod.scaling_float(scale_pct=control_panel_scaling_pct)
             ctk.set_widget_scaling(scaling_float)
@@ -644,42 +762,12 @@ class PreferencesDialog(ctk.CTkToplevel):
             # TODO: Implement signal to improve this
             self.master.geometry('960x870')
 
-        preview_panel_scale_pct = self.opm_preview_panel_scaling.get()
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='scaling',
-                                           preference_name='preview_panel',
-                                           preference_value=preview_panel_scale_pct):
-            log.log_error(log_text=f'Row miss updating preferences: scaling > preview_panel')
-
         if preview_panel_scale_pct != self.master.preview_panel_scaling_pct and self.master.theme:
             self.master.preview_panel_scaling_pct = preview_panel_scale_pct
             mod.send_command_json(command_type='program',
                                   command='set_widget_scaling',
                                   parameters=[preview_panel_scale_pct])
 
-        qa_application_scale_pct = self.opm_qa_application_scaling.get()
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='scaling',
-                                           preference_name='qa_application',
-                                           preference_value=qa_application_scale_pct):
-            log.log_error(log_text=f'Row miss updating preferences: scaling > qa_application')
-
-        listener_port = self.opm_listener_port.get()
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='user_preference',
-                                           preference_name='listener_port',
-                                           preference_value=listener_port):
-            log.log_error(log_text=f'Row miss updating preferences: user_preference > listener port')
-
-        log_level = self.opm_log_level.get()
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='logger',
-                                           preference_name='log_level',
-                                           preference_value=log_level.upper()):
-            log.log_error(log_text=f'Row miss updating logger > log_level')
-
-        log_stderr = self.opm_log_stderr.get()
-        if not mod.update_preference_value(db_file_path=DB_FILE_PATH, scope='logger',
-                                           preference_name='log_stderr',
-                                           preference_value=log_stderr):
-            log.log_error(log_text=f'Row miss updating logger > log_stderr')
-
         ctk.set_appearance_mode(control_panel_mode)
         cbtk.CBtkMenu.update_widgets_mode()
         self.control_panel_mode = control_panel_mode